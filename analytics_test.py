@@ -0,0 +1,152 @@
+"""AttendanceAnalytics reports and DailyStats counters over a small fixture store (run with pytest)"""
+import csv
+import types
+from datetime import datetime
+
+import pytest
+
+import v3
+from v3 import AttendanceAnalytics, AttendanceStore, AttendanceUI, DailyStats, ReportExporter
+
+ROWS = [
+    ["Alice", "2025-03-03", "2025-03-03 09:00:00", "2025-03-03 17:00:00"],  # Mon, 8h
+    ["Bob", "2025-03-03", "2025-03-03 08:30:00", "2025-03-03 18:30:00"],  # Mon, 10h
+    ["Alice", "2025-03-04", "2025-03-04 09:45:00", "2025-03-04 19:15:00"],  # Tue, late, 9.5h
+    ["Bob", "2025-03-07", "2025-03-07 08:00:00", "2025-03-07 14:00:00"],  # Fri, 6h
+    ["Dave", "2025-03-08", "2025-03-08 10:00:00", "2025-03-08 12:00:00"],  # Sat
+    ["Carol", "2025-04-01", "2025-04-01 08:00:00", ""],  # Never checked out
+]
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def store(workdir):
+    with open("attendance.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(AttendanceStore.FIELDS)
+        writer.writerows(ROWS)
+    store = AttendanceStore()
+    store.open()
+    return store
+
+
+@pytest.fixture
+def analytics(store):
+    return AttendanceAnalytics(types.SimpleNamespace(store=store))
+
+
+def test_weekly_hours_are_the_recorded_hours(analytics):
+    weekly = analytics.weekly_hours()
+    assert weekly["Mon"] == {"avg": 9.0, "std": 1.0, "count": 2}
+    assert weekly["Tue"] == {"avg": 9.5, "std": 0.0, "count": 1}
+    assert weekly["Fri"] == {"avg": 6.0, "std": 0.0, "count": 1}  # Same every time, no made-up adjustment
+    assert weekly["Wed"] == {"avg": 0, "std": 0, "count": 0}
+    assert set(weekly) == set(AttendanceAnalytics.WORKDAYS)  # Weekend rows are left out
+
+
+def test_overtime_uses_full_timestamps(analytics):
+    overtime = analytics.overtime_slice()
+    assert overtime.rows(0, 10) == [("Alice", "2025-03-04", "1.5"), ("Bob", "2025-03-03", "2.0")]
+
+
+def test_user_summary(analytics):
+    assert analytics.user_summary("Alice") == {"present_days": 2, "avg_hours": 8.75, "late_days": 1}
+    assert analytics.user_summary("Carol") == {"present_days": 1, "avg_hours": 0, "late_days": 0}
+    assert analytics.average_hours("Nobody") == 0
+
+
+def test_report_slice_is_newest_first_within_the_range(analytics):
+    report = analytics.report_slice("2025-03-04", "2025-03-31")
+    assert len(report) == 3
+    assert [(date, name) for date, name, *_ in report.rows(0, 10)] == [
+        ("2025-03-08", "Dave"), ("2025-03-07", "Bob"), ("2025-03-04", "Alice")]
+    assert report.rows(2, 3)[0] == ("2025-03-04", "Alice", "2025-03-04 09:45:00", "2025-03-04 19:15:00", "9.5")
+    assert analytics.report_slice("2025-04-01", None).rows(0, 10)[0][4] == ""  # Open check-in
+    assert len(analytics.report_slice("2025-05-01", "2025-05-31")) == 0
+
+
+def test_reports_follow_appends(analytics, store):
+    assert len(analytics.user_slice("Bob")) == 2
+    store.append({"Name": "Bob", "Date": "2025-03-10", "Check-in": "2025-03-10 08:00:00",
+                  "Check-out": "2025-03-10 17:30:00"})
+    assert len(analytics.user_slice("Bob")) == 3
+    assert analytics.user_slice("Bob").rows(0, 1) == [
+        ("Bob", "2025-03-10", "2025-03-10 08:00:00", "2025-03-10 17:30:00")]
+    assert analytics.weekly_hours()["Mon"]["count"] == 3
+
+
+def test_daily_stats_rebuild_then_count_incrementally(store):
+    today = datetime.now().strftime("%Y-%m-%d")
+    for name, check_out in (("Alice", f"{today} 12:00:00"), ("Bob", ""), ("Carol", "")):
+        store.append({"Name": name, "Date": today, "Check-in": f"{today} 08:00:00", "Check-out": check_out})
+    stats = DailyStats()
+    stats.rebuild(store.iter_records())
+    assert stats.counts() == (3, 2)  # Fixture rows from other days don't count
+
+    stats.on_check_in("Bob")  # Already in
+    stats.on_check_out("Bob")
+    stats.on_check_out("Bob")  # Already out
+    stats.on_check_out("Dave")  # Never checked in
+    assert stats.counts() == (3, 1)
+    stats.on_check_in("Dave")
+    assert stats.counts() == (4, 2)
+    assert stats.user_status == {"Alice": "out", "Bob": "out", "Carol": "in", "Dave": "in"}
+
+
+class Entry:
+    def __init__(self, text):
+        self.text = text
+
+    def get(self):
+        return self.text
+
+
+class View:
+    result = None
+
+    def set_result(self, result):
+        self.result = result
+
+
+@pytest.mark.parametrize("start, end, rows", [
+    ("2025-03-04", " 2025-03-31 ", 3),
+    ("", "2025-03-03", 2),
+    ("04/2025", "", None),
+    ("2025-02-30", "", None),
+    ("2025-04-01", "2025-03-01", None),
+])
+def test_report_filter_validates_dates(analytics, monkeypatch, start, end, rows):
+    errors = []
+    monkeypatch.setattr(v3.messagebox, "showerror", lambda title, message: errors.append(message))
+    ui = object.__new__(AttendanceUI)
+    ui.attendance_system = types.SimpleNamespace(analytics=analytics)
+    ui.start_date, ui.end_date = Entry(start), Entry(end)
+    view = View()
+    ui.filter_attendance(view)
+    if rows is None:
+        assert view.result is None and len(errors) == 1  # Error shown, previous report kept
+    else:
+        assert len(view.result) == rows and not errors
+
+
+@pytest.mark.parametrize("start, end", [(None, None), ("2025-03-04", "2025-04-30")])
+def test_export_streams_partitions_without_loading_them(analytics, store, start, end):
+    expected = analytics.report_slice(start, end)
+    columns = ("Date", "Name", "Check-in", "Check-out", "Hours")
+    for key in ("2025-03", "2025-04"):
+        store.partitions.pop(key, None)  # Shards on disk, not read by any report yet
+
+    report = analytics.report_partitions(start, end)
+    assert len(report) >= len(expected)  # Manifest row counts
+    exporter = ReportExporter(report, columns, "report.csv", "csv", chunk_size=2).start()
+    exporter.thread.join(5)
+    assert exporter.state == "done" and exporter.progress == 1.0
+    assert "2025-03" not in store.partitions and "2025-04" not in store.partitions
+    with open("report.csv", newline="") as f:
+        exported = [tuple(row) for row in csv.reader(f)]
+    assert exported == [columns] + expected.rows(0, len(expected))
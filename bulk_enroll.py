@@ -0,0 +1,212 @@
+"""
+Bulk offline enrollment for KFCS Attendance Pro
+
+Reads a directory tree laid out as <root>/<person name>/*.jpg, encodes the
+faces in a process pool and writes the new identities into
+facial_recognition.dat in a single atomic write, as the next gallery
+version so running kiosks and gallery_delta.py see the change.
+
+Usage:
+    python bulk_enroll.py photos/ --workers 8 --report failures.csv
+"""
+import argparse
+import concurrent.futures
+import csv
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+MAX_IMAGE_SIDE = 1600  # Bigger photos are downscaled before detection
+
+
+def iter_images(root):
+    """Yield (name, path) lazily so huge trees never sit in memory"""
+    for entry in sorted(os.scandir(root), key=lambda e: e.name):
+        if not entry.is_dir():
+            continue
+        for dirpath, _, filenames in os.walk(entry.path):
+            for filename in sorted(filenames):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield entry.name, os.path.join(dirpath, filename)
+
+
+def encode_image(name, path, upsample=1):
+    """
+    Detect and encode the single face in one photo (runs in a worker process)
+    Returns:
+        (name, path, encoding or None, error message or None)
+    """
+    import cv2
+    import face_recognition
+
+    try:
+        image = cv2.imread(path)
+        if image is None:
+            return name, path, None, "Unreadable image"
+
+        longest = max(image.shape[:2])
+        if longest > MAX_IMAGE_SIDE:
+            scale = MAX_IMAGE_SIDE / float(longest)
+            image = cv2.resize(image, (0, 0), fx=scale, fy=scale)
+        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+        locations = face_recognition.face_locations(
+            rgb, number_of_times_to_upsample=upsample, model="hog")
+        if not locations:
+            return name, path, None, "No face found"
+        if len(locations) > 1:
+            return name, path, None, f"{len(locations)} faces found"
+
+        encodings = face_recognition.face_encodings(rgb, locations)
+        if not encodings:
+            return name, path, None, "Could not encode face"
+        return name, path, encodings[0], None
+    except Exception as e:
+        return name, path, None, str(e)
+
+
+def load_gallery(path):
+    if not os.path.exists(path):
+        return {"encodings": [], "names": []}
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def save_gallery(path, data):
+    """Write the gallery atomically so a crash never leaves a half-written file"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def run_pool(images, workers, upsample, on_result):
+    """Keep at most a few tasks per worker in flight to bound memory"""
+    max_pending = workers * 4
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for name, path in images:
+            pending.add(pool.submit(encode_image, name, path, upsample))
+            if len(pending) >= max_pending:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    on_result(*future.result())
+        for future in concurrent.futures.as_completed(pending):
+            on_result(*future.result())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Enroll users from a photo directory")
+    parser.add_argument("photo_dir", help="Directory containing one sub-directory per person")
+    parser.add_argument("--gallery", default="facial_recognition.dat")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--upsample", type=int, default=1)
+    parser.add_argument("--duplicate-distance", type=float, default=0.45,
+                        help="New identities closer than this to an existing one are skipped")
+    parser.add_argument("--update", action="store_true",
+                        help="Replace users that are already enrolled instead of skipping them")
+    parser.add_argument("--report", help="Write per-image failures to this CSV file")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.photo_dir):
+        parser.error(f"{args.photo_dir} is not a directory")
+
+    # Imported here, not at the top, so the worker processes don't load the app
+    from v3 import GallerySnapshot
+
+    gallery = load_gallery(args.gallery)
+    existing = set(gallery["names"])
+
+    # Running sums keep memory per person constant regardless of photo count
+    sums = {}
+    counts = {}
+    failed = [0]
+    processed = [0]
+    started = time.time()
+
+    # Failures go straight to the report so a huge tree can't pile them up in memory
+    report_file = open(args.report, "w", newline="") if args.report else None
+    report = csv.writer(report_file) if report_file else None
+    if report:
+        report.writerow(["Name", "Image", "Error"])
+
+    def on_result(name, path, encoding, error):
+        processed[0] += 1
+        if error:
+            failed[0] += 1
+            if report:
+                report.writerow([name, path, error])
+            print(f"  FAILED {path}: {error}")
+        else:
+            if name in sums:
+                sums[name] += encoding
+            else:
+                sums[name] = np.array(encoding, dtype=np.float64)
+            counts[name] = counts.get(name, 0) + 1
+        if processed[0] % 100 == 0:
+            rate = processed[0] / max(time.time() - started, 1e-6)
+            print(f"{processed[0]} images processed ({rate:.1f}/s)")
+
+    def images():
+        for name, path in iter_images(args.photo_dir):
+            if name in existing and not args.update:
+                continue
+            yield name, path
+
+    try:
+        run_pool(images(), max(1, args.workers), args.upsample, on_result)
+    finally:
+        if report_file:
+            report_file.close()
+
+    names = list(gallery["names"])
+    encodings = list(gallery["encodings"])
+    added, replaced, duplicates = [], [], []
+    for name in sorted(sums):
+        encoding = sums[name] / counts[name]
+
+        if name in existing:
+            keep = [i for i, n in enumerate(names) if n != name]
+            names = [names[i] for i in keep]
+            encodings = [encodings[i] for i in keep]
+            replaced.append(name)
+        elif encodings:
+            distances = np.linalg.norm(np.array(encodings) - encoding, axis=1)
+            closest = int(distances.argmin())
+            if distances[closest] < args.duplicate_distance:
+                duplicates.append((name, names[closest], float(distances[closest])))
+                continue
+            added.append(name)
+        else:
+            added.append(name)
+
+        names.append(name)
+        encodings.append(encoding)
+
+    if added or replaced:
+        # A new version (and so a new content hash) that deltas and kiosks can tell apart
+        snapshot = GallerySnapshot(names, encodings, gallery.get("version", 0) + 1)
+        gallery["names"] = list(snapshot.names)
+        gallery["encodings"] = list(snapshot.encodings.copy())
+        gallery["version"] = snapshot.version
+        save_gallery(args.gallery, gallery)
+        print(f"Gallery v{snapshot.version}, hash {snapshot.content_hash()[:12]}")
+
+    for name, match, distance in duplicates:
+        print(f"  SKIPPED {name}: looks like already enrolled {match} (distance {distance:.2f})")
+
+    print(f"Done in {time.time() - started:.1f}s: {processed[0]} images, "
+          f"{len(added)} added, {len(replaced)} updated, {len(duplicates)} duplicates, "
+          f"{failed[0]} failed images")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Offline threshold calibration report for KFCS Attendance Pro
+
+Builds genuine and impostor distance distributions from the gallery in
+facial_recognition.dat (plus matches users confirmed at the kiosk), prints
+FAR/FRR across thresholds and the per-user thresholds that would be used.
+
+Usage:
+    python calibrate.py                 # report only
+    python calibrate.py --write         # also store the thresholds in the gallery
+    python calibrate.py --csv curve.csv # save the FAR/FRR curve
+"""
+import argparse
+import csv
+import os
+import pickle
+import sys
+
+import numpy as np
+
+from v3 import ThresholdCalibrator
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report FAR/FRR and per-user thresholds")
+    parser.add_argument("--gallery", default="facial_recognition.dat")
+    parser.add_argument("--margin", type=float, default=None,
+                        help="Best vs second-best identity margin to store with --write")
+    parser.add_argument("--write", action="store_true", help="Save the thresholds into the gallery")
+    parser.add_argument("--csv", help="Write the FAR/FRR curve to this CSV file")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.gallery):
+        parser.error(f"{args.gallery} not found")
+    with open(args.gallery, "rb") as f:
+        gallery = pickle.load(f)
+
+    names = list(gallery["names"])
+    encodings = list(gallery["encodings"])
+    calibrator = ThresholdCalibrator()
+    calibrator.from_dict(gallery.get("calibration", {}))
+    if args.margin is not None:
+        calibrator.margin = args.margin
+
+    genuine, impostor, _ = calibrator.distributions(names, encodings)
+    print(f"{len(set(names))} identities, {len(names)} templates")
+    print(f"{genuine.size} genuine distances, {impostor.size} impostor distances")
+    if genuine.size:
+        print(f"  genuine:  median {np.median(genuine):.3f}  p95 {np.percentile(genuine, 95):.3f}")
+    if impostor.size:
+        print(f"  impostor: median {np.median(impostor):.3f}  p5  {np.percentile(impostor, 5):.3f}")
+
+    grid = np.round(np.arange(0.30, 0.81, 0.025), 3)
+    curve = ThresholdCalibrator.far_frr(genuine, impostor, grid)
+    print("\nthreshold      FAR      FRR")
+    for threshold, far, frr in curve:
+        print(f"   {threshold:.3f}  {far:7.2%}  {frr:7.2%}")
+
+    if genuine.size and impostor.size:
+        eer_threshold, far, frr = min(curve, key=lambda point: abs(point[1] - point[2]))
+        print(f"\nApproximate EER {(far + frr) / 2:.2%} at threshold {eer_threshold:.3f}")
+
+    thresholds = calibrator.calibrate(names, encodings)
+    pairs = calibrator.gallery_pairs(names, encodings)
+    print("\nPer-user thresholds:")
+    for name in sorted(thresholds):
+        samples = len(calibrator.genuine.get(name, []))
+        print(f"  {name:<30} {thresholds[name]:.3f}  ({len(pairs.get(name, []))} gallery pairs, "
+              f"{samples} confirmed matches)")
+    uncalibrated = len(set(names)) - len(thresholds)
+    if uncalibrated:
+        print(f"  {uncalibrated} users with fewer than {ThresholdCalibrator.MIN_GENUINE} genuine distances "
+              f"keep the global cutoff and min_confidence")
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["threshold", "far", "frr"])
+            writer.writerows(curve)
+
+    if args.write:
+        gallery["calibration"] = calibrator.to_dict()
+        tmp_path = args.gallery + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(gallery, f)
+        os.replace(tmp_path, args.gallery)
+        print(f"\nThresholds written to {args.gallery}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""ThresholdCalibrator: thresholds, margin test and concurrent use (run with pytest)"""
+import threading
+
+import numpy as np
+
+from v3 import AttendanceSystem, GallerySnapshot, ThresholdCalibrator
+
+
+def gallery(people=5, per_person=4, seed=0):
+    rng = np.random.default_rng(seed)
+    names, encodings = [], []
+    for i in range(people):
+        centre = rng.normal(scale=0.2, size=128)
+        for _ in range(per_person):
+            names.append(f"user-{i}")
+            encodings.append(centre + rng.normal(scale=0.01, size=128))
+    return names, np.array(encodings)
+
+
+def test_thresholds_stay_in_bounds_and_below_nearest_impostor():
+    names, encodings = gallery()
+    calibrator = ThresholdCalibrator()
+    thresholds = calibrator.calibrate(names, encodings)
+    _, _, nearest = calibrator.distributions(names, encodings, pairs=False)
+
+    assert set(thresholds) == set(names)
+    for name, threshold in thresholds.items():
+        assert ThresholdCalibrator.MIN_THRESHOLD <= threshold <= ThresholdCalibrator.MAX_THRESHOLD
+        assert threshold <= max(nearest[name] * ThresholdCalibrator.IMPOSTOR_FRACTION,
+                                ThresholdCalibrator.MIN_THRESHOLD)
+
+
+def test_distributions_match_brute_force():
+    names, encodings = gallery(people=3, per_person=2)
+    genuine, impostor, _ = ThresholdCalibrator().distributions(names, encodings)
+    same, different = [], []
+    for i in range(len(names)):
+        for j in range(i + 1, len(names)):
+            d = np.linalg.norm(encodings[i] - encodings[j])
+            (same if names[i] == names[j] else different).append(d)
+    np.testing.assert_allclose(np.sort(genuine), np.sort(same), atol=1e-6)
+    np.testing.assert_allclose(np.sort(impostor), np.sort(different), atol=1e-6)
+
+
+def test_accepted_samples_move_the_threshold():
+    names, encodings = gallery()
+    calibrator = ThresholdCalibrator()
+    for _ in range(10):
+        calibrator.observe("user-0", 0.3)
+        assert calibrator.accept("user-0")
+    assert not calibrator.accept("user-0")  # Nothing observed since
+    thresholds = calibrator.calibrate(names, encodings)
+    assert thresholds["user-0"] <= 0.3 + ThresholdCalibrator.GENUINE_SLACK + 1e-9
+    assert calibrator.calibrated_count(["user-0", "someone-new"]) == 1
+
+
+def test_calibrate_while_matches_are_accepted():
+    names, encodings = gallery(people=20, per_person=5)
+    calibrator = ThresholdCalibrator(max_genuine=5)
+    stop = threading.Event()
+    errors = []
+
+    def accept_forever():
+        i = 0
+        while not stop.is_set():
+            name = f"user-{i % 20}"
+            calibrator.observe(name, 0.3)
+            calibrator.accept(name)
+            i += 1
+
+    thread = threading.Thread(target=accept_forever)
+    thread.start()
+    try:
+        for _ in range(30):
+            try:
+                calibrator.calibrate(names, encodings)
+                calibrator.to_dict()
+            except RuntimeError as e:
+                errors.append(e)
+    finally:
+        stop.set()
+        thread.join()
+    assert not errors
+
+
+def test_only_identities_with_enough_genuine_distances_are_calibrated():
+    names, encodings = gallery(people=3, per_person=4)
+    names, encodings = names + ["single"], np.vstack([encodings, encodings[0] + 1.0])
+    thresholds = ThresholdCalibrator().calibrate(names, encodings)
+    assert set(thresholds) == {"user-0", "user-1", "user-2"}  # 6 gallery pairs each, "single" has none
+
+
+def test_confirmed_matches_alone_never_loosen_the_threshold():
+    calibrator = ThresholdCalibrator()
+    names, encodings = ["alice", "bob"], np.vstack([np.zeros(128), np.full(128, 0.1)])
+    for _ in range(ThresholdCalibrator.MIN_GENUINE):
+        calibrator.observe("alice", 0.4)
+        calibrator.accept("alice")
+    for _ in range(5):
+        thresholds = calibrator.calibrate(names, encodings)
+    assert thresholds["alice"] <= 0.4 + 1e-9
+    assert "bob" not in thresholds
+
+
+def test_uncalibrated_user_still_needs_min_confidence():
+    system = AttendanceSystem(load=False)
+    try:
+        alice, bob = np.zeros(128), np.full(128, 0.2)
+        system.gallery = GallerySnapshot(["alice", "bob"], [alice, bob])
+        system.calibration.calibrate(list(system.gallery.names), list(system.gallery.encodings))
+        assert system.calibration.thresholds == {}
+        query = alice.copy()
+        query[0] = 0.5  # Distance 0.5: under the 0.6 cutoff, confidence 0.44 < min_confidence
+        assert system.recognize_faces([query])[0][0] == "Unknown"
+        query[0] = 0.2
+        assert system.recognize_faces([query])[0][0] == "alice"
+    finally:
+        system.executor.shutdown(wait=True)
+        system.events.close()
@@ -0,0 +1,139 @@
+"""Camera hand-off: LatestSlot, BoxExtrapolator and CameraReader shutdown (run with pytest)"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from v3 import BoxExtrapolator, CameraReader, LatestSlot
+
+
+class FakeCapture:
+    """cv2.VideoCapture stand-in; read() can be held to mimic a stalled driver"""
+    def __init__(self):
+        self.gate = threading.Event()
+        self.gate.set()
+        self.released_on = None
+        self.reads = 0
+
+    def read(self):
+        self.gate.wait()
+        if self.released_on:
+            raise AssertionError("read after release")
+        self.reads += 1
+        time.sleep(0.005)
+        return True, np.zeros((4, 4, 3), dtype=np.uint8)
+
+    def release(self):
+        self.released_on = threading.current_thread()
+
+    def isOpened(self):
+        return not self.released_on
+
+
+def test_latest_slot_hands_out_only_the_newest():
+    slot = LatestSlot()
+    assert slot.take(timeout=0.01) is None
+    slot.put(1, "a")
+    slot.put(2, "b")
+    assert slot.take(timeout=0.01) == "b"
+    assert slot.overwritten == 1
+    assert slot.take(timeout=0.01) is None  # Nothing newer yet
+    assert slot.latest() == "b"
+
+
+def test_latest_slot_take_wakes_on_put():
+    slot = LatestSlot()
+    threading.Timer(0.05, slot.put, (1, "frame")).start()
+    assert slot.take(timeout=2) == "frame"
+
+
+def test_box_extrapolator_follows_velocity_and_caps_it():
+    boxes = BoxExtrapolator(max_frames=3)
+    boxes.update(1, 10, (100, 200, 200, 100))
+    assert boxes.predict(1, 12) == (100, 200, 200, 100)  # One detection: no velocity yet
+    boxes.update(1, 12, (104, 210, 204, 110))
+    assert boxes.predict(1, 13) == (106, 215, 206, 115)
+    assert boxes.predict(1, 100) == boxes.predict(1, 15)  # Never beyond max_frames
+    assert boxes.predict(1, 5) == (104, 210, 204, 110)  # Never backwards
+    boxes.update(1, 11, (0, 0, 0, 0))  # Older detection arriving late is ignored
+    assert boxes.predict(1, 12) == (104, 210, 204, 110)
+    boxes.prune(set())
+    assert boxes.tracks == {}
+
+
+def test_latest_slot_consumer_only_sees_newer_items():
+    slot = LatestSlot()
+    taken = []
+
+    def consume():
+        while True:
+            item = slot.take(timeout=0.5)
+            if item is None:
+                return
+            taken.append(item)
+            time.sleep(0.002)  # Slower than the producer
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    for seq in range(1, 201):
+        slot.put(seq, seq)
+    consumer.join(5)
+    assert taken == sorted(set(taken)) and taken[-1] == 200  # Never stale, never repeated
+    assert slot.overwritten == 200 - len(taken)
+
+
+def test_stale_result_is_moved_to_the_shown_frame():
+    boxes = BoxExtrapolator()
+    boxes.update(7, 10, (100, 200, 200, 100))
+    boxes.update(7, 14, (100, 220, 200, 120))  # Detector runs every 4 frames: 5 px per frame
+    # The display keeps re-feeding the same result until the next one lands
+    for shown in (15, 16, 17):
+        boxes.update(7, 14, (100, 220, 200, 120))
+        assert boxes.predict(7, shown) == (100, 220 + 5 * (shown - 14), 200, 120 + 5 * (shown - 14))
+    boxes.update(7, 18, (100, 240, 200, 140))
+    assert boxes.predict(7, 19) == (100, 245, 200, 145)
+
+
+def test_frames_are_shared_read_only():
+    cap = FakeCapture()
+    camera = CameraReader(cap)
+    seen = []
+    camera.listeners.append(lambda captured: seen.append(captured.frame))
+    camera.start()
+    try:
+        captured = camera.frames.take(timeout=2)
+    finally:
+        camera.stop()
+    with pytest.raises(ValueError):
+        captured.frame[0, 0] = 255
+    assert any(frame is captured.frame for frame in seen)
+
+
+def test_stop_releases_on_the_camera_thread():
+    cap = FakeCapture()
+    camera = CameraReader(cap)
+    camera.start()
+    camera.frames.take(timeout=2)
+    assert camera.stop()
+    assert cap.released_on is camera.thread
+
+
+def test_blocked_read_is_released_after_it_returns():
+    cap = FakeCapture()
+    camera = CameraReader(cap)
+    camera.start()
+    camera.frames.take(timeout=2)
+    cap.gate.clear()  # The next read() hangs, like an unplugged camera
+    time.sleep(0.05)
+    assert not camera.stop(timeout=0.1)
+    assert cap.released_on is None  # Not released under a blocked read
+    cap.gate.set()
+    camera.thread.join(2)
+    assert cap.released_on is camera.thread
+
+
+def test_stop_without_start_releases():
+    cap = FakeCapture()
+    assert CameraReader(cap).stop()
+    assert cap.released_on is threading.current_thread()
@@ -0,0 +1,2 @@
+# functionality_test.py and UI_test.py are runnable UI prototypes, not test modules
+collect_ignore = ["functionality_test.py", "UI_test.py"]
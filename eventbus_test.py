@@ -0,0 +1,98 @@
+"""EventBus backpressure policies and shutdown (run with pytest)"""
+import threading
+import time
+
+import pytest
+
+from v3 import AttendanceRecorded, EventBus, ReplicationClient
+
+
+def event(i):
+    return AttendanceRecorded(f"user-{i}", "Check-in", "2026-10-19", f"2026-10-19 08:{i:02d}:00")
+
+
+@pytest.fixture
+def bus():
+    bus = EventBus()
+    yield bus
+    bus.close(timeout=1)
+
+
+def blocked_subscriber(bus, policy, maxsize=2):
+    """A subscriber whose handler waits on a gate, so its queue fills up"""
+    gate = threading.Event()
+    seen = []
+
+    def handler(e):
+        gate.wait(5)
+        seen.append(e.name)
+
+    subscription = bus.subscribe("slow", (AttendanceRecorded,), handler, maxsize=maxsize, policy=policy)
+    return subscription, gate, seen
+
+
+def test_drop_oldest_keeps_latest(bus):
+    subscription, gate, seen = blocked_subscriber(bus, EventBus.DROP_OLDEST)
+    bus.publish(event(0))
+    time.sleep(0.1)  # The consumer is now stuck on event 0
+    for i in range(1, 6):
+        bus.publish(event(i))
+    gate.set()
+    assert bus.drain()
+    assert seen == ["user-0", "user-4", "user-5"]
+    assert subscription.dropped == 3
+
+
+def test_drop_newest_keeps_first(bus):
+    subscription, gate, seen = blocked_subscriber(bus, EventBus.DROP_NEWEST)
+    bus.publish(event(0))
+    time.sleep(0.1)
+    for i in range(1, 6):
+        bus.publish(event(i))
+    gate.set()
+    assert bus.drain()
+    assert seen == ["user-0", "user-1", "user-2"]
+    assert subscription.dropped == 3
+
+
+def test_block_makes_publisher_wait(bus):
+    subscription, gate, seen = blocked_subscriber(bus, EventBus.BLOCK, maxsize=1)
+    bus.publish(event(0))
+    time.sleep(0.1)
+    bus.publish(event(1))  # Fills the queue
+    published = threading.Event()
+    threading.Thread(target=lambda: (bus.publish(event(2)), published.set()), daemon=True).start()
+    assert not published.wait(0.2)
+    gate.set()
+    assert published.wait(2)
+    assert bus.drain()
+    assert seen == ["user-0", "user-1", "user-2"]
+    assert subscription.dropped == 0
+
+
+def test_slow_subscriber_does_not_hold_up_others(bus):
+    _, gate, _ = blocked_subscriber(bus, EventBus.DROP_OLDEST)
+    fast = []
+    fast_subscription = bus.subscribe("fast", (AttendanceRecorded,), lambda e: fast.append(e.name))
+    for i in range(3):
+        bus.publish(event(i))
+    assert bus.drain([fast_subscription], timeout=2)
+    assert len(fast) == 3
+    assert not bus.drain(timeout=0.1)  # The slow one is still stuck
+    gate.set()
+
+
+def test_close_drains_queued_replication_events(tmp_path, bus):
+    replication = ReplicationClient(None, "http://127.0.0.1:9", "kiosk-1", directory=str(tmp_path))
+    slow = threading.Event()
+
+    def handler(e):
+        slow.wait(0.2)  # A busy disk: the queue is not empty when the window closes
+        replication.on_event(e)
+
+    bus.subscribe("replication", (AttendanceRecorded,), handler, maxsize=100, policy=EventBus.BLOCK)
+    for i in range(5):
+        bus.publish(event(i))
+    bus.close()
+    with open(replication.outbox_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 5
@@ -0,0 +1,94 @@
+"""
+Gallery deltas for KFCS Attendance Pro
+
+Instead of copying facial_recognition.dat to every kiosk, make a delta
+between the previous and the new gallery and drop it into each kiosk's
+gallery_updates/ folder; running kiosks apply it in place.
+
+Usage:
+    python gallery_delta.py info facial_recognition.dat
+    python gallery_delta.py diff old.dat new.dat -o updates/0042.delta
+    python gallery_delta.py apply facial_recognition.dat updates/0042.delta
+"""
+import argparse
+import os
+import pickle
+import sys
+import time
+
+from v3 import GalleryDelta, GallerySnapshot
+
+
+def load_snapshot(path):
+    with open(path, "rb") as f:
+        data = pickle.load(f)
+    return data, GallerySnapshot(data["names"], data["encodings"], data.get("version", 0))
+
+
+def cmd_info(args):
+    _, snapshot = load_snapshot(args.gallery)
+    print(f"{args.gallery}: v{snapshot.version}, {len(set(snapshot.names))} identities, "
+          f"{len(snapshot)} templates, hash {snapshot.content_hash()}")
+
+
+def cmd_diff(args):
+    _, old = load_snapshot(args.old)
+    _, new = load_snapshot(args.new)
+    if new.version <= old.version:
+        # Galleries written by tools that don't track versions
+        new = GallerySnapshot(new.names, new.encodings, old.version + 1)
+    delta = GalleryDelta.between(old, new)
+    GalleryDelta.write(args.output, delta)
+    print(f"v{old.version} -> v{new.version}: {len(delta['added'])} added, "
+          f"{len(delta['updated'])} updated, {len(delta['removed'])} removed "
+          f"({os.path.getsize(args.output) / 1024:.1f} KB, full gallery "
+          f"{os.path.getsize(args.new) / 1024:.1f} KB)")
+
+
+def cmd_apply(args):
+    data, snapshot = load_snapshot(args.gallery)
+    delta = GalleryDelta.read(args.delta)
+    started = time.perf_counter()
+    try:
+        updated = snapshot.apply_delta(delta)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    data["names"] = list(updated.names)
+    data["encodings"] = list(updated.encodings.copy())
+    data["version"] = updated.version
+    output = args.output or args.gallery
+    tmp_path = output + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(data, f)
+    os.replace(tmp_path, output)
+    print(f"Applied v{snapshot.version} -> v{updated.version} in {elapsed_ms:.0f} ms, wrote {output}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Make and apply gallery deltas")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    info = commands.add_parser("info", help="Show a gallery's version and content hash")
+    info.add_argument("gallery")
+
+    diff = commands.add_parser("diff", help="Write the delta from OLD to NEW")
+    diff.add_argument("old")
+    diff.add_argument("new")
+    diff.add_argument("-o", "--output", required=True)
+
+    apply = commands.add_parser("apply", help="Apply a delta to a gallery file")
+    apply.add_argument("gallery")
+    apply.add_argument("delta")
+    apply.add_argument("-o", "--output", help="Write here instead of updating the gallery in place")
+
+    args = parser.parse_args(argv)
+    handler = {"info": cmd_info, "diff": cmd_diff, "apply": cmd_apply}[args.command]
+    return handler(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
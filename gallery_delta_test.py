@@ -0,0 +1,50 @@
+"""GalleryDelta diff/apply against GallerySnapshot (run with pytest)"""
+import numpy as np
+import pytest
+
+from v3 import GalleryDelta, GallerySnapshot
+
+
+def template(seed):
+    return np.random.default_rng(seed).normal(0, 0.1, 128)
+
+
+@pytest.fixture
+def old():
+    return GallerySnapshot(["Alice", "Alice", "Bob", "Carol"], [template(1), template(2), template(3), template(4)], 4)
+
+
+def test_content_hash_ignores_order(old):
+    shuffled = GallerySnapshot(["Carol", "Bob", "Alice", "Alice"], old.encodings[::-1], 9)
+    assert shuffled.content_hash() == old.content_hash()
+    assert old.with_user("Dave", template(5)).content_hash() != old.content_hash()
+
+
+def test_delta_round_trip(old, tmp_path):
+    new = old.without_user("Bob").without_user("Carol").with_user("Carol", template(6)).with_user("Dave", template(7))
+    delta = GalleryDelta.between(old, new)
+    assert sorted(delta["added"]) == ["Dave"]
+    assert sorted(delta["updated"]) == ["Carol"]
+    assert delta["removed"] == ["Bob"]
+
+    path = str(tmp_path / "v8.delta")
+    GalleryDelta.write(path, delta)
+    applied = old.apply_delta(GalleryDelta.read(path))
+    assert applied.version == new.version
+    assert applied.content_hash() == new.content_hash()
+    assert sorted(applied.names) == ["Alice", "Alice", "Carol", "Dave"]
+
+
+def test_delta_for_another_gallery_is_rejected(old):
+    new = old.with_user("Dave", template(7))
+    delta = GalleryDelta.between(old, new)
+    with pytest.raises(ValueError):
+        new.apply_delta(delta)  # Already applied
+    delta["target"]["hash"] = "0" * 64
+    with pytest.raises(ValueError):
+        old.apply_delta(delta)
+
+
+def test_unchanged_gallery_has_empty_delta(old):
+    delta = GalleryDelta.between(old, GallerySnapshot(old.names, old.encodings, old.version + 1))
+    assert delta["added"] == delta["updated"] == {} and delta["removed"] == []
@@ -0,0 +1,99 @@
+"""FrameGeometry box/landmark scaling and the shared encoding path (run with pytest)"""
+import types
+
+import cv2
+import numpy as np
+import pytest
+
+import v3
+from v3 import EnrollmentSession, FaceLandmarks, FrameGeometry
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+
+
+class Shape:
+    """dlib full_object_detection stand-in"""
+    def __init__(self, points):
+        self.points = [Point(x, y) for x, y in points]
+
+    def parts(self):
+        return self.points
+
+
+def small_frame(frame, factor):
+    return cv2.resize(frame, (0, 0), fx=factor, fy=factor)
+
+
+def test_boxes_scale_with_the_real_image_sizes():
+    frame = np.zeros((481, 641, 3), dtype=np.uint8)  # 0.3 doesn't divide these evenly
+    small = small_frame(frame, 0.3)
+    geometry = FrameGeometry(frame.shape, small.shape)
+    assert (geometry.scale_y, geometry.scale_x) == (481 / small.shape[0], 641 / small.shape[1])
+
+    box = (20, 90, 70, 40)
+    full = geometry.to_full(box)
+    assert full == tuple(int(round(v * s)) for v, s in zip(box, (geometry.scale_y, geometry.scale_x) * 2))
+    assert geometry.to_small(full) == box
+    assert geometry.to_full((-5, small.shape[1] + 9, small.shape[0] + 3, -1)) == (0, 641, 481, 0)
+
+
+def test_landmarks_scale_like_boxes():
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    small = small_frame(frame, 0.25)
+    geometry = FrameGeometry(frame.shape, small.shape)
+    points = [(50, 40), (44, 40), (30, 40), (36, 40), (40, 52)]  # 5-point model order, small coordinates
+    small_landmarks = FaceLandmarks(Shape(points))
+    full_landmarks = FaceLandmarks(Shape([(x * 4, y * 4) for x, y in points]))
+
+    mapped = geometry.to_full(small_landmarks.bounding_box())
+    assert all(abs(a - b) <= 4 for a, b in zip(mapped, full_landmarks.bounding_box()))
+    assert small_landmarks.as_dict()["nose_tip"] == [(40, 52)]
+
+
+def test_encoding_view_small_and_full():
+    frame = np.random.default_rng(0).integers(0, 255, size=(480, 640, 3), dtype=np.uint8)
+    small = small_frame(frame, 0.3)
+    rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+    geometry = FrameGeometry(frame.shape, small.shape)
+    boxes = [(10, 60, 60, 10)]
+
+    image, locations, to_full = geometry.encoding_view(frame, rgb_small, boxes, "small")
+    assert image is rgb_small and locations == boxes
+    assert to_full(boxes[0]) == geometry.to_full(boxes[0])
+
+    image, locations, to_full = geometry.encoding_view(frame, rgb_small, boxes, "full")
+    assert image.shape == frame.shape
+    np.testing.assert_array_equal(image[..., 0], frame[..., 2])  # RGB
+    assert locations == [geometry.to_full(boxes[0])]
+    assert to_full(locations[0]) == locations[0]
+
+
+@pytest.mark.parametrize("resolution", FrameGeometry.RESOLUTIONS)
+def test_enrollment_uses_the_shared_geometry(monkeypatch, resolution):
+    frame = np.random.default_rng(1).integers(0, 255, size=(480, 640, 3), dtype=np.uint8)
+    small_box = (20, 100, 100, 40)
+    monkeypatch.setattr(v3, "face_recognition", types.SimpleNamespace(
+        face_locations=lambda rgb, model="hog": [small_box]))
+    seen = []
+
+    def detect(rgb, location):
+        seen.append((rgb.shape, location))
+        return FaceLandmarks(Shape([(80, 50), (72, 50), (52, 50), (60, 50), (66, 66)]))
+
+    monkeypatch.setattr(FaceLandmarks, "detect", staticmethod(detect))
+    session = EnrollmentSession(None, "Alice", samples_needed=1, candidate_pool=1, timeout=2,
+                                encoding_resolution=resolution)
+    session.offer_frame(frame)
+    session._collect()
+
+    [(_, _, image, location)] = session.candidates
+    small_shape = (120, 160, 3)
+    geometry = FrameGeometry(frame.shape, small_shape)
+    assert seen[0] == (small_shape, small_box)  # Quality landmarks on the detection image
+    if resolution == "full":
+        assert image.shape == frame.shape and location == geometry.to_full(small_box)
+    else:
+        assert image.shape == small_shape and location == small_box
@@ -0,0 +1,121 @@
+"""
+Thin kiosk client for KFCS Attendance Pro
+
+Captures the webcam and draws results; detection, recognition and the
+attendance records live in kiosk_service.py. Needs only OpenCV and numpy.
+
+Keys: i = check in, o = check out, q = quit
+
+Usage:
+    python kiosk_client.py --service http://127.0.0.1:8780 --every 5
+"""
+import argparse
+import http.client
+import json
+import sys
+from urllib.parse import urlparse
+
+import cv2
+
+
+class ServiceConnection:
+    """One kept-alive HTTP connection to the kiosk service, reopened if it drops"""
+    def __init__(self, url, timeout=5):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self.connection = None
+
+    def post(self, path, body, content_type):
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request("POST", path, body, {"Content-Type": content_type})
+                response = self.connection.getresponse()
+                return json.loads(response.read())
+            except (http.client.HTTPException, OSError):
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+    def recognize(self, frame, quality=80):
+        ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            return []
+        return self.post("/recognize", jpeg.tobytes(), "image/jpeg")["frames"][0]
+
+    def record(self, token, action):
+        """token comes from the face in the last /recognize answer"""
+        payload = json.dumps({"token": token, "action": action}).encode("utf-8")
+        return self.post("/attendance", payload, "application/json")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Thin attendance kiosk")
+    parser.add_argument("--service", default="http://127.0.0.1:8780")
+    parser.add_argument("--camera", type=int, default=0)
+    parser.add_argument("--every", type=int, default=5, help="Send every Nth frame for recognition")
+    args = parser.parse_args(argv)
+
+    service = ServiceConnection(args.service)
+    cap = cv2.VideoCapture(args.camera)
+    if not cap.isOpened():
+        print(f"Error: could not open camera {args.camera}")
+        return 1
+
+    faces = []
+    message = ""
+    frame_counter = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame = cv2.flip(frame, 1)
+            frame_counter += 1
+
+            if frame_counter % args.every == 0:
+                try:
+                    faces = service.recognize(frame)
+                except Exception as e:
+                    faces = []
+                    message = f"Service error: {e}"
+
+            for face in faces:
+                top, right, bottom, left = face["location"]
+                color = (0, 200, 0) if face["name"] != "Unknown" else (0, 0, 255)
+                cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
+                cv2.putText(frame, f"{face['name']} {face['confidence']:.0%}", (left, top - 8),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+            if message:
+                cv2.putText(frame, message, (10, frame.shape[0] - 15),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+            cv2.imshow("KFCS Attendance", frame)
+
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord("q"):
+                break
+            if key in (ord("i"), ord("o")):
+                # The service only hands out tokens for live, sharp, recognized faces
+                verified = [face for face in faces if face.get("token")]
+                if not verified:
+                    message = "No verified face, look at the camera" if faces else "No recognized face"
+                    continue
+                best = max(verified, key=lambda face: face["confidence"])
+                action = "Check-in" if key == ord("i") else "Check-out"
+                try:
+                    result = service.record(best.pop("token"), action)  # Tokens are single-use
+                    message = f"{best['name']}: {result.get('message', result.get('error'))}"
+                except Exception as e:
+                    message = f"Service error: {e}"
+    finally:
+        cap.release()
+        cv2.destroyAllWindows()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+"""
+Recognition service for thin kiosk clients (KFCS Attendance Pro)
+
+Runs the detection / encoding / matching pipeline and the attendance store
+in one place so kiosks only need a camera and a screen (see
+kiosk_client.py). Requests from all clients go through one batcher: it
+waits a few milliseconds for more work and matches every face in the
+batch against the gallery with a single distance matrix.
+
+Attendance is only recorded against the server's own recognitions: a known
+face in a frame that passes the same quality gate and liveness check as
+the desktop app gets a short-lived, single-use token, and /attendance
+takes that token, never a name.
+
+Endpoints (HTTP/1.1 keep-alive, JSON):
+    POST /recognize   {"frames": [base64 JPEG, ...], "encodings": [base64 float32, ...]}
+                      (or a raw image/jpeg body for a single frame)
+                      -> {"frames": [[{"location": [t, r, b, l], "name": ..., "confidence": ...,
+                                       "is_live": bool, "quality": ..., "token": ... (if eligible)}, ...], ...],
+                          "encodings": [{"name": ..., "confidence": ...}, ...],
+                          "batched_requests": n}
+    POST /attendance  {"token": ..., "action": "Check-in" | "Check-out"}
+                      -> {"success": bool, "message": ..., "name": ...}  (403 for a missing or expired token)
+    GET  /health      -> {"ready": bool, "users": n}
+
+Usage:
+    python kiosk_service.py --port 8780 --max-batch 32 --max-wait-ms 10
+"""
+import argparse
+import base64
+import concurrent.futures
+import json
+import queue
+import secrets
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from v3 import AttendanceSystem, DetectionCascade, FaceLandmarks, FrameGeometry, Metrics, QualityGate
+
+
+class FramePipeline:
+    """Headless version of FaceProcessor's detection round: detect, landmark, gate, encode, liveness"""
+    def __init__(self, attendance_system, downscale_factor=0.3, detector_mode="balanced"):
+        self.attendance_system = attendance_system
+        self.downscale_factor = downscale_factor
+        self.metrics = Metrics()
+        self.detector = DetectionCascade(self.metrics, mode=detector_mode)
+        self.quality_gate = QualityGate(self.metrics)  # Only classify() is used: frames from many clients
+
+    def analyze_frame(self, frame):
+        """
+        Per face in a BGR frame: {"location", "encoding", "quality", "is_live", "eligible"}.
+        Faces the quality gate drops are left out, like in the desktop app; eligible
+        means good enough quality and live, i.e. allowed to record attendance.
+        """
+        small_frame = cv2.resize(frame, (0, 0), fx=self.downscale_factor, fy=self.downscale_factor)
+        rgb_small = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+        geometry = FrameGeometry(frame.shape, rgb_small.shape)
+        gray = None
+        faces = []
+        for location in self.detector.detect(rgb_small):
+            if gray is None:
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            full_location = geometry.to_full(location)
+            landmarks = FaceLandmarks.detect(rgb_small, location)
+            quality = self.quality_gate.scorer.score(gray, full_location, landmarks.as_dict())
+            decision = self.quality_gate.classify(full_location, quality)
+            self.metrics.incr(f"gate_{decision}")
+            if decision == QualityGate.DROP:
+                continue
+            is_live = bool(self.attendance_system.detect_liveness(
+                frame, full_location, geometry.to_full(landmarks.bounding_box())))
+            faces.append({
+                "location": full_location,
+                "encoding": landmarks.encode(rgb_small),
+                "quality": quality["score"],
+                "is_live": is_live,
+                "eligible": decision == QualityGate.ENCODE and is_live
+            })
+        return faces
+
+    def encode_frame(self, frame):
+        """[(full-size location, encoding)] for every face the quality gate keeps"""
+        return [(face["location"], face["encoding"]) for face in self.analyze_frame(frame)]
+
+    def warm_up(self):
+        """Load the dlib models before the first client waits on them"""
+        FaceLandmarks.warm_up()
+
+
+class AttendanceTokens:
+    """
+    Short-lived, single-use proof that this server recognized someone:
+    /recognize issues one per eligible known face, /attendance redeems it.
+    """
+    def __init__(self, ttl=15.0):
+        self.ttl = ttl  # Seconds between the recognition and the button press
+        self.tokens = {}  # {token: (name, expires at)}
+        self.lock = threading.Lock()
+
+    def issue(self, name):
+        token = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self.lock:
+            for expired in [t for t, (_, expires) in self.tokens.items() if expires < now]:
+                del self.tokens[expired]
+            self.tokens[token] = (name, now + self.ttl)
+        return token
+
+    def redeem(self, token):
+        """The recognized name, or None for an unknown, used or expired token"""
+        with self.lock:
+            entry = self.tokens.pop(token, None)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+
+class RecognitionRequest:
+    __slots__ = ("frames", "encodings", "future")
+
+    def __init__(self, frames, encodings):
+        self.frames = frames  # Decoded BGR images
+        self.encodings = encodings
+        self.future = concurrent.futures.Future()
+
+
+class RequestBatcher:
+    """
+    Single worker that drains requests from every client. It takes what is
+    queued, waits up to max_wait for more (until max_batch items), runs
+    detection per frame and then matches all faces of all requests at once.
+    """
+    def __init__(self, pipeline, tokens, max_batch=32, max_wait=0.01):
+        self.pipeline = pipeline
+        self.tokens = tokens
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, frames, encodings):
+        request = RecognitionRequest(frames, encodings)
+        self.requests.put(request)
+        return request.future
+
+    def stop(self):
+        self.running = False
+        self.requests.put(None)
+
+    def _collect(self):
+        first = self.requests.get()
+        if first is None:
+            return []
+        batch = [first]
+        size = len(first.frames) + len(first.encodings)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self.running = False
+                break
+            batch.append(request)
+            size += len(request.frames) + len(request.encodings)
+        return batch
+
+    def _run(self):
+        while self.running:
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                self._process(batch)
+            except Exception as e:
+                print(f"Batch error: {e}")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+    def _process(self, batch):
+        started = time.perf_counter()
+        # Detect and encode every frame, remembering where each face belongs
+        located = []  # Per request, per frame: [face dicts]
+        encodings = []
+        for request in batch:
+            per_frame = []
+            for frame in request.frames:
+                faces = self.pipeline.analyze_frame(frame)
+                per_frame.append(faces)
+                encodings.extend(face["encoding"] for face in faces)
+            located.append(per_frame)
+            encodings.extend(request.encodings)
+
+        matches = iter(self.pipeline.attendance_system.recognize_faces(encodings))
+        for request, per_frame in zip(batch, located):
+            frames = []
+            for analyzed in per_frame:
+                faces = []
+                for face in analyzed:
+                    name, confidence = next(matches)
+                    result = {"location": [int(v) for v in face["location"]], "name": name,
+                              "confidence": float(confidence), "is_live": face["is_live"],
+                              "quality": float(face["quality"])}
+                    if face["eligible"] and name != "Unknown":
+                        result["token"] = self.tokens.issue(name)
+                    faces.append(result)
+                frames.append(faces)
+            direct = []
+            for _ in request.encodings:
+                name, confidence = next(matches)
+                direct.append({"name": name, "confidence": float(confidence)})
+            request.future.set_result({"frames": frames, "encodings": direct, "batched_requests": len(batch)})
+        self.pipeline.metrics.observe("batch_ms", (time.perf_counter() - started) * 1000)
+        self.pipeline.metrics.observe("batch_requests", len(batch))
+
+
+class KioskServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Thin clients keep one connection open
+    batcher = None  # Set by make_server
+    attendance_system = None
+    tokens = None
+    timeout_seconds = 10
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def _decode_jpeg(data):
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("frame is not a decodable image")
+        return frame
+
+    def do_POST(self):
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path == "/recognize":
+                if self.headers.get("Content-Type", "").startswith("image/"):
+                    frames, encodings = [self._decode_jpeg(body)], []
+                else:
+                    payload = json.loads(body)
+                    frames = [self._decode_jpeg(base64.b64decode(f)) for f in payload.get("frames", [])]
+                    encodings = [np.frombuffer(base64.b64decode(e), dtype=np.float32).astype(np.float64)
+                                 for e in payload.get("encodings", [])]
+                future = self.batcher.submit(frames, encodings)
+                self._send_json(200, future.result(timeout=self.timeout_seconds))
+            elif self.path == "/attendance":
+                payload = json.loads(body)
+                if payload.get("action") not in ("Check-in", "Check-out"):
+                    raise ValueError("action must be Check-in or Check-out")
+                # Only a recent recognition by this server says who is at the kiosk, never the client
+                name = self.tokens.redeem(str(payload.get("token", "")))
+                if name is None:
+                    self._send_json(403, {"error": "attendance needs a fresh token from /recognize"})
+                    return
+                success, message = self.attendance_system.record_attendance(name, payload["action"])
+                self._send_json(200, {"success": success, "message": message, "name": name})
+            else:
+                self._send_json(404, {"error": "not found"})
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": "not found"})
+            return
+        self._send_json(200, {
+            "ready": self.attendance_system.ready.is_set(),
+            "users": len(set(self.attendance_system.known_face_names)),
+            "batching": self.batcher.pipeline.metrics.snapshot()
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host, port, attendance_system, batcher):
+    handler = type("BoundKioskServiceHandler", (KioskServiceHandler,),
+                   {"attendance_system": attendance_system, "batcher": batcher, "tokens": batcher.tokens})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recognition + attendance service for thin kiosks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8780)
+    parser.add_argument("--max-batch", type=int, default=32, help="Frames + encodings per batch")
+    parser.add_argument("--max-wait-ms", type=float, default=10, help="How long a batch waits for more requests")
+    parser.add_argument("--detector", default="balanced", choices=sorted(DetectionCascade.MODES))
+    parser.add_argument("--token-ttl", type=float, default=15, help="Seconds a recognition can be used to check in/out")
+    args = parser.parse_args(argv)
+
+    attendance_system = AttendanceSystem()
+    pipeline = FramePipeline(attendance_system, detector_mode=args.detector)
+    try:
+        pipeline.warm_up()
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+    tokens = AttendanceTokens(ttl=args.token_ttl)
+    batcher = RequestBatcher(pipeline, tokens, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000)
+
+    server = make_server(args.host, args.port, attendance_system, batcher)
+    print(f"Kiosk service for {len(set(attendance_system.known_face_names))} users "
+          f"listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.stop()
+        attendance_system.attendance_writer.shutdown(wait=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
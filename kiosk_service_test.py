@@ -0,0 +1,119 @@
+"""Kiosk service: attendance only against the server's own recognitions (run with pytest)"""
+import base64
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import cv2
+import numpy as np
+import pytest
+
+import kiosk_service
+from kiosk_service import AttendanceTokens, FramePipeline, RequestBatcher
+from v3 import AttendanceSystem, GallerySnapshot
+
+ALICE = np.full(128, 0.05)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def service(workdir, monkeypatch):
+    system = AttendanceSystem(load=False)
+    system.gallery = GallerySnapshot(["Alice"], [ALICE])
+    pipeline = FramePipeline(system)
+    faces = []  # What the (dlib-free) pipeline "sees" in the next frame
+    monkeypatch.setattr(pipeline, "analyze_frame", lambda frame: list(faces))
+    batcher = RequestBatcher(pipeline, AttendanceTokens(ttl=5))
+    httpd = kiosk_service.make_server("127.0.0.1", 0, system, batcher)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", faces, system
+    httpd.shutdown()
+    httpd.server_close()
+    batcher.stop()
+    system.executor.shutdown(wait=True)
+    system.events.close()
+
+
+def post(url, path, payload):
+    request = urllib.request.Request(url + path, json.dumps(payload).encode("utf-8"),
+                                     {"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def frame_payload():
+    ok, jpeg = cv2.imencode(".jpg", np.zeros((120, 160, 3), dtype=np.uint8))
+    return {"frames": [base64.b64encode(jpeg.tobytes()).decode("ascii")]}
+
+
+def face(eligible=True, is_live=True):
+    return {"location": (10, 60, 60, 10), "encoding": ALICE + 0.01, "quality": 0.9,
+            "is_live": is_live, "eligible": eligible}
+
+
+def test_tokens_are_single_use_and_expire():
+    tokens = AttendanceTokens(ttl=0.05)
+    token = tokens.issue("Alice")
+    assert tokens.redeem(token) == "Alice"
+    assert tokens.redeem(token) is None
+    stale = tokens.issue("Alice")
+    time.sleep(0.1)
+    assert tokens.redeem(stale) is None
+    tokens.issue("Bob")
+    assert stale not in tokens.tokens
+
+
+def test_attendance_needs_a_recognition_token(service):
+    url, faces, system = service
+    status, body = post(url, "/attendance", {"name": "Alice", "action": "Check-in"})
+    assert status == 403
+    assert len(system.attendance_log) == 0
+
+    faces.append(face())
+    status, body = post(url, "/recognize", frame_payload())
+    assert status == 200
+    recognized = body["frames"][0][0]
+    assert recognized["name"] == "Alice" and recognized["is_live"]
+
+    status, body = post(url, "/attendance", {"token": recognized["token"], "action": "Check-in"})
+    assert status == 200 and body["success"] and body["name"] == "Alice"
+    assert system.attendance_log[0]["Name"] == "Alice"
+
+    status, _ = post(url, "/attendance", {"token": recognized["token"], "action": "Check-out"})
+    assert status == 403
+
+
+def test_no_token_for_spoofed_blurry_or_unknown_faces(service):
+    url, faces, _ = service
+    faces.extend([face(eligible=False, is_live=False), face(eligible=False)])
+    stranger = face()
+    stranger["encoding"] = -ALICE
+    faces.append(stranger)
+    status, body = post(url, "/recognize", frame_payload())
+    assert status == 200
+    assert [f["name"] for f in body["frames"][0]] == ["Alice", "Alice", "Unknown"]
+    assert not any("token" in f for f in body["frames"][0])
+
+
+def test_raw_encodings_never_get_tokens(service):
+    url, _, _ = service
+    encoding = base64.b64encode((ALICE + 0.01).astype(np.float32).tobytes()).decode("ascii")
+    status, body = post(url, "/recognize", {"encodings": [encoding]})
+    assert status == 200
+    assert body["encodings"] == [{"name": "Alice", "confidence": body["encodings"][0]["confidence"]}]
+
+
+def test_bad_action_is_rejected(service):
+    url, _, _ = service
+    status, _ = post(url, "/attendance", {"token": "x", "action": "Lunch"})
+    assert status == 400
@@ -0,0 +1,32 @@
+"""Overlay label sprites: LRU cache and drawing (run with pytest)"""
+import numpy as np
+
+from v3 import LabelSpriteCache, OverlayRenderer
+
+GREEN = (0, 200, 0)
+
+
+def test_sprite_cache_hits_and_evicts_least_recently_used():
+    cache = LabelSpriteCache(max_entries=2)
+    alice = cache.get("Alice 91%", GREEN, 0.8)
+    cache.get("Bob 88%", GREEN, 0.8)
+    assert cache.get("Alice 91%", GREEN, 0.801) is alice  # Scale rounded into the same key
+    cache.get("Carol 75%", GREEN, 0.8)  # Evicts Bob, used longest ago
+    assert [key[0] for key in cache.sprites] == ["Alice 91%", "Carol 75%"]
+    assert (cache.hits, cache.misses) == (1, 3)
+    cache.get("Bob 88%", GREEN, 0.8)
+    assert cache.misses == 4
+
+
+def test_sprite_is_text_on_bar_colour():
+    image, baseline = LabelSpriteCache().get("Alice", GREEN, 0.8)
+    assert 0 < baseline < image.shape[0]
+    assert tuple(image[0, 0]) == GREEN
+    assert (image[:, :, 2] > 128).any()
+
+
+def test_draw_clips_labels_at_the_frame_edge():
+    frame = np.zeros((60, 80, 3), dtype=np.uint8)
+    OverlayRenderer().draw(frame, [((10, 120, 70, 40), "A very long name 99%", GREEN)])
+    assert tuple(frame[10, 40]) == GREEN
+    assert (frame[45:, 45:, 2] > 128).any()  # White text (the bar has no red) in the visible part
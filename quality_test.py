@@ -0,0 +1,113 @@
+"""FaceQualityScorer and QualityGate on synthetic face crops (run with pytest)"""
+import cv2
+import numpy as np
+import pytest
+
+from v3 import FaceQualityScorer, Metrics, QualityGate
+
+FACE = (100, 300, 300, 100)  # 200 px tall in a 480 px frame
+
+
+def checkerboard(size, square=10, low=0, high=255):
+    cells = (np.indices((size, size)) // square).sum(axis=0) % 2
+    return np.where(cells, high, low).astype(np.uint8)
+
+
+def frame_with(patch, location=FACE):
+    """BGR frame with the patch pasted over the face box"""
+    top, right, bottom, left = location
+    gray = np.full((480, 640), 128, dtype=np.uint8)
+    gray[top:bottom, left:right] = cv2.resize(patch, (right - left, bottom - top), interpolation=cv2.INTER_NEAREST)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def landmarks(nose_x, location=FACE):
+    """Eyes a fixed distance apart; the nose moves sideways as the head turns"""
+    top, right, bottom, left = location
+    width = right - left
+    eye_y = top + (bottom - top) // 3
+    return {"left_eye": [(left + width // 4, eye_y)], "right_eye": [(right - width // 4, eye_y)],
+            "nose_tip": [(left + int(nose_x * width), top + (bottom - top) // 2)]}
+
+
+SHARP = checkerboard(200)
+BLURRED = cv2.GaussianBlur(SHARP, (0, 0), 15)
+DARK = checkerboard(200, low=0, high=3)
+FRONTAL, TURNED, PROFILE = landmarks(0.5), landmarks(0.65), landmarks(0.72)
+
+
+@pytest.fixture
+def gate():
+    return QualityGate(Metrics())
+
+
+def gray(frame):
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+def test_pose_score_from_nose_position():
+    scorer = FaceQualityScorer()
+    assert scorer.pose_score(FRONTAL) == pytest.approx(1.0)
+    assert scorer.pose_score(TURNED) == pytest.approx(0.4)
+    assert scorer.pose_score(PROFILE) < 0.15
+    assert scorer.pose_score({"left_eye": [(1, 1)]}) == 0.5  # Incomplete landmarks are neutral
+
+
+def test_score_combines_saturated_terms():
+    scorer = FaceQualityScorer()
+    sharp = scorer.score(gray(frame_with(SHARP)), FACE, FRONTAL)
+    assert sharp["sharpness"] > 2 * scorer.min_sharpness
+    assert sharp["size"] == pytest.approx(200 / 480)
+    assert sharp["score"] == pytest.approx(1.0)
+    assert scorer.is_acceptable(sharp)
+
+    turned = scorer.score(gray(frame_with(SHARP)), FACE, TURNED)
+    assert turned["score"] == pytest.approx(turned["pose"])  # Only the pose term is below 1
+
+    small = (100, 160, 160, 100)  # 60 px: size term 0.125 / 0.3
+    tiny = scorer.score(gray(frame_with(SHARP, small)), small, landmarks(0.5, small))
+    assert tiny["score"] == pytest.approx((60 / 480) / (2 * scorer.min_face_fraction))
+    assert not scorer.is_acceptable(tiny)
+
+    for patch in (BLURRED, DARK):
+        poor = scorer.score(gray(frame_with(patch)), FACE, FRONTAL)
+        assert poor["sharpness"] < scorer.min_sharpness
+        assert poor["score"] < sharp["score"]
+        assert not scorer.is_acceptable(poor)
+
+
+def test_score_of_an_empty_crop():
+    quality = FaceQualityScorer().score(gray(frame_with(SHARP)), (500, 10, 600, 0))
+    assert quality == {"sharpness": 0.0, "size": 0.0, "pose": 0.0, "score": 0.0}
+
+
+@pytest.mark.parametrize("patch, location, face_landmarks, decision", [
+    (SHARP, FACE, FRONTAL, QualityGate.ENCODE),
+    (BLURRED, FACE, FRONTAL, QualityGate.DEFER),
+    (DARK, FACE, FRONTAL, QualityGate.DEFER),
+    (SHARP, FACE, TURNED, QualityGate.DEFER),
+    (SHARP, FACE, PROFILE, QualityGate.DROP),
+    (SHARP, (100, 130, 130, 100), landmarks(0.5, (100, 130, 130, 100)), QualityGate.DROP),  # 30 px face
+])
+def test_gate_decisions(gate, patch, location, face_landmarks, decision):
+    [(decided, quality)] = gate.evaluate(frame_with(patch, location), [location], [face_landmarks])
+    assert decided == decision
+    assert gate.metrics.snapshot()[f"gate_{decision}"] == 1
+    assert set(quality) == {"sharpness", "size", "pose", "score"}
+
+
+def test_deferred_face_is_encoded_after_max_defers(gate):
+    frame = frame_with(BLURRED)
+    rounds = [gate.evaluate(frame, [FACE], [FRONTAL])[0][0] for _ in range(gate.max_defers + 1)]
+    assert rounds == [QualityGate.DEFER] * gate.max_defers + [QualityGate.ENCODE]
+    assert gate.deferred == []
+
+
+def test_deferral_count_resets_when_the_face_leaves(gate):
+    frame = frame_with(BLURRED)
+    gate.evaluate(frame, [FACE], [FRONTAL])
+    gate.evaluate(frame, [FACE], [FRONTAL])
+    assert gate.deferred == [(FACE, 2)]
+    assert gate.evaluate(frame, [], []) == []
+    assert gate.evaluate(frame, [FACE], [FRONTAL])[0][0] == QualityGate.DEFER
+    assert gate.deferred == [(FACE, 1)]
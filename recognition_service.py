@@ -0,0 +1,322 @@
+"""
+Sharded face recognition service for KFCS Attendance Pro
+
+For galleries too big for one kiosk process: identities are partitioned
+across shard worker processes by a stable hash of the name, every query
+batch is fanned out to all shards at once, and each shard's top-k
+identities are merged into the global top-k. All templates of a person
+live on the same shard, so the merged list has one entry per identity and
+the runner-up needed for the margin test is always correct.
+
+Kiosks use it through recognition.json ({"url": "http://host:8770"}).
+The service starts from the gallery file's version; kiosks push every
+later change as a GalleryDelta to /update and only match remotely while
+the service reports the same version as their own gallery.
+
+Endpoints:
+    POST /match   {"encodings": [base64 float32, ...], "k": 2}
+                  -> {"matches": [[[name, distance], ...], ...]}
+    POST /update  GalleryDelta dict (see v3.GalleryDelta)
+                  -> {"version": n, "identities": n, "templates": n}
+                  (409 with the current "version" if the delta's base isn't it)
+    GET  /health  -> {"shards": n, "identities": n, "templates": n, "version": n}
+
+Usage:
+    python recognition_service.py --gallery facial_recognition.dat --shards 4
+    python recognition_service.py --synthetic 200000 --shards 8 --bench 64
+"""
+import argparse
+import base64
+import json
+import multiprocessing
+import pickle
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+def shard_of(name, shards):
+    """Stable across runs and machines, unlike hash()"""
+    return zlib.crc32(name.encode("utf-8")) % shards
+
+
+class ShardIndex:
+    """One shard's templates, grouped so each identity's rows are contiguous"""
+    def __init__(self, names, encodings):
+        labels, codes = np.unique(np.asarray(names, dtype=object).astype(str), return_inverse=True)
+        order = np.argsort(codes, kind="stable")
+        self.labels = labels
+        self.matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)[order]
+        self.squared = np.einsum("ij,ij->i", self.matrix, self.matrix)
+        self.starts = np.searchsorted(codes[order], np.arange(len(labels)))
+        self.templates = len(self.matrix)
+
+    def top_k(self, queries, k):
+        """For each query, the k closest identities as [(name, distance)]"""
+        if not self.templates:
+            return [[] for _ in queries]
+        gram = queries @ self.matrix.T
+        q_squared = np.einsum("ij,ij->i", queries, queries)
+        dists = np.sqrt(np.maximum(q_squared[:, None] + self.squared[None, :] - 2 * gram, 0))
+        per_identity = np.minimum.reduceat(dists, self.starts, axis=1)
+        k = min(k, per_identity.shape[1])
+        best = np.argpartition(per_identity, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(per_identity, best):
+            candidates = candidates[np.argsort(row[candidates])]
+            results.append([(str(self.labels[c]), float(row[c])) for c in candidates])
+        return results
+
+
+def replace_identities(names, encodings, upserts, removed):
+    """(names, encodings) without the removed identities and with upserts' templates replacing theirs"""
+    dropped = set(removed) | set(upserts)
+    keep = [i for i, name in enumerate(names) if name not in dropped]
+    names = [names[i] for i in keep]
+    encodings = [encodings[i] for i in keep]
+    for name, templates in upserts.items():
+        for template in templates:
+            names.append(name)
+            encodings.append(template)
+    return names, encodings
+
+
+def shard_worker(connection, names, encodings):
+    """Shard process: answer ("match", queries, k) and ("update", upserts, removed) until None arrives"""
+    names = list(names)
+    encodings = list(encodings)
+    index = ShardIndex(names, encodings)
+    connection.send(("ready", len(index.labels), index.templates))
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        try:
+            if message[0] == "update":
+                names, encodings = replace_identities(names, encodings, message[1], message[2])
+                index = ShardIndex(names, encodings)
+                connection.send(("ok", (len(index.labels), index.templates)))
+            else:
+                _, queries, k = message
+                connection.send(("ok", index.top_k(queries, k)))
+        except Exception as e:
+            connection.send(("error", str(e)))
+    connection.close()
+
+
+class VersionConflict(Exception):
+    """A gallery update made from a different version than the one being served"""
+
+
+class ShardedRecognizer:
+    """Coordinator for the shard processes (a localhost cluster)"""
+    def __init__(self, names, encodings, shards=4, version=0):
+        partitions = [([], []) for _ in range(shards)]
+        for name, encoding in zip(names, encodings):
+            part = partitions[shard_of(name, shards)]
+            part[0].append(name)
+            part[1].append(encoding)
+
+        self.connections = []
+        self.processes = []
+        for part_names, part_encodings in partitions:
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=shard_worker, args=(child, part_names, part_encodings), daemon=True)
+            process.start()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+        self.counts = []  # (identities, templates) per shard
+        for connection in self.connections:
+            _, identities, templates = connection.recv()
+            self.counts.append((identities, templates))
+        self.version = version  # Gallery version being served
+        self.lock = threading.Lock()  # One query batch or update in flight across the shards at a time
+
+    @property
+    def identities(self):
+        return sum(identities for identities, _ in self.counts)
+
+    @property
+    def templates(self):
+        return sum(templates for _, templates in self.counts)
+
+    def update(self, delta):
+        """Apply a GalleryDelta dict; raises VersionConflict if it wasn't made from the served version"""
+        decode = lambda templates: [np.frombuffer(base64.b64decode(t), dtype=np.float32) for t in templates]
+        upserts = {name: decode(templates) for section in ("updated", "added")
+                   for name, templates in delta[section].items()}
+        removed = list(delta["removed"])
+        target = int(delta["target"]["version"])
+
+        shards = len(self.connections)
+        per_shard = {}  # {shard: (upserts, removed)}
+        for name, templates in upserts.items():
+            per_shard.setdefault(shard_of(name, shards), ({}, []))[0][name] = templates
+        for name in removed:
+            per_shard.setdefault(shard_of(name, shards), ({}, []))[1].append(name)
+
+        with self.lock:
+            if self.version is None or int(delta["base"]["version"]) != self.version:
+                raise VersionConflict(f"delta is for v{delta['base']['version']}, serving v{self.version}")
+            self.version = None  # Unknown until every shard has applied its part
+            for shard, (shard_upserts, shard_removed) in per_shard.items():
+                self.connections[shard].send(("update", shard_upserts, shard_removed))
+            replies = {shard: self.connections[shard].recv() for shard in per_shard}
+            for shard, (status, payload) in replies.items():
+                if status != "ok":
+                    raise RuntimeError(f"shard failed: {payload}")
+                self.counts[shard] = payload
+            self.version = target
+
+    def match(self, queries, k=2):
+        """Global top-k identities per query, merged from every shard"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, 128)
+        with self.lock:
+            # Fan out first so the shards work in parallel, then gather
+            for connection in self.connections:
+                connection.send(("match", queries, k))
+            replies = [connection.recv() for connection in self.connections]
+        for status, payload in replies:
+            if status != "ok":
+                raise RuntimeError(f"shard failed: {payload}")
+
+        merged = []
+        for i in range(len(queries)):
+            candidates = [match for _, payload in replies for match in payload[i]]
+            candidates.sort(key=lambda match: match[1])
+            merged.append(candidates[:k])
+        return merged
+
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+
+
+class RecognitionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Kiosks keep one connection open
+    recognizer = None  # Set by make_server
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path not in ("/match", "/update"):
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if self.path == "/update":
+                self.recognizer.update(payload)
+                self._send_json(200, {"version": self.recognizer.version, "identities": self.recognizer.identities,
+                                      "templates": self.recognizer.templates})
+                return
+            queries = [np.frombuffer(base64.b64decode(e), dtype=np.float32) for e in payload["encodings"]]
+            matches = self.recognizer.match(queries, int(payload.get("k", 2))) if queries else []
+            self._send_json(200, {"matches": matches})
+        except VersionConflict as e:
+            self._send_json(409, {"error": str(e), "version": self.recognizer.version})
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+        except (RuntimeError, OSError, EOFError) as e:
+            # A shard process died or its pipe broke
+            self._send_json(500, {"error": f"shard unavailable: {e}"})
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": "not found"})
+            return
+        self._send_json(200, {
+            "shards": len(self.recognizer.processes),
+            "identities": self.recognizer.identities,
+            "templates": self.recognizer.templates,
+            "version": self.recognizer.version
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host, port, recognizer):
+    handler = type("BoundRecognitionHandler", (RecognitionHandler,), {"recognizer": recognizer})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def synthetic_gallery(count, seed=0):
+    """Random unit-scale templates for load testing without real faces"""
+    rng = np.random.default_rng(seed)
+    encodings = rng.normal(scale=0.09, size=(count, 128)).astype(np.float32)
+    return [f"employee-{i:06d}" for i in range(count)], encodings
+
+
+def benchmark(recognizer, names, encodings, batch):
+    """Query perturbed gallery templates and report latency and top-1 accuracy"""
+    rng = np.random.default_rng(1)
+    picks = rng.choice(len(names), size=batch, replace=False)
+    queries = encodings[picks] + rng.normal(scale=0.01, size=(batch, 128)).astype(np.float32)
+    recognizer.match(queries[:1])  # First call pays for page faults in the shards
+    started = time.perf_counter()
+    matches = recognizer.match(queries)
+    elapsed = time.perf_counter() - started
+    correct = sum(1 for pick, top in zip(picks, matches) if top and top[0][0] == names[pick])
+    print(f"{batch} queries against {recognizer.templates} templates in {elapsed * 1000:.0f} ms "
+          f"({elapsed * 1000 / batch:.2f} ms/query), top-1 {correct}/{batch}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sharded recognition service")
+    parser.add_argument("--gallery", default="facial_recognition.dat")
+    parser.add_argument("--synthetic", type=int, help="Serve N random identities instead of a gallery")
+    parser.add_argument("--shards", type=int, default=max(1, (multiprocessing.cpu_count() or 2) // 2))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8770)
+    parser.add_argument("--bench", type=int, help="Run one batch of N queries and exit")
+    args = parser.parse_args(argv)
+
+    version = 0
+    if args.synthetic:
+        names, encodings = synthetic_gallery(args.synthetic)
+    else:
+        with open(args.gallery, "rb") as f:
+            data = pickle.load(f)
+        names, encodings = list(data["names"]), np.asarray(data["encodings"], dtype=np.float32)
+        version = data.get("version", 0)
+
+    started = time.perf_counter()
+    recognizer = ShardedRecognizer(names, encodings, shards=max(1, args.shards), version=version)
+    print(f"Gallery v{version}: {recognizer.identities} identities / {recognizer.templates} templates on "
+          f"{len(recognizer.processes)} shards, ready in {time.perf_counter() - started:.1f}s")
+    try:
+        if args.bench:
+            benchmark(recognizer, names, np.asarray(encodings, dtype=np.float32), args.bench)
+            return 0
+        server = make_server(args.host, args.port, recognizer)
+        print(f"Recognition service listening on http://{args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    finally:
+        recognizer.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""Sharded recognition service and the kiosk's RemoteRecognizer (run with pytest)"""
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+import recognition_service
+from recognition_service import ShardedRecognizer, ShardIndex, VersionConflict, shard_of
+from v3 import AttendanceSystem, GalleryDelta, GallerySnapshot, RemoteRecognizer
+
+
+def brute_force(names, encodings, query, k):
+    best = {}
+    for name, encoding in zip(names, encodings):
+        d = float(np.linalg.norm(encoding - query))
+        best[name] = min(best.get(name, np.inf), d)
+    return sorted(best.items(), key=lambda item: item[1])[:k]
+
+
+def test_shard_of_is_stable():
+    assert shard_of("employee-000001", 8) == shard_of("employee-000001", 8)
+    assert {shard_of(f"employee-{i}", 4) for i in range(100)} == {0, 1, 2, 3}
+
+
+def test_shard_index_top_k_matches_brute_force():
+    names, encodings = recognition_service.synthetic_gallery(60)
+    names = names[:30] + names[:30]  # Two templates per identity
+    index = ShardIndex(names, encodings)
+    queries = encodings[:5] + 0.01
+    for query, result in zip(queries, index.top_k(queries, 3)):
+        expected = brute_force(names, encodings, query, 3)
+        assert [name for name, _ in result] == [name for name, _ in expected]
+        np.testing.assert_allclose([d for _, d in result], [d for _, d in expected], rtol=1e-4)
+
+
+@pytest.fixture(scope="module")
+def service():
+    names, encodings = recognition_service.synthetic_gallery(200)
+    recognizer = ShardedRecognizer(names, encodings, shards=3)
+    httpd = recognition_service.make_server("127.0.0.1", 0, recognizer)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd, names, encodings
+    httpd.shutdown()
+    httpd.server_close()
+    recognizer.close()
+
+
+def test_sharded_merge_matches_brute_force(service):
+    httpd, names, encodings = service
+    recognizer = httpd.RequestHandlerClass.recognizer
+    query = encodings[17] + 0.005
+    assert [name for name, _ in recognizer.match([query], k=4)[0]] == \
+        [name for name, _ in brute_force(names, encodings, query, 4)]
+
+
+def test_http_endpoints(service):
+    httpd, names, encodings = service
+    base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    with urllib.request.urlopen(base + "/health", timeout=5) as response:
+        assert json.loads(response.read()) == {"shards": 3, "identities": 200, "templates": 200, "version": 0}
+    request = urllib.request.Request(base + "/match", data=b'{"k": 2}', method="POST")
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(request, timeout=5)
+    assert error.value.code == 400
+
+
+def test_remote_recognizer_round_trip(service):
+    httpd, names, encodings = service
+    remote = RemoteRecognizer(f"http://127.0.0.1:{httpd.server_address[1]}")
+    matches = remote.match([encodings[3], encodings[150]])
+    assert [top[0][0] for top in matches] == [names[3], names[150]]
+    assert all(len(top) == 2 for top in matches)
+
+
+@pytest.mark.parametrize("config", ['{"k": 2}', '{"url": "host:8770"}', '{"url": "http://h:1", "k": 1}', "nope"])
+def test_invalid_recognition_config_is_ignored(tmp_path, monkeypatch, config):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / RemoteRecognizer.CONFIG_FILE).write_text(config)
+    assert RemoteRecognizer.from_config() is None
+
+
+def test_service_outage_falls_back_to_local_and_cools_down():
+    system = AttendanceSystem(load=False)
+    try:
+        alice = np.full(128, 0.05)
+        system.gallery = GallerySnapshot(["Alice", "Bob"], [alice, np.full(128, -0.05)])
+        system.remote_recognizer = RemoteRecognizer("http://127.0.0.1:9", timeout=0.5)
+        system.remote_recognizer.version = system.gallery.version  # Was in sync before the outage
+        calls = []
+        original = system.remote_recognizer.match
+
+        def counting_match(encodings):
+            calls.append(len(encodings))
+            return original(encodings)
+
+        system.remote_recognizer.match = counting_match
+        assert system.recognize_face(alice)[0] == "Alice"
+        started = time.perf_counter()
+        for _ in range(10):
+            assert system.recognize_face(alice)[0] == "Alice"
+        assert len(calls) == 1  # Skipped while cooling down
+        assert time.perf_counter() - started < 0.5
+        assert system.remote_recognizer.failures == 1
+        assert not system.remote_recognizer.available()
+
+        system.remote_recognizer.retry_at = 0  # Cool-down over: tried again, and backs off longer
+        system.recognize_face(alice)
+        assert len(calls) == 2
+        assert system.remote_recognizer.retry_at - time.monotonic() > RemoteRecognizer.MIN_COOLDOWN
+    finally:
+        system.events.close()
+
+
+@pytest.fixture
+def small_service():
+    names, encodings = recognition_service.synthetic_gallery(20)
+    recognizer = ShardedRecognizer(names, encodings, shards=2, version=5)
+    httpd = recognition_service.make_server("127.0.0.1", 0, recognizer)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd, recognizer, GallerySnapshot(names, encodings, 5)
+    httpd.shutdown()
+    httpd.server_close()
+    recognizer.close()
+
+
+def test_service_applies_gallery_deltas_in_version_order(small_service):
+    _, recognizer, gallery = small_service
+    carol = np.full(128, 0.3)
+    changed = gallery.with_user("Carol", carol).without_user("employee-000004")
+    recognizer.update(GalleryDelta.between(gallery, changed))
+    assert recognizer.version == changed.version
+    assert recognizer.identities == 20
+    assert recognizer.match([carol])[0][0][0] == "Carol"
+    assert all(name != "employee-000004" for name, _ in recognizer.match([gallery.encodings[4]], k=20)[0])
+    with pytest.raises(VersionConflict):
+        recognizer.update(GalleryDelta.between(gallery, changed))  # Already applied
+
+
+def test_kiosk_enrollment_reaches_the_service(small_service):
+    httpd, _, gallery = small_service
+    system = AttendanceSystem(load=False)
+    try:
+        system.gallery = gallery
+        remote = system.remote_recognizer = RemoteRecognizer(f"http://127.0.0.1:{httpd.server_address[1]}")
+        calls = []
+        original = remote.match
+        remote.match = lambda encodings: calls.append(1) or original(encodings)
+
+        carol = np.full(128, 0.3)
+        system.update_gallery(lambda g: g.with_user("Carol", carol), "add", "Carol", carol)
+        remote.updates.submit(lambda: None).result()  # Wait for the queued push
+        assert remote.version == system.gallery.version
+        assert system.recognize_face(carol)[0] == "Carol"
+        assert calls == [1]
+    finally:
+        system.remote_recognizer.close()
+        system.events.close()
+
+
+def test_out_of_date_service_is_not_used(small_service):
+    httpd, recognizer, gallery = small_service
+    system = AttendanceSystem(load=False)
+    try:
+        carol = np.full(128, 0.3)
+        system.gallery = gallery.with_user("Carol", carol)  # Enrolled while the service wasn't told
+        remote = system.remote_recognizer = RemoteRecognizer(f"http://127.0.0.1:{httpd.server_address[1]}")
+        assert system.recognize_face(carol)[0] == "Carol"  # Local match
+        assert remote.version == 5 and not remote.in_sync(system.gallery)
+
+        remote.push(system.gallery, system.gallery.with_user("Dave", -carol)).result()
+        assert remote.version == 5  # 409: the delta's base isn't what the service serves
+        assert recognizer.version == 5
+    finally:
+        system.remote_recognizer.close()
+        system.events.close()
@@ -0,0 +1,129 @@
+"""Session recording: retention, shutdown and read-only replay (run with pytest)"""
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+import pytest
+
+import kiosk_service
+import replay_session
+from v3 import AttendanceRecorded, AttendanceSystem, CapturedFrame, EventBus, SessionRecorder
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def bus():
+    bus = EventBus()
+    yield bus
+    bus.close(timeout=1)
+
+
+def fake_segment(directory, name, size, age_days):
+    paths = [os.path.join(directory, name + ".jsonl"), os.path.join(directory, name + ".avi")]
+    for path in paths:
+        with open(path, "wb") as f:
+            f.write(b"x" * (size // 2))
+        modified = time.time() - age_days * 86400
+        os.utime(path, (modified, modified))
+
+
+def remaining(directory):
+    return sorted({os.path.splitext(name)[0] for name in os.listdir(directory)})
+
+
+def test_retention_drops_old_segments_then_oldest_over_budget(workdir, bus):
+    os.makedirs("recordings")
+    fake_segment("recordings", "session-20261001-080000", 100, age_days=18)
+    fake_segment("recordings", "session-20261015-080000", 100, age_days=4)
+    fake_segment("recordings", "session-20261017-080000", 100, age_days=2)
+    fake_segment("recordings", "session-20261019-080000", 100, age_days=0)
+    recorder = SessionRecorder(bus, max_bytes=250, retention_days=14)
+    recorder.enforce_retention()
+    assert remaining("recordings") == ["session-20261017-080000", "session-20261019-080000"]
+
+
+def test_open_segment_is_never_deleted(workdir, bus):
+    os.makedirs("recordings")
+    fake_segment("recordings", "session-20261001-080000", 100, age_days=30)
+    recorder = SessionRecorder(bus, retention_days=14)
+    recorder.segment_name = "session-20261001-080000"
+    recorder.enforce_retention()
+    assert remaining("recordings") == ["session-20261001-080000"]
+
+
+def test_stop_keeps_events_published_just_before(workdir, bus):
+    recorder = SessionRecorder(bus, fps=100, scale=1.0, codec="MJPG")
+    recorder.start()
+    recorder.offer(CapturedFrame(1, time.perf_counter(), np.zeros((48, 64, 3), dtype=np.uint8)))
+    for i in range(20):
+        bus.publish(AttendanceRecorded(f"user-{i}", "Check-in", "2026-10-19", "2026-10-19 08:00:00"))
+    recorder.stop()
+    [index] = [name for name in os.listdir("recordings") if name.endswith(".jsonl")]
+    with open(os.path.join("recordings", index), encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [r["name"] for r in records if r["type"] == "event"] == [f"user-{i}" for i in range(20)]
+    assert not bus.has_subscribers(AttendanceRecorded)
+
+
+class FakePipeline:
+    def __init__(self, attendance_system, detector_mode="balanced"):
+        self.attendance_system = attendance_system
+        self.downscale_factor = 0.3
+
+    def warm_up(self):
+        pass
+
+    def encode_frame(self, frame):
+        return [((0, 10, 10, 0), np.full(128, 0.05))]
+
+
+def test_replay_only_reads_the_gallery(workdir, monkeypatch):
+    with open("facial_recognition.dat", "wb") as f:
+        pickle.dump({"names": ["Alice"], "encodings": [np.full(128, 0.05)], "version": 3}, f)
+    gallery_before = os.stat("facial_recognition.dat").st_mtime_ns
+    with open("sync.json", "w") as f:
+        json.dump({"server": "http://127.0.0.1:9", "site": "kiosk-1"}, f)
+    os.makedirs("gallery_updates")
+
+    recorder = SessionRecorder(EventBus(), fps=100, scale=1.0, codec="MJPG")
+    recorder.start()
+    recorder.offer(CapturedFrame(1, time.perf_counter(), np.zeros((48, 64, 3), dtype=np.uint8)))
+    recorder.stop()
+    recorder.events.close()
+
+    monkeypatch.setattr(kiosk_service, "FramePipeline", FakePipeline)
+    monkeypatch.setattr(AttendanceSystem, "start_services",
+                        lambda self: pytest.fail("replay must not start kiosk services"))
+    before = set(os.listdir("."))
+    assert replay_session.main(["replay", "--csv", "replay.csv"]) == 0
+    assert set(os.listdir(".")) - before == {"replay.csv"}
+    assert os.stat("facial_recognition.dat").st_mtime_ns == gallery_before
+    with open("replay.csv") as f:
+        assert "Alice" in f.read()
+
+
+def test_replay_reports_a_missing_gallery(workdir):
+    assert replay_session.main(["replay", "--gallery", "missing.dat"]) == 1
+    assert not os.path.exists("missing.dat")
+
+
+@pytest.mark.parametrize("config", ['{"fps": 0}', '{"scale": -1}', '{"scale": "half"}', '{"fps": true}',
+                                    '{"segment_seconds": null}', '{"codec": "H264"}', '[1]', "{broken"])
+def test_invalid_recording_config_turns_recording_off(workdir, bus, config):
+    (workdir / SessionRecorder.CONFIG_FILE).write_text(config)
+    assert SessionRecorder.from_config(bus) is None
+
+
+def test_recording_config(workdir, bus):
+    (workdir / SessionRecorder.CONFIG_FILE).write_text('{"fps": 2, "scale": 0.25, "max_gb": 0.5}')
+    recorder = SessionRecorder.from_config(bus)
+    assert (recorder.fps, recorder.scale, recorder.max_bytes) == (2, 0.25, 512 * 1024 ** 2)
+    (workdir / SessionRecorder.CONFIG_FILE).write_text('{"enabled": false, "fps": 0}')
+    assert SessionRecorder.from_config(bus) is None
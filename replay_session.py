@@ -0,0 +1,280 @@
+"""
+Session recordings for KFCS Attendance Pro
+
+Reads the segments SessionRecorder writes to recordings/ (turned on by
+recording.json): lists them, finds attendance events, saves the frames
+around an event as evidence, and re-runs recorded video through the
+recognition pipeline to reproduce bugs or benchmark a gallery, detector
+or threshold change against what the kiosk saw at the time.
+
+Usage:
+    python replay_session.py list
+    python replay_session.py events --name "Jane Doe" --date 2026-10-19
+    python replay_session.py evidence --name "Jane Doe" --date 2026-10-19 -o evidence/
+    python replay_session.py replay recordings/session-20261019-081500.jsonl --csv replay.csv
+
+replay only reads the gallery (and its calibration): it starts none of the
+kiosk's services and writes nothing but the optional CSV.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+
+class Segment:
+    """One recorded segment: its index header, frame lines and event lines"""
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.name = os.path.splitext(os.path.basename(index_path))[0]
+        self.header = {}
+        self.frames = []
+        self.events = []
+        with open(index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # Last line cut short by a crash
+                kind = record.get("type")
+                if kind == "segment":
+                    self.header = record
+                elif kind == "frame":
+                    self.frames.append(record)
+                elif kind == "event":
+                    self.events.append(record)
+        self.video_path = os.path.join(os.path.dirname(index_path), self.header.get("video", ""))
+        self.scale = self.header.get("scale", 1.0)
+
+    def read_frames(self, wanted=None):
+        """Yield (index record, BGR frame) in order; wanted limits it to these frame numbers"""
+        cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            print(f"Error: cannot read {self.video_path}")
+            return
+        last = max(wanted, default=-1) if wanted is not None else None
+        try:
+            for record in self.frames:
+                if last is not None and record["i"] > last:
+                    break
+                ret, frame = cap.read()
+                if not ret:
+                    break  # Video shorter than the index (recorder was killed)
+                if wanted is None or record["i"] in wanted:
+                    yield record, frame
+        finally:
+            cap.release()
+
+    def size(self):
+        paths = [self.index_path, self.video_path]
+        return sum(os.path.getsize(path) for path in paths if os.path.isfile(path))
+
+
+def load_segments(paths, directory):
+    if not paths:
+        paths = sorted(glob.glob(os.path.join(directory, "session-*.jsonl")))
+    return [Segment(path) for path in paths]
+
+
+def format_wall(wall):
+    return datetime.fromtimestamp(wall).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def nearest_frame(segment, wall):
+    if not segment.frames:
+        return None
+    return min(segment.frames, key=lambda record: abs(record["wall"] - wall))
+
+
+def attendance_events(segments, name=None, date=None, every_type=False):
+    """[(segment, event record)] in time order"""
+    found = []
+    for segment in segments:
+        for event in segment.events:
+            if not every_type and event["event"] != "AttendanceRecorded":
+                continue
+            if name and event.get("name") != name:
+                continue
+            if date and event.get("date", datetime.fromtimestamp(event["wall"]).strftime("%Y-%m-%d")) != date:
+                continue
+            found.append((segment, event))
+    found.sort(key=lambda item: item[1]["wall"])
+    return found
+
+
+def recorded_names(record):
+    return sorted(face["name"] for face in record["faces"] if face["stable"] and face["name"] != "Unknown")
+
+
+def cmd_list(args):
+    segments = load_segments(args.segments, args.directory)
+    total = 0
+    for segment in segments:
+        size = segment.size()
+        total += size
+        started = segment.header.get("started")
+        duration = segment.frames[-1]["wall"] - started if segment.frames and started else 0
+        attendance = sum(1 for event in segment.events if event["event"] == "AttendanceRecorded")
+        print(f"{segment.name}  {format_wall(started) if started else '?':19}  {duration:6.0f}s  "
+              f"{len(segment.frames):6d} frames  {attendance:3d} attendance  {size / 1024 ** 2:7.1f} MB")
+    print(f"{len(segments)} segments, {total / 1024 ** 2:.1f} MB")
+
+
+def cmd_events(args):
+    segments = load_segments(args.segments, args.directory)
+    for segment, event in attendance_events(segments, args.name, args.date, args.all):
+        frame = nearest_frame(segment, event["wall"])
+        where = f"{segment.name} frame {frame['i']}" if frame else segment.name
+        if event["event"] == "AttendanceRecorded":
+            detail = f"{event['name']} {event['action']} {event['date']} {event['time']}"
+        elif event["event"] == "IdentityResolved":
+            detail = f"track {event['track']} -> {event['name']} ({event['confidence']})"
+        else:
+            detail = f"gallery v{event['version']} {event['op']} {event['name'] or ''} ({event['source']})"
+        print(f"{format_wall(event['wall'])}  {event['event']:18}  {detail}  [{where}]")
+
+
+def cmd_evidence(args):
+    from v3 import OverlayRenderer
+
+    segments = load_segments(args.segments, args.directory)
+    events = attendance_events(segments, args.name, args.date)
+    if not events:
+        print("No matching attendance events")
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+    overlay = OverlayRenderer()
+    saved = 0
+    for _, event in events:
+        low, high = event["wall"] - args.window, event["wall"] + args.window
+        for segment in segments:
+            wanted = {record["i"] for record in segment.frames if low <= record["wall"] <= high}
+            if not wanted:
+                continue
+            for record, frame in segment.read_frames(wanted):
+                overlays = []
+                for face in record["faces"]:
+                    box = tuple(int(v * segment.scale) for v in face["box"])
+                    color = (0, 200, 0) if face["name"] != "Unknown" else (0, 0, 255)
+                    overlays.append((box, f"{face['name']} {face['confidence']:.0%}", color))
+                overlay.draw(frame, overlays, scale=max(segment.scale, 0.5))
+                cv2.putText(frame, format_wall(record["wall"]), (8, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                            (255, 255, 255), 1)
+                filename = (f"{event['name']}_{event['date']}_{event['action']}_{segment.name}_{record['i']:05d}.jpg"
+                            .replace(" ", "_").replace(":", ""))
+                cv2.imwrite(os.path.join(args.output, filename), frame)
+                saved += 1
+    print(f"Saved {saved} frames around {len(events)} events to {args.output}")
+    return 0
+
+
+def cmd_replay(args):
+    from v3 import AttendanceSystem
+
+    segments = load_segments(args.segments, args.directory)
+    # No load_data(): that would start replication, the gallery watcher and the remote recognizer
+    attendance_system = AttendanceSystem(load=False)
+    try:
+        attendance_system.read_gallery(args.gallery)
+    except Exception as e:
+        print(f"Error loading {args.gallery}: {e}")
+        attendance_system.events.close()
+        return 1
+    try:
+        return replay(args, segments, attendance_system)
+    finally:
+        attendance_system.events.close()
+        attendance_system.executor.shutdown(wait=False)
+        attendance_system.attendance_writer.shutdown(wait=False)
+
+
+def replay(args, segments, attendance_system):
+    from kiosk_service import FramePipeline
+
+    pipeline = FramePipeline(attendance_system, detector_mode=args.detector)
+    pipeline.warm_up()
+
+    timings = []
+    compared = agreed = 0
+    rows = []
+    for segment in segments:
+        # Detect at the same resolution as live: the recording is already downscaled
+        pipeline.downscale_factor = min(1.0, args.downscale / segment.scale)
+        for record, frame in segment.read_frames():
+            if record["i"] % args.every:
+                continue
+            started = time.perf_counter()
+            faces = pipeline.encode_frame(frame)
+            matches = attendance_system.recognize_faces([encoding for _, encoding in faces])
+            timings.append((time.perf_counter() - started) * 1000)
+
+            replayed = sorted(name for name, _ in matches if name != "Unknown")
+            recorded = recorded_names(record)
+            if record["result_seq"] is not None:
+                compared += 1
+                agreed += replayed == recorded
+            rows.append([segment.name, record["i"], record["seq"], format_wall(record["wall"]),
+                         ";".join(recorded), ";".join(replayed), len(faces), f"{timings[-1]:.1f}"])
+
+    if not timings:
+        print("No frames replayed")
+        return 1
+    timings = np.asarray(timings)
+    print(f"{len(timings)} frames from {len(segments)} segments: {timings.mean():.1f} ms/frame "
+          f"(p50 {np.percentile(timings, 50):.1f}, p95 {np.percentile(timings, 95):.1f}), "
+          f"{1000 / timings.mean():.1f} fps")
+    if compared:
+        # The kiosk shows tracker-fused names; replay matches each frame on its own
+        print(f"Same recognized names as recorded on {agreed}/{compared} frames ({agreed / compared:.0%})")
+    if args.csv:
+        import csv
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Segment", "Frame", "Seq", "Time", "Recorded", "Replayed", "Faces", "ms"])
+            writer.writerows(rows)
+        print(f"Wrote {len(rows)} rows to {args.csv}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and replay recorded kiosk sessions")
+    parser.add_argument("--directory", default="recordings")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    listing = commands.add_parser("list", help="Show recorded segments")
+    listing.add_argument("segments", nargs="*", help="Index files (default: every segment in --directory)")
+
+    events = commands.add_parser("events", help="Find attendance events in the recordings")
+    events.add_argument("segments", nargs="*")
+    events.add_argument("--name")
+    events.add_argument("--date", help="YYYY-MM-DD")
+    events.add_argument("--all", action="store_true", help="Include identity and gallery events")
+
+    evidence = commands.add_parser("evidence", help="Save the frames around matching attendance events")
+    evidence.add_argument("segments", nargs="*")
+    evidence.add_argument("--name")
+    evidence.add_argument("--date", help="YYYY-MM-DD")
+    evidence.add_argument("--window", type=float, default=3.0, help="Seconds before and after each event")
+    evidence.add_argument("-o", "--output", default="evidence")
+
+    replay = commands.add_parser("replay", help="Re-run recorded frames through recognition")
+    replay.add_argument("segments", nargs="*")
+    replay.add_argument("--every", type=int, default=1, help="Replay every Nth recorded frame")
+    replay.add_argument("--downscale", type=float, default=0.3, help="Live detection scale of the full frame")
+    replay.add_argument("--detector", default="balanced")
+    replay.add_argument("--gallery", default="facial_recognition.dat", help="Gallery to match against (read-only)")
+    replay.add_argument("--csv", help="Write per-frame results here")
+
+    args = parser.parse_args(argv)
+    handler = {"list": cmd_list, "events": cmd_events, "evidence": cmd_evidence, "replay": cmd_replay}[args.command]
+    return handler(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
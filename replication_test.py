@@ -0,0 +1,180 @@
+"""Kiosk -> sync server replication (run with pytest)"""
+import gzip
+import json
+import os
+import pickle
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+import sync_server
+from v3 import AttendanceRecorded, AttendanceSystem, GalleryUpdated, ReplicationClient
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def server(workdir):
+    httpd = sync_server.make_server("127.0.0.1", 0, str(workdir / "sync.db"))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def system(workdir):
+    system = AttendanceSystem(load=False)
+    yield system
+    system.executor.shutdown(wait=True)
+    system.events.close()
+
+
+def url(httpd):
+    return f"http://127.0.0.1:{httpd.server_address[1]}"
+
+
+def client(system, httpd, site, directory=None):
+    replication = ReplicationClient(system, url(httpd), site, directory=directory or f"sync-{site}")
+    os.makedirs(replication.directory, exist_ok=True)
+    return replication
+
+
+def get_json(httpd, path):
+    with urllib.request.urlopen(url(httpd) + path, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def write_config(config):
+    with open(ReplicationClient.CONFIG_FILE, "w") as f:
+        f.write(config if isinstance(config, str) else json.dumps(config))
+
+
+@pytest.mark.parametrize("config", [
+    {"server": "http://127.0.0.1:8765"},
+    {"site": "kiosk-1"},
+    {"server": "127.0.0.1:8765", "site": "kiosk-1"},
+    {"server": "http://127.0.0.1:8765", "site": "kiosk-1", "interval": 0},
+    "{not json",
+    "[]",
+])
+def test_invalid_config_turns_replication_off(workdir, config):
+    write_config(config)
+    assert ReplicationClient.from_config(None) is None
+
+
+def test_valid_config(workdir):
+    write_config({"server": "http://127.0.0.1:8765/", "site": "kiosk-1", "interval": 5})
+    replication = ReplicationClient.from_config(None)
+    assert (replication.server, replication.site, replication.interval) == ("http://127.0.0.1:8765", "kiosk-1", 5)
+
+
+def test_bad_sync_config_does_not_touch_the_gallery(workdir):
+    encodings = [np.full(128, 0.1), np.full(128, -0.1)]
+    with open("facial_recognition.dat", "wb") as f:
+        pickle.dump({"names": ["Alice", "Bob"], "encodings": encodings, "version": 4}, f)
+    write_config({"server": "http://127.0.0.1:8765"})
+
+    system = AttendanceSystem()
+    try:
+        assert system.replication is None
+        assert system.known_face_names == ("Alice", "Bob")
+        system.executor.shutdown(wait=True)
+        with open("facial_recognition.dat", "rb") as f:
+            assert pickle.load(f)["names"] == ["Alice", "Bob"]
+    finally:
+        system.events.close()
+
+
+def test_push_is_idempotent_and_merges_min_max(system, server):
+    first = client(system, server, "kiosk-1")
+    second = client(system, server, "kiosk-2")
+    first.on_event(AttendanceRecorded("Alice", "Check-in", "2026-10-19", "2026-10-19 08:10:00"))
+    first.on_event(AttendanceRecorded("Alice", "Check-out", "2026-10-19", "2026-10-19 16:00:00"))
+    second.on_event(AttendanceRecorded("Alice", "Check-in", "2026-10-19", "2026-10-19 08:02:00"))
+    second.on_event(AttendanceRecorded("Alice", "Check-out", "2026-10-19", "2026-10-19 17:30:00"))
+    second.sync_once()
+    first.sync_once()
+
+    # A batch resent after a lost response is ignored by the server
+    first.on_event(AttendanceRecorded("Alice", "Check-in", "2026-10-19", "2026-10-19 08:10:00"))
+    first.sync_once()
+
+    rows = get_json(server, "/attendance?since=0")["rows"]
+    assert rows == [["Alice", "2026-10-19", "2026-10-19 08:02:00", "2026-10-19 17:30:00"]]
+    assert server.RequestHandlerClass.database.conn.execute("SELECT COUNT(*) FROM events").fetchone()[0] == 4
+    # Everything acked: the outbox is compacted
+    assert os.path.getsize(first.outbox_path) == 0
+
+
+def test_outbox_survives_offline_and_restart(system, server, workdir):
+    offline = ReplicationClient(system, "http://127.0.0.1:9", "kiosk-1", directory="sync-kiosk-1", timeout=1)
+    os.makedirs(offline.directory, exist_ok=True)
+    offline.on_event(AttendanceRecorded("Bob", "Check-in", "2026-10-19", "2026-10-19 09:00:00"))
+    with pytest.raises((urllib.error.URLError, OSError)):
+        offline.sync_once()
+    assert offline.state["sent"] == 0
+
+    # Restarted kiosk, server reachable again: the same outbox is delivered
+    online = client(system, server, "kiosk-1")
+    online.start()
+    online.stop()
+    online.sync_once()
+    assert get_json(server, "/attendance?since=0")["rows"][0][:3] == ["Bob", "2026-10-19", "2026-10-19 09:00:00"]
+
+
+def test_gallery_changes_replicate_to_other_sites_only(system, server):
+    enrolling = client(system, server, "kiosk-1")
+    encoding = np.linspace(-0.1, 0.1, 128)
+    enrolling.on_event(GalleryUpdated(1, 1, "add", "Carol", encoding))
+    enrolling.on_event(GalleryUpdated(2, 1, "add", "Dave", encoding, source="replication"))  # Not sent back
+    enrolling.sync_once()
+    assert system.known_face_names == ()  # Its own change is not pulled back
+
+    other_system = AttendanceSystem(load=False)
+    try:
+        other = client(other_system, server, "kiosk-2")
+        other.sync_once()
+        assert other_system.known_face_names == ("Carol",)
+        np.testing.assert_allclose(other_system.known_face_encodings[0], encoding, atol=1e-6)
+        assert other.state["gallery_cursor"] == 1
+
+        enrolling.on_event(GalleryUpdated(3, 0, "remove", "Carol"))
+        enrolling.sync_once()
+        other.sync_once()
+        assert other_system.known_face_names == ()
+    finally:
+        other_system.executor.shutdown(wait=True)
+        other_system.events.close()
+
+
+def post(httpd, path, payload, compress=False):
+    body = json.dumps(payload).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if compress:
+        body = gzip.compress(body)
+        headers["Content-Encoding"] = "gzip"
+    request = urllib.request.Request(url(httpd) + path, data=body, headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_server_rejects_bad_requests(server):
+    assert post(server, "/events", {"events": []})[0] == 400
+    assert post(server, "/nowhere", {"site": "x"})[0] == 404
+    status, body = post(server, "/events", {"site": "x", "events": [
+        {"id": "1", "name": "Eve", "date": "2026-10-19", "field": "in", "time": "2026-10-19 09:00:00"},
+        {"id": "2", "name": "Eve", "date": "2026-10-19", "field": "lunch", "time": "2026-10-19 12:00:00"},
+    ]}, compress=True)
+    assert (status, body) == (200, {"accepted": 1})
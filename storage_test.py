@@ -0,0 +1,281 @@
+"""Attendance storage: legacy migration, shards and startup recovery (run with pytest)"""
+import csv
+import json
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import v3
+from v3 import AttendanceStore, AttendanceSystem
+
+
+def write_legacy(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Name", "Date", "Check-in", "Check-out"])
+        writer.writerows(rows)
+
+
+LEGACY_ROWS = [
+    ["Alice", "2025-03-03", "2025-03-03 09:00:00", "2025-03-03 17:00:00"],
+    ["Bob", "2025-03-04", "2025-03-04 08:30:00", ""],
+    ["Alice", "2025-04-01", "2025-04-01 09:10:00", "2025-04-01 16:00:00"],
+]
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def shard_rows(directory, key):
+    with open(os.path.join(directory, f"{key}.csv"), newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_migration_splits_legacy_file_into_monthly_shards(workdir):
+    write_legacy("attendance.csv", LEGACY_ROWS)
+    store = AttendanceStore()
+    store.open()
+
+    assert not os.path.exists("attendance.csv")
+    assert os.path.exists("attendance.csv.migrated")
+    with open(os.path.join("attendance", "manifest.json")) as f:
+        manifest = json.load(f)
+    assert sorted(manifest["partitions"]) == ["2025-03", "2025-04"]
+    assert manifest["partitions"]["2025-03"]["rows"] == 2
+    assert [row["Name"] for row in shard_rows("attendance", "2025-03")] == ["Alice", "Bob"]
+    assert shard_rows("attendance", "2025-04")[0]["Check-out"] == "2025-04-01 16:00:00"
+
+
+def test_failed_migration_keeps_legacy_file_and_resumes_without_duplicates(workdir, monkeypatch):
+    write_legacy("attendance.csv", LEGACY_ROWS)
+    original = AttendanceStore._write_partition
+    calls = []
+
+    def fail_second(self, key, records):
+        calls.append(key)
+        if len(calls) == 2:
+            raise OSError("disk full")
+        original(self, key, records)
+
+    monkeypatch.setattr(AttendanceStore, "_write_partition", fail_second)
+    with pytest.raises(OSError):
+        AttendanceStore().open()
+    assert os.path.exists("attendance.csv")
+    assert not os.path.exists(os.path.join("attendance", "manifest.json"))
+
+    monkeypatch.setattr(AttendanceStore, "_write_partition", original)
+    store = AttendanceStore()
+    store.open()
+    assert not os.path.exists("attendance.csv")
+    assert len(shard_rows("attendance", "2025-03")) == 2
+    assert len(shard_rows("attendance", "2025-04")) == 1
+    assert sorted(store.manifest["partitions"]) == ["2025-03", "2025-04"]
+
+
+def test_unreadable_manifest_is_rebuilt_from_shards(workdir):
+    write_legacy("attendance.csv", LEGACY_ROWS)
+    AttendanceStore().open()
+    with open(os.path.join("attendance", "manifest.json"), "w") as f:
+        f.write("{not json")
+
+    store = AttendanceStore()
+    store.open()
+    assert sorted(store.manifest["partitions"]) == ["2025-03", "2025-04"]
+    assert sum(1 for _ in store.iter_records()) == 3
+
+
+def make_gallery(names):
+    encodings = [np.full(128, i / 10.0) for i in range(len(names))]
+    with open("facial_recognition.dat", "wb") as f:
+        pickle.dump({"names": names, "encodings": encodings, "version": 3}, f)
+
+
+def test_attendance_failure_does_not_touch_the_gallery(workdir, monkeypatch):
+    make_gallery(["Alice", "Bob"])
+
+    def broken_open(self):
+        raise ValueError("time data '9am' does not match format")
+
+    monkeypatch.setattr(AttendanceStore, "open", broken_open)
+    system = AttendanceSystem()
+    try:
+        assert system.known_face_names == ("Alice", "Bob")
+        assert system.gallery.version == 3
+        assert system.ready.is_set()
+        system.executor.shutdown(wait=True)  # Calibration may re-save the gallery
+        with open("facial_recognition.dat", "rb") as f:
+            data = pickle.load(f)
+        assert data["names"] == ["Alice", "Bob"]
+        assert data["version"] == 3
+    finally:
+        system.events.close()
+
+
+def test_unreadable_gallery_is_set_aside_not_overwritten(workdir):
+    with open("facial_recognition.dat", "wb") as f:
+        f.write(b"not a pickle")
+    system = AttendanceSystem()
+    try:
+        assert len(system.gallery) == 0
+        backups = [name for name in os.listdir(".") if name.startswith("facial_recognition.dat.unreadable")]
+        assert len(backups) == 1
+        with open(backups[0], "rb") as f:
+            assert f.read() == b"not a pickle"
+    finally:
+        system.events.close()
+
+
+def test_columns_round_trip_rows():
+    rows = [
+        {"Name": "Alice", "Date": "2025-03-03", "Check-in": "2025-03-03 09:00:00", "Check-out": ""},
+        {"Name": "Bob", "Date": "2025-03-03", "Check-in": "08:15:00", "Check-out": "2025-03-03 17:45:10"},
+    ]
+    columns = v3.AttendanceColumns.from_rows(rows)
+    assert len(columns) == 2
+    assert columns[0].as_dict() == rows[0]
+    # Time-only values are placed on the record's day
+    assert columns[1]["Check-in"] == "2025-03-03 08:15:00"
+    assert columns.find("Bob", "2025-03-03") == 1
+    assert columns.find("Bob", "2025-03-04") is None
+
+    columns[0]["Check-out"] = "2025-03-03 18:00:00"
+    assert list(columns.rows())[0]["Check-out"] == "2025-03-03 18:00:00"
+
+
+def test_bad_row_leaves_columns_consistent():
+    columns = v3.AttendanceColumns()
+    with pytest.raises(ValueError):
+        columns.append({"Name": "Bob", "Date": "2025-04-11", "Check-in": "9am", "Check-out": ""})
+    assert (len(columns.user_ids), len(columns.days), len(columns.check_ins), len(columns.check_outs)) == (0, 0, 0, 0)
+
+    rejected = []
+    columns = v3.AttendanceColumns.from_rows([
+        {"Name": "Bob", "Date": "2025-04-11", "Check-in": "9am", "Check-out": ""},
+        {"Name": "Alice", "Date": "2025-04-11", "Check-in": "2025-04-11 09:00:00", "Check-out": ""},
+        {"Name": "Carol", "Date": "11/04/2025", "Check-in": "", "Check-out": ""},
+    ], rejected)
+    assert [record["Name"] for record in columns] == ["Alice"]
+    assert [row["Name"] for row, _ in rejected] == ["Bob", "Carol"]
+
+
+def test_malformed_legacy_row_is_quarantined_and_gallery_survives(workdir):
+    make_gallery(["Alice", "Bob"])
+    write_legacy("attendance.csv", LEGACY_ROWS + [["Bob", "2025-04-11", "9am", ""]])
+
+    system = AttendanceSystem()
+    try:
+        assert system.known_face_names == ("Alice", "Bob")
+        assert sum(1 for _ in system.store.iter_records()) == 3
+        assert os.path.exists("attendance.csv.migrated")
+        with open(os.path.join("attendance", "rejected.csv"), newline="") as f:
+            rejected = list(csv.DictReader(f))
+        assert [(row["Name"], row["Check-in"]) for row in rejected] == [("Bob", "9am")]
+    finally:
+        system.events.close()
+
+
+def test_unreadable_shard_rows_are_quarantined(workdir):
+    os.makedirs("attendance")
+    write_legacy(os.path.join("attendance", "2025-03.csv"), [
+        ["Alice", "2025-03-03", "2025-03-03 09:00:00", ""],
+        ["Bob", "2025-03-03", "half past eight", ""],
+    ])
+    store = AttendanceStore()
+    store.open()
+    assert [record["Name"] for record in store.records("2025-03")] == ["Alice"]
+    with open(os.path.join("attendance", "rejected.csv"), newline="") as f:
+        assert [row["Source"] for row in csv.DictReader(f)] == ["2025-03.csv"]
+
+
+def test_manifest_rebuild_ignores_rejected_rows_file(workdir):
+    write_legacy("attendance.csv", LEGACY_ROWS + [["Bob", "2025-04-11", "9am", ""]])
+    AttendanceStore().open()
+    os.remove(os.path.join("attendance", "manifest.json"))
+    with open(os.path.join("attendance", "manifest.json"), "w") as f:
+        f.write("")
+
+    store = AttendanceStore()
+    store.open()
+    assert sorted(store.manifest["partitions"]) == ["2025-03", "2025-04"]
+
+
+def test_concurrent_name_interning_gives_one_id_per_name():
+    names = [f"race-{i}" for i in range(300)]
+    ids = [{} for _ in range(8)]
+    start = threading.Barrier(8)
+
+    def intern(seen):
+        start.wait()
+        for name in names:
+            seen[name] = v3.AttendanceColumns.user_id(name)
+
+    threads = [threading.Thread(target=intern, args=(seen,)) for seen in ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(seen == ids[0] for seen in ids)
+    assert len(set(ids[0].values())) == len(names)
+    assert all(v3.AttendanceColumns.names[i] == name for name, i in ids[0].items())
+
+
+def test_lazy_load_does_not_replace_a_partition_being_appended_to(workdir, monkeypatch):
+    store = v3.AttendanceStore()
+    store.open()
+    with open(os.path.join("attendance", "2026-11.csv"), "w", newline="") as f:
+        f.write("Name,Date,Check-in,Check-out\n")
+    original = store._read_partition
+    loading = threading.Event()
+
+    def slow_read(key):
+        loading.set()
+        time.sleep(0.2)  # A report thread reading the shard at the month boundary
+        return original(key)
+
+    monkeypatch.setattr(store, "_read_partition", slow_read)
+    reader = threading.Thread(target=store.records, args=("2026-11",))
+    reader.start()
+    loading.wait(2)
+    store.append({"Name": "Alice", "Date": "2026-11-01", "Check-in": "2026-11-01 08:00:00", "Check-out": ""})
+    reader.join()
+    assert [r["Name"] for r in store.records("2026-11")] == ["Alice"]
+
+
+def test_daily_stats_roll_over_while_the_writer_counts():
+    stats = v3.DailyStats()
+    stats.on_check_in("Alice")
+    stats.on_check_in("Bob")
+    stats.on_check_out("Alice")
+    assert stats.counts() == (2, 1)
+    stats.date = "2000-01-01"  # Midnight passed
+    assert stats.counts() == (0, 0)
+
+    stop = threading.Event()
+    errors = []
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            stats.on_check_in(f"user-{i}")
+            stats.on_check_out(f"user-{i}")
+            i += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(2000):
+            stats.date = "2000-01-01"
+            checked_in, pending = stats.counts()
+            if not 0 <= pending <= 1 or pending > checked_in:
+                errors.append((checked_in, pending))
+    finally:
+        stop.set()
+        thread.join()
+    assert not errors
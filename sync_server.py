@@ -0,0 +1,251 @@
+"""
+Attendance sync server for KFCS Attendance Pro
+
+A small HTTP + SQLite process that kiosks replicate into. Every kiosk
+pushes its attendance events and gallery changes here in batches, and
+pulls the gallery changes made at other sites.
+
+Attendance events are idempotent (the event id is the primary key) and
+merge conflict-free per (user, date): the earliest check-in and the latest
+check-out win, whatever order the events arrive in.
+
+Endpoints (JSON bodies, optionally gzip-encoded):
+    POST /events             {"site": ..., "events": [...]}       -> {"accepted": n}
+    POST /gallery            {"site": ..., "deltas": [...]}       -> {"accepted": n}
+    GET  /gallery?since=N&exclude_site=S                          -> {"deltas": [...], "cursor": M}
+    GET  /attendance?since=N                                      -> {"rows": [...], "cursor": M}
+
+Usage:
+    python sync_server.py --port 8765 --db sync.db
+    python sync_server.py --db sync.db --export unified.csv
+"""
+import argparse
+import base64
+import csv
+import gzip
+import json
+import sqlite3
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MAX_PULL = 1000  # Rows per pull response; clients page with the returned cursor
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id TEXT PRIMARY KEY,
+    site TEXT NOT NULL,
+    name TEXT NOT NULL,
+    date TEXT NOT NULL,
+    field TEXT NOT NULL,
+    time TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attendance (
+    name TEXT NOT NULL,
+    date TEXT NOT NULL,
+    check_in TEXT NOT NULL DEFAULT '',
+    check_out TEXT NOT NULL DEFAULT '',
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (name, date)
+);
+CREATE INDEX IF NOT EXISTS attendance_seq ON attendance (seq);
+CREATE TABLE IF NOT EXISTS gallery (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE NOT NULL,
+    site TEXT NOT NULL,
+    op TEXT NOT NULL,
+    name TEXT NOT NULL,
+    encoding BLOB
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class SyncDatabase:
+    """SQLite state of the server; one connection guarded by a lock"""
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def _next_seq(self):
+        self.conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('attendance', 0)")
+        self.conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'attendance'")
+        return self.conn.execute("SELECT value FROM counters WHERE name = 'attendance'").fetchone()[0]
+
+    def add_events(self, site, events):
+        """Insert new events and fold them into the merged attendance rows"""
+        accepted = 0
+        with self.lock, self.conn:
+            for event in events:
+                if event["field"] not in ("in", "out"):
+                    continue
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO events (id, site, name, date, field, time) VALUES (?, ?, ?, ?, ?, ?)",
+                    (event["id"], site, event["name"], event["date"], event["field"], event["time"]))
+                if cursor.rowcount == 0:
+                    continue  # Already seen: a retried batch
+                accepted += 1
+
+                row = self.conn.execute(
+                    "SELECT check_in, check_out FROM attendance WHERE name = ? AND date = ?",
+                    (event["name"], event["date"])).fetchone()
+                check_in, check_out = row if row else ("", "")
+                # Min/max merge is order-independent, so kiosks never conflict
+                if event["field"] == "in":
+                    if check_in and check_in <= event["time"]:
+                        continue
+                    check_in = event["time"]
+                else:
+                    if check_out and check_out >= event["time"]:
+                        continue
+                    check_out = event["time"]
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO attendance (name, date, check_in, check_out, seq) VALUES (?, ?, ?, ?, ?)",
+                    (event["name"], event["date"], check_in, check_out, self._next_seq()))
+        return accepted
+
+    def add_gallery_deltas(self, site, deltas):
+        accepted = 0
+        with self.lock, self.conn:
+            for delta in deltas:
+                encoding = base64.b64decode(delta["encoding"]) if delta.get("encoding") else None
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO gallery (id, site, op, name, encoding) VALUES (?, ?, ?, ?, ?)",
+                    (delta["id"], site, delta["op"], delta["name"], encoding))
+                accepted += cursor.rowcount
+        return accepted
+
+    def gallery_since(self, since, exclude_site=None):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, id, site, op, name, encoding FROM gallery WHERE seq > ? AND site != ? ORDER BY seq LIMIT ?",
+                (since, exclude_site or "", MAX_PULL)).fetchall()
+            cursor = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM gallery").fetchone()[0]
+        deltas = [{
+            "id": delta_id,
+            "site": site,
+            "op": op,
+            "name": name,
+            "encoding": base64.b64encode(encoding).decode("ascii") if encoding else None
+        } for _, delta_id, site, op, name, encoding in rows]
+        # A full page means there is more: resume from its last row rather than the table end
+        if len(rows) == MAX_PULL:
+            cursor = rows[-1][0]
+        return deltas, cursor
+
+    def attendance_since(self, since):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT name, date, check_in, check_out, seq FROM attendance WHERE seq > ? ORDER BY seq LIMIT ?",
+                (since, MAX_PULL)).fetchall()
+        cursor = rows[-1][4] if rows else since
+        return [list(row[:4]) for row in rows], cursor
+
+    def export_csv(self, path):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT name, date, check_in, check_out FROM attendance ORDER BY date, name").fetchall()
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Name", "Date", "Check-in", "Check-out"])
+            writer.writerows(rows)
+        return len(rows)
+
+
+class SyncHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive between a kiosk's push and pull
+    database = None  # Set by make_server
+
+    def _read_json(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return json.loads(body)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        if "gzip" in self.headers.get("Accept-Encoding", "") and len(body) > 1024:
+            body = gzip.compress(body)
+            encoding = "gzip"
+        else:
+            encoding = None
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        try:
+            payload = self._read_json()
+            path = urlparse(self.path).path
+            if path == "/events":
+                accepted = self.database.add_events(payload["site"], payload["events"])
+            elif path == "/gallery":
+                accepted = self.database.add_gallery_deltas(payload["site"], payload["deltas"])
+            else:
+                self._send_json(404, {"error": "not found"})
+                return
+            self._send_json(200, {"accepted": accepted})
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+
+    def do_GET(self):
+        try:
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            since = int(query.get("since", ["0"])[0])
+            if url.path == "/gallery":
+                deltas, cursor = self.database.gallery_since(since, query.get("exclude_site", [None])[0])
+                self._send_json(200, {"deltas": deltas, "cursor": cursor})
+            elif url.path == "/attendance":
+                rows, cursor = self.database.attendance_since(since)
+                self._send_json(200, {"rows": rows, "cursor": cursor})
+            else:
+                self._send_json(404, {"error": "not found"})
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        pass  # Dozens of kiosks polling would flood the console
+
+
+def make_server(host, port, db_path):
+    handler = type("BoundSyncHandler", (SyncHandler,), {"database": SyncDatabase(db_path)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Attendance sync server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", default="sync.db")
+    parser.add_argument("--export", help="Write the unified attendance to this CSV file and exit")
+    args = parser.parse_args(argv)
+
+    if args.export:
+        count = SyncDatabase(args.db).export_csv(args.export)
+        print(f"Exported {count} attendance rows to {args.export}")
+        return 0
+
+    server = make_server(args.host, args.port, args.db)
+    print(f"Sync server listening on http://{args.host}:{args.port} ({args.db})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""IdentityTracker: track reuse, identity hysteresis and expiry (run with pytest)"""
+from v3 import IdentityTracker, QualityGate
+
+FACE = (100, 200, 200, 100)
+MOVED = (108, 212, 208, 112)  # Same face a frame later
+ELSEWHERE = (100, 500, 200, 400)
+
+
+def test_tracks_are_reused_across_frames():
+    tracker = IdentityTracker()
+    [first] = tracker.assign([FACE])
+    [again] = tracker.assign([MOVED])
+    assert again is first and again.location == MOVED
+    same, other = tracker.assign([MOVED, ELSEWHERE])
+    assert same is first and other.track_id != first.track_id
+    assert len(tracker.tracks) == 2
+
+
+def test_dropped_faces_get_no_track():
+    tracker = IdentityTracker()
+    decisions = [(QualityGate.DROP, {}), (QualityGate.ENCODE, {})]
+    dropped, kept = tracker.assign([FACE, ELSEWHERE], decisions)
+    assert dropped is None and kept.location == ELSEWHERE
+    assert tracker.tracks == [kept]
+
+
+def test_tracks_expire_after_max_missed_rounds():
+    tracker = IdentityTracker(max_missed=2)
+    [track] = tracker.assign([FACE])
+    tracker.assign([])
+    tracker.assign([])
+    assert tracker.tracks == [track]  # Survives a short occlusion
+    [back] = tracker.assign([MOVED])
+    assert back is track and back.missed == 0
+    for _ in range(3):
+        tracker.assign([])
+    assert tracker.tracks == []
+    [fresh] = tracker.assign([FACE])
+    assert fresh.track_id != track.track_id
+
+
+def test_identity_needs_evidence_to_acquire():
+    tracker = IdentityTracker()
+    [track] = tracker.assign([FACE])
+    tracker.observe(track, "Alice", 0.6)
+    assert track.stable_name is None and track.display_name == "Alice"
+    tracker.observe(track, "Alice", 0.6)
+    assert track.stable_name == "Alice"
+    assert abs(track.stable_confidence - 0.6) < 1e-9
+
+
+def test_unknown_never_becomes_the_stable_name():
+    tracker = IdentityTracker()
+    [track] = tracker.assign([FACE])
+    for _ in range(5):
+        tracker.observe(track, "Unknown", 0)
+    assert track.stable_name is None and track.display_name == "Unknown"
+
+
+def test_stable_name_resists_noise_then_switches_on_strong_evidence():
+    tracker = IdentityTracker()
+    [track] = tracker.assign([FACE])
+    tracker.observe(track, "Alice", 0.6)
+    tracker.observe(track, "Alice", 0.6)
+    tracker.observe(track, "Unknown", 0)
+    tracker.observe(track, "Bob", 0.9)
+    assert track.stable_name == "Alice"  # One noisy frame each can't flip it
+    assert track.last_name == "Bob" and track.display_name == "Alice"
+    tracker.observe(track, "Bob", 0.9)
+    assert track.stable_name == "Alice"  # Bob 1.8 is still below switch_score
+    tracker.observe(track, "Bob", 0.9)
+    assert track.stable_name == "Bob"
+    assert abs(track.stable_confidence - 0.9) < 1e-9
+
+
+def test_stable_tracks_skip_encoding_until_reverify():
+    tracker = IdentityTracker(reverify_every=2)
+    [track] = tracker.assign([FACE])
+    for _ in range(3):
+        assert tracker.should_encode(track)
+        tracker.observe(track, "Alice", 0.7)
+    assert [tracker.should_encode(track) for _ in range(3)] == [False, False, True]
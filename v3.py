@@ -1,3 +1,6 @@
+import time
+_PROCESS_START = time.perf_counter()  # Taken before the heavy imports so they show up in the timing report
+
 import tkinter as tk
 from tkinter import ttk, simpledialog, messagebox
 import tkinter.font as tkFont
@@ -5,33 +8,281 @@ from PIL import Image, ImageTk, ImageDraw
 import cv2
 import os
 import numpy as np
-import pandas as pd
 from datetime import datetime, timedelta
 import csv
-import face_recognition
+import importlib
 import pickle
 import threading
 import queue
-from collections import deque
+from collections import deque, OrderedDict
 import random
 import concurrent.futures
-import time
+import asyncio
 import hashlib 
 import ctypes
+import gzip
+import json
+import sys
+import base64
+import urllib.request
+import http.client
+from urllib.parse import urlparse
+from array import array
+
+
+class StartupTimer:
+    """
+    Records how long each startup phase and lazy import takes, measured from
+    process start. For a per-module breakdown run: python -X importtime v3.py
+    """
+    def __init__(self, origin):
+        self.origin = origin
+        self.phases = []  # [(name, started_at, duration)] in seconds since origin
+        self.lock = threading.Lock()
+
+    def record(self, name, started, duration):
+        with self.lock:
+            self.phases.append((name, started - self.origin, duration))
+
+    def mark(self, name):
+        """Record an instant (e.g. 'window shown') as a zero-length phase"""
+        self.record(name, time.perf_counter(), 0.0)
+
+    def phase(self, name):
+        timer = self
+
+        class _Phase:
+            def __enter__(self):
+                self.started = time.perf_counter()
+
+            def __exit__(self, *exc):
+                timer.record(name, self.started, time.perf_counter() - self.started)
+        return _Phase()
+
+    def report(self):
+        with self.lock:
+            phases = sorted(self.phases, key=lambda p: p[1])
+        lines = ["Startup timing (seconds since process start):"]
+        for name, started, duration in phases:
+            lines.append(f"  {started:7.3f}s  {name:<32} {duration * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+
+STARTUP_TIMER = StartupTimer(_PROCESS_START)
+STARTUP_TIMER.record("core imports", _PROCESS_START, time.perf_counter() - _PROCESS_START)
+
+
+class LazyModule:
+    """Stands in for a heavy module and imports it the first time it is used"""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    STARTUP_TIMER.record(f"import {self._name}", started,
+                                         time.perf_counter() - started)
+                    self._module = module
+        return self._module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+# dlib models load with face_recognition, pandas is only needed for reports
+face_recognition = LazyModule("face_recognition")
+pd = LazyModule("pandas")
+
+
+class GallerySnapshot:
+    """
+    Immutable view of the enrolled faces. Changes build a new snapshot that
+    replaces the old one in a single reference assignment, so a reader that
+    grabbed a snapshot always sees names and encodings that belong together.
+    Each snapshot has a version and a content hash, which GalleryDelta uses
+    to check that a delta is applied to the gallery it was made from.
+    """
+    __slots__ = ("names", "encodings", "name_array", "version", "_hash")
+
+    def __init__(self, names=(), encodings=(), version=0):
+        self.names = tuple(names)
+        if self.names:
+            self.encodings = np.array(encodings, dtype=np.float64)
+        else:
+            self.encodings = np.empty((0, 128), dtype=np.float64)
+        self.name_array = np.array(self.names, dtype=object)
+        self.encodings.setflags(write=False)
+        self.name_array.setflags(write=False)
+        self.version = version
+        self._hash = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def with_user(self, name, encoding):
+        return GallerySnapshot(self.names + (name,), list(self.encodings) + [encoding], self.version + 1)
+
+    def without_user(self, name):
+        keep = [i for i, n in enumerate(self.names) if n != name]
+        return GallerySnapshot([self.names[i] for i in keep], self.encodings[keep], self.version + 1)
+
+    def identities(self):
+        """{name: sorted float32 encoding bytes}, the unit deltas add, update and remove"""
+        identities = {}
+        for name, encoding in zip(self.names, self.encodings.astype(np.float32)):
+            identities.setdefault(name, []).append(encoding.tobytes())
+        for templates in identities.values():
+            templates.sort()
+        return identities
+
+    def content_hash(self):
+        """Order-independent sha256 of the gallery at float32 precision (what deltas carry)"""
+        if self._hash is None:
+            digest = hashlib.sha256()
+            for name, templates in sorted(self.identities().items()):
+                for template in templates:
+                    digest.update(name.encode("utf-8") + b"\0" + template)
+            self._hash = digest.hexdigest()
+        return self._hash
+
+    def apply_delta(self, delta):
+        """New snapshot with a GalleryDelta applied; raises ValueError if it was made from another gallery"""
+        if delta["base"]["hash"] != self.content_hash():
+            raise ValueError(f"delta is for gallery v{delta['base']['version']}, "
+                             f"this is v{self.version} with different contents")
+        replaced = set(delta["removed"]) | set(delta["updated"]) | set(delta["added"])
+        keep = [i for i, n in enumerate(self.names) if n not in replaced]
+        names = [self.names[i] for i in keep]
+        encodings = list(self.encodings[keep])
+        for section in ("updated", "added"):
+            for name, templates in delta[section].items():
+                for template in templates:
+                    names.append(name)
+                    encodings.append(np.frombuffer(base64.b64decode(template), dtype=np.float32))
+        snapshot = GallerySnapshot(names, encodings, delta["target"]["version"])
+        if snapshot.content_hash() != delta["target"]["hash"]:
+            raise ValueError("gallery hash after applying the delta doesn't match its target")
+        return snapshot
+
+
+class GalleryDelta:
+    """
+    Compact gzip'd JSON description of how one gallery version differs from
+    another: identities added, updated (templates changed) and removed,
+    with float32 encodings. Both ends are identified by content hash.
+    """
+    FORMAT = 1
+    EXTENSION = ".delta"
+
+    @staticmethod
+    def between(old, new):
+        before = old.identities()
+        after = new.identities()
+        encode = lambda templates: [base64.b64encode(t).decode("ascii") for t in templates]
+        return {
+            "format": GalleryDelta.FORMAT,
+            "base": {"version": old.version, "hash": old.content_hash()},
+            "target": {"version": new.version, "hash": new.content_hash()},
+            "added": {name: encode(t) for name, t in after.items() if name not in before},
+            "updated": {name: encode(t) for name, t in after.items() if name in before and before[name] != t},
+            "removed": sorted(name for name in before if name not in after)
+        }
+
+    @staticmethod
+    def write(path, delta):
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(delta, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def read(path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            delta = json.load(f)
+        if delta.get("format") != GalleryDelta.FORMAT:
+            raise ValueError(f"unsupported delta format {delta.get('format')}")
+        return delta
+
+
+class GalleryUpdateWatcher:
+    """
+    Applies *.delta files dropped into gallery_updates/ to the live gallery,
+    oldest first, without a restart. Applied files move to applied/, ones
+    that don't fit this gallery to rejected/.
+    """
+    DIRECTORY = "gallery_updates"
+
+    def __init__(self, attendance_system, directory=None, interval=10):
+        self.attendance_system = attendance_system
+        self.directory = directory or self.DIRECTORY
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def poll(self):
+        pending = sorted(f for f in os.listdir(self.directory) if f.endswith(GalleryDelta.EXTENSION))
+        for filename in pending:
+            path = os.path.join(self.directory, filename)
+            success, message = self.attendance_system.apply_gallery_delta(path)
+            print(f"Gallery update {filename}: {message}")
+            target = os.path.join(self.directory, "applied" if success else "rejected")
+            os.makedirs(target, exist_ok=True)
+            os.replace(path, os.path.join(target, filename))
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Gallery update error: {e}")
+            self.stop_event.wait(self.interval)
 
 
 class AttendanceSystem:
-    def __init__(self):
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.attendance_log = []
+    """
+    Concurrency model:
+    - The gallery is a GallerySnapshot. Writers (enrollment, removal) build
+      a new one under gallery_lock and swap the reference; the recognition
+      thread reads self.gallery once per match and never locks.
+    - Attendance has a single writer: every check-in/check-out and shard save
+      runs on attendance_writer, so partitions are never mutated concurrently.
+      Readers see whole records only (see AttendanceColumns.__len__).
+    """
+    def __init__(self, load=True):
+        self.gallery = GallerySnapshot()
+        self.gallery_lock = threading.Lock()  # Serializes gallery writers and saves, never taken by readers
+        self.attendance_writer = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.store = AttendanceStore()  # Monthly attendance shards, only the current one is loaded eagerly
+        self.calibration = ThresholdCalibrator()  # Per-user match thresholds, saved with the gallery
         self.anti_spoofing_threshold = 0.3  # Threshold to indicate that a user is real. 
         self.min_confidence = 0.6  # Minimum confidence for recognition
         self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
         self.liveness_cache = {}  # {name: timestamp}
         self.liveness_timeout = 10000  # seconds between liveness checks per person
         self.admin_password = self.hash_password("admin123")  # NEW: Default admin password
-        self.load_data()
+        self.analytics = AttendanceAnalytics(self)
+        self.daily_stats = DailyStats()
+        self.ready = threading.Event()  # Set once gallery and attendance are loaded
+        self.replication = None  # ReplicationClient when sync.json configures a sync server
+        self.gallery_updates = None  # GalleryUpdateWatcher when gallery_updates/ exists
+        self.remote_recognizer = None  # RemoteRecognizer when recognition.json points at a service
+        self.events = EventBus()  # AttendanceRecorded / GalleryUpdated go out here
+        if load:
+            self.load_data()
         
     # NEW PASSWORD METHODS ============================================
     def hash_password(self, password):
@@ -49,36 +300,97 @@ class AttendanceSystem:
             return True
         return False
 
+    @property
+    def known_face_names(self):
+        return self.gallery.names
+
+    @property
+    def known_face_encodings(self):
+        return self.gallery.encodings
+
+    @property
+    def attendance_log(self):
+        """Records of the current partition (today's records always live here)"""
+        return self.store.records(self.store.current_key())
+
     def load_data(self):
-        """Load all required data files"""
+        """
+        Load all required data files. Gallery, attendance and the optional
+        services fail independently: a broken attendance shard or sync config
+        must never cost the enrolled faces.
+        """
         try:
-            # Load face encodings
-            if os.path.exists("facial_recognition.dat"):
-                with open("facial_recognition.dat", "rb") as f:
-                    data = pickle.load(f)
-                    self.known_face_encodings = data["encodings"]
-                    self.known_face_names = data["names"]
+            self.load_gallery()
             
-            # Load attendance records
-            if os.path.exists("attendance.csv"):
-                with open("attendance.csv", "r") as f:
-                    reader = csv.DictReader(f)
-                    self.attendance_log = list(reader)
-                    
-            # Create files if they don't exist
-            if not os.path.exists("facial_recognition.dat"):
-                self.save_known_faces()
-            if not os.path.exists("attendance.csv"):
-                with open("attendance.csv", "w") as f:
-                    f.write("Name,Date,Check-in,Check-out\n")
-                    
+            try:
+                # Load the manifest and current attendance partition; older ones load on demand
+                self.store.open()
+                self.daily_stats.rebuild(self.attendance_log)
+            except Exception as e:
+                print(f"Error loading attendance data: {e}")
+            
+            try:
+                self.start_services()
+            except Exception as e:
+                print(f"Error starting services: {e}")
+        finally:
+            self.ready.set()
+
+    def load_gallery(self):
+        """Read facial_recognition.dat; an unreadable file is set aside, never overwritten"""
+        path = "facial_recognition.dat"
+        if not os.path.exists(path):
+            self.save_known_faces()
+            return
+        try:
+            self.read_gallery(path)
+        except Exception as e:
+            backup = f"{path}.unreadable-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+            print(f"Error loading face data: {e}; keeping it as {backup} and starting with an empty gallery")
+            os.replace(path, backup)
+            return
+        if not self.calibration.thresholds and len(set(self.known_face_names)) > 1:
+            self.schedule_calibration()
+
+    def read_gallery(self, path):
+        """Gallery and calibration from a gallery file, writing nothing (tools use it read-only)"""
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        gallery = GallerySnapshot(data["names"], data["encodings"], data.get("version", 0))
+        self.calibration.from_dict(data.get("calibration", {}))
+        self.gallery = gallery
+
+    def start_services(self):
+        """Optional fleet services, each configured by its own file"""
+        # Fleet gallery updates arrive as delta files when the folder exists
+        if os.path.isdir(GalleryUpdateWatcher.DIRECTORY):
+            try:
+                self.gallery_updates = GalleryUpdateWatcher(self)
+                self.gallery_updates.start()
+            except Exception as e:
+                print(f"Error starting the gallery update watcher: {e}")
+                self.gallery_updates = None
+        
+        # Large organisations match against the sharded recognition service
+        try:
+            self.remote_recognizer = RemoteRecognizer.from_config()
+        except Exception as e:
+            print(f"Error configuring the recognition service: {e}")
+            self.remote_recognizer = None
+        
+        # Multi-site replication is opt-in
+        try:
+            self.replication = ReplicationClient.from_config(self)
+            if self.replication:
+                self.replication.start()
+                # Nothing may be dropped on the way to the outbox
+                self.events.subscribe("replication", (AttendanceRecorded, GalleryUpdated),
+                                      self.replication.on_event, maxsize=1000, policy=EventBus.BLOCK)
         except Exception as e:
-            print(f"Error loading data: {e}")
-            # Create fresh files if loading fails
-            self.known_face_encodings = []
-            self.known_face_names = []
-            self.attendance_log = []
-            self.save_data()
+            print(f"Error starting replication: {e}")
+            if self.replication:
+                self.replication.stop()
+            self.replication = None
 
     def save_data(self):
         """Save all data files"""
@@ -91,27 +403,42 @@ class AttendanceSystem:
     def save_known_faces(self):
         """Save face encodings to file"""
         try:
-            data = {
-                "encodings": self.known_face_encodings,
-                "names": self.known_face_names
-            }
-            with open("facial_recognition.dat", "wb") as f:
-                pickle.dump(data, f)
+            with self.gallery_lock:
+                gallery = self.gallery
+                data = {
+                    "encodings": [np.array(encoding) for encoding in gallery.encodings],
+                    "names": list(gallery.names),
+                    "version": gallery.version,
+                    "calibration": self.calibration.to_dict()
+                }
+                with open("facial_recognition.dat.tmp", "wb") as f:
+                    pickle.dump(data, f)
+                os.replace("facial_recognition.dat.tmp", "facial_recognition.dat")
         except Exception as e:
             print(f"Error saving face data: {e}")
 
     def save_attendance_data(self):
-        """Save attendance records to file"""
+        """Save the current attendance partition (older partitions never change)"""
+        self.attendance_writer.submit(self._save_attendance_data).result()
+
+    def _save_attendance_data(self):
+        """Writer thread only"""
         try:
-            if self.attendance_log:
-                keys = self.attendance_log[0].keys()
-                with open("attendance.csv", "w", newline='') as f:
-                    writer = csv.DictWriter(f, fieldnames=keys)
-                    writer.writeheader()
-                    writer.writerows(self.attendance_log)
+            self.store.save(self.store.current_key())
         except Exception as e:
             print(f"Error saving attendance data: {e}")
 
+    def update_gallery(self, change, op, name=None, encoding=None, source="local"):
+        """Swap in change(current snapshot); the only way the gallery is modified"""
+        with self.gallery_lock:
+            previous = self.gallery
+            self.gallery = change(previous)
+            gallery = self.gallery
+            if self.remote_recognizer:
+                self.remote_recognizer.push(previous, gallery)  # Queued under the lock, so in gallery order
+        self.events.publish(GalleryUpdated(gallery.version, len(set(gallery.names)), op, name, encoding, source))
+        return gallery
+
     def register_new_user(self, name, face_encodings):
         """Register a new user with multiple face samples"""
         if not name or not face_encodings:
@@ -120,48 +447,128 @@ class AttendanceSystem:
         # Average the encodings for better accuracy
         avg_encoding = np.mean(face_encodings, axis=0)
         
-        self.known_face_names.append(name)
-        self.known_face_encodings.append(avg_encoding)
+        self.update_gallery(lambda gallery: gallery.with_user(name, avg_encoding), "add", name, avg_encoding)
         self.save_known_faces()
+        self.schedule_calibration()
         return True
 
+    def apply_gallery_delta(self, path):
+        """Apply a GalleryDelta file to the live gallery; returns (success, message)"""
+        try:
+            delta = GalleryDelta.read(path)
+            started = time.perf_counter()
+            self.update_gallery(lambda gallery: gallery.apply_delta(delta), "delta", source="delta")
+        except Exception as e:
+            return False, f"Error applying gallery delta: {e}"
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.save_known_faces()
+        self.schedule_calibration()
+        return True, (f"v{delta['base']['version']} -> v{delta['target']['version']}: "
+                      f"{len(delta['added'])} added, {len(delta['updated'])} updated, "
+                      f"{len(delta['removed'])} removed in {elapsed_ms:.0f} ms")
+
+    def remove_user(self, name):
+        """Remove every gallery entry of a user; returns how many were removed"""
+        before = len(self.gallery)
+        removed = before - len(self.update_gallery(lambda gallery: gallery.without_user(name), "remove", name))
+        if removed:
+            self.save_known_faces()
+            self.schedule_calibration()
+        return removed
+
+    def schedule_calibration(self):
+        """Recompute per-user thresholds in the background and persist them"""
+        def calibrate():
+            try:
+                gallery = self.gallery
+                self.calibration.calibrate(list(gallery.names), list(gallery.encodings))
+                self.save_known_faces()
+            except Exception as e:
+                print(f"Calibration error: {e}")
+        self.executor.submit(calibrate)
+
     def recognize_face(self, face_encoding):
-        if not self.known_face_encodings:
-            return "Unknown", 0
-        
-        # Convert to numpy array first for vectorized operations
-        known_encodings = np.array(self.known_face_encodings)
-        face_encoding = np.array(face_encoding)
+        return self.recognize_faces([face_encoding])[0]
+
+    def recognize_faces(self, face_encodings):
+        """(name, confidence) per encoding, matching the whole batch in one pass"""
+        if not len(face_encodings):
+            return []
+        remote = self.remote_recognizer
+        if remote and remote.available() and remote.in_sync(self.gallery):
+            try:
+                results = []
+                for matches in self.remote_recognizer.match(face_encodings):
+                    if not matches:
+                        results.append(("Unknown", 0))
+                        continue
+                    runner_up = matches[1][1] if len(matches) > 1 else None
+                    results.append(self.decide_match(matches[0][0], matches[0][1], runner_up))
+                return results
+            except Exception as e:
+                # Service unreachable: match locally until its cool-down is over
+                print(f"Recognition service error: {e}; using the local gallery for "
+                      f"{self.remote_recognizer.retry_at - time.monotonic():.0f}s")
         
-        # Vectorized distance calculation (much faster)
-        distances = np.linalg.norm(known_encodings - face_encoding, axis=1)
+        # One snapshot per batch: names and encodings can't change underneath us
+        gallery = self.gallery
+        if not len(gallery):
+            return [("Unknown", 0)] * len(face_encodings)
         
-        # Find best match
-        best_match_idx = distances.argmin()
-        best_distance = distances[best_match_idx]
+        # All distances at once: |q|^2 + |g|^2 - 2 q.g
+        queries = np.asarray(face_encodings, dtype=np.float64).reshape(-1, gallery.encodings.shape[1])
+        squared = np.einsum("ij,ij->i", gallery.encodings, gallery.encodings)
+        cross = queries @ gallery.encodings.T
+        all_distances = np.sqrt(np.maximum(
+            np.einsum("ij,ij->i", queries, queries)[:, None] + squared[None, :] - 2 * cross, 0))
         
+        results = []
+        for distances in all_distances:
+            best_match_idx = distances.argmin()
+            name = gallery.names[best_match_idx]
+            others = distances[gallery.name_array != name]
+            results.append(self.decide_match(name, distances[best_match_idx],
+                                             others.min() if others.size else None))
+        return results
+
+    def decide_match(self, name, best_distance, runner_up_distance):
+        """Accept or reject the closest identity given the closest *other* identity's distance"""
         # Fast confidence calculation
         confidence = max(0, 1 - (best_distance / 0.9))  # More aggressive confidence
         
-        # Early return for obvious mismatches
-        if best_distance > 0.6:  # Higher threshold for quick rejection
+        # Per-user threshold when calibrated, otherwise the global cutoff
+        threshold = self.calibration.threshold_for(name)
+        if best_distance > (threshold or ThresholdCalibrator.DEFAULT_THRESHOLD):
             return "Unknown", 0
         
-        if confidence >= self.min_confidence:
-            return self.known_face_names[best_match_idx], confidence
+        # Margin test: the runner-up *identity* must be clearly further away
+        if runner_up_distance is not None and not self.calibration.passes_margin(best_distance, runner_up_distance):
+            return "Unknown", confidence
+        
+        self.calibration.observe(name, best_distance)
+        if threshold is not None or confidence >= self.min_confidence:
+            return name, confidence
         return "Unknown", confidence
 
-    def detect_liveness(self, frame, face_location):
+    def on_match_accepted(self, name):
+        """A confirmed check-in/out: its match distance becomes a genuine sample"""
+        if self.calibration.accept(name) and self.calibration.accepted_since_calibration >= 20:
+            self.schedule_calibration()
+
+    def detect_liveness(self, frame, face_location, landmark_region=None):
         """
         Simple liveness detection to prevent spoofing
         Returns True if face appears to be live
         """
-        # Convert to grayscale
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        # Prefer the landmark box (eyes/nose), it has no background in it
+        top, right, bottom, left = FrameGeometry.clip(landmark_region or face_location, frame.shape)
+        if bottom - top < 8 or right - left < 8:
+            top, right, bottom, left = FrameGeometry.clip(face_location, frame.shape)
         
-        # Get face region
-        top, right, bottom, left = face_location
-        face_region = gray[top:bottom, left:right]
+        # Convert only the face region to grayscale
+        face_region = cv2.cvtColor(frame[top:bottom, left:right], cv2.COLOR_BGR2GRAY)
+        if face_region.size == 0:
+            return False
         
         # Reducing resolution for processing
         small_face = cv2.resize(face_region, (100, 100))
@@ -172,65 +579,2390 @@ class AttendanceSystem:
         # If focus measure is too low, might be a static image. 
         return fm > self.anti_spoofing_threshold
 
-    def record_attendance(self, name, action):
-        """Record check-in/check-out with validation"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        date = datetime.now().strftime("%Y-%m-%d")
-        
-        # Check if user already has an entry today
-        existing_entry = None
-        for record in self.attendance_log:
-            if record["Name"] == name and record["Date"] == date:
-                existing_entry = record
+    def record_attendance(self, name, action):
+        """Record check-in/check-out with validation (runs on the attendance writer)"""
+        return self.attendance_writer.submit(self._record_attendance, name, action).result()
+
+    def _record_attendance(self, name, action):
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        date = datetime.now().strftime("%Y-%m-%d")
+        
+        # Check if user already has an entry today
+        today = self.attendance_log
+        index = today.find(name, date)
+        existing_entry = today[index] if index is not None else None
+        
+        if action == "Check-in":
+            if existing_entry and existing_entry["Check-in"] != "":
+                return False, "Already checked in today"
+            
+            if not existing_entry:
+                new_record = {
+                    "Name": name,
+                    "Date": date,
+                    "Check-in": timestamp,
+                    "Check-out": ""
+                }
+                self.store.append(new_record)
+            else:
+                existing_entry["Check-in"] = timestamp
+                self.store.touch(self.store.partition_key(date))
+                
+            self.daily_stats.on_check_in(name)
+            self.on_match_accepted(name)
+            self._save_attendance_data()
+            self.events.publish(AttendanceRecorded(name, action, date, timestamp))
+            return True, "Checked in successfully"
+            
+        elif action == "Check-out":
+            if not existing_entry or existing_entry["Check-in"] == "":
+                return False, "Not checked in yet"
+            if existing_entry["Check-out"] != "":
+                return False, "Already checked out today"
+            
+            existing_entry["Check-out"] = timestamp
+            self.store.touch(self.store.partition_key(date))
+            self.daily_stats.on_check_out(name)
+            self.on_match_accepted(name)
+            self._save_attendance_data()
+            self.events.publish(AttendanceRecorded(name, action, date, timestamp))
+            return True, "Checked out successfully"
+        
+        return False, "Invalid action"
+
+
+class ThresholdCalibrator:
+    """
+    Open-set calibration of match thresholds.
+    Genuine distances come from repeated gallery entries of the same person
+    and from matches a user confirmed by checking in/out; impostor distances
+    are between templates of different people. Only identities with at
+    least MIN_GENUINE genuine distances get their own threshold; everyone
+    else keeps the global cutoff and the admin's min_confidence. A margin
+    test rejects matches whose runner-up identity is nearly as close.
+    Confirmed matches already passed the old threshold, so on their own
+    they can only tighten it: the slack is only added when gallery pairs
+    back the distribution up.
+    """
+    DEFAULT_THRESHOLD = 0.6  # Global cutoff used before an identity is calibrated
+    MIN_THRESHOLD = 0.35
+    MAX_THRESHOLD = 0.65
+    MIN_GENUINE = 5  # Fewer genuine distances than this: not calibrated
+    IMPOSTOR_FRACTION = 0.75  # Never accept beyond this fraction of the nearest other identity
+    GENUINE_SLACK = 0.05  # Added to the genuine 95th percentile
+
+    def __init__(self, margin=0.05, max_genuine=50):
+        self.margin = margin  # Minimum gap between best and second-best identity
+        self.max_genuine = max_genuine
+        self.thresholds = {}  # {name: threshold}
+        self.genuine = {}  # {name: [accepted match distances]}
+        self.last_seen = {}  # {name: distance of the latest match, not yet confirmed}
+        self.accepted_since_calibration = 0
+        self.lock = threading.Lock()  # Guards genuine: the attendance writer appends while calibration reads
+
+    def genuine_samples(self):
+        """Copy of the genuine distances, safe to use while accept() runs on another thread"""
+        with self.lock:
+            return {name: list(samples) for name, samples in self.genuine.items()}
+
+    def calibrated_count(self, names):
+        """How many of these identities have their own threshold (and so ignore min_confidence)"""
+        thresholds = self.thresholds
+        return sum(1 for name in set(names) if name in thresholds)
+
+    def threshold_for(self, name):
+        return self.thresholds.get(name)
+
+    def passes_margin(self, best_distance, second_distance):
+        return second_distance - best_distance >= self.margin
+
+    def observe(self, name, distance):
+        self.last_seen[name] = float(distance)
+
+    def accept(self, name):
+        """Promote the latest match distance for this user to a genuine sample"""
+        distance = self.last_seen.pop(name, None)
+        if distance is None:
+            return False
+        with self.lock:
+            samples = self.genuine.setdefault(name, [])
+            samples.append(distance)
+            del samples[:-self.max_genuine]
+            self.accepted_since_calibration += 1
+        return True
+
+    def distributions(self, names, encodings, pairs=True):
+        """
+        (genuine, impostor, nearest impostor per name) distance arrays.
+        Distances come from |a|^2 + |b|^2 - 2ab in row blocks, so memory
+        stays at block x N. pairs=False skips collecting the pair arrays
+        when only the nearest impostors are needed.
+        """
+        labels, codes = np.unique(np.asarray(names), return_inverse=True)
+        encodings = np.asarray(encodings, dtype=np.float64)
+        squared = np.einsum("ij,ij->i", encodings, encodings)
+        genuine = [np.array([d for samples in self.genuine_samples().values() for d in samples])]
+        impostor = []
+        nearest = np.full(len(labels), np.inf)
+
+        block = 512
+        for start in range(0, len(encodings), block):
+            stop = min(start + block, len(encodings))
+            gram = encodings[start:stop] @ encodings.T
+            dists = np.sqrt(np.maximum(squared[start:stop, None] + squared[None, :] - 2 * gram, 0))
+            same = codes[start:stop, None] == codes[None, :]
+            if pairs:
+                # Upper triangle only so each pair is counted once
+                later = np.arange(len(codes))[None, :] > np.arange(start, stop)[:, None]
+                genuine.append(dists[same & later])
+                impostor.append(dists[~same & later])
+            np.minimum.at(nearest, codes[start:stop], np.where(same, np.inf, dists).min(axis=1))
+
+        nearest = {str(labels[c]): float(d) for c, d in enumerate(nearest) if np.isfinite(d)}
+        impostor = np.concatenate(impostor) if impostor else np.array([])
+        return np.concatenate(genuine), impostor, nearest
+
+    @staticmethod
+    def gallery_pairs(names, encodings):
+        """{name: distances between that identity's own templates}"""
+        rows = {}
+        for i, name in enumerate(names):
+            rows.setdefault(name, []).append(i)
+        encodings = np.asarray(encodings, dtype=np.float64)
+        pairs = {}
+        for name, indices in rows.items():
+            if len(indices) < 2:
+                continue
+            templates = encodings[indices]
+            dists = np.linalg.norm(templates[:, None, :] - templates[None, :, :], axis=2)
+            pairs[name] = dists[np.triu_indices(len(indices), k=1)].tolist()
+        return pairs
+
+    def calibrate(self, names, encodings):
+        """Derive thresholds from gallery pairs and accepted matches, for identities with enough of them"""
+        if not names:
+            self.thresholds = {}
+            return self.thresholds
+        _, _, nearest = self.distributions(names, encodings, pairs=False)
+        accepted = self.genuine_samples()
+        pairs = self.gallery_pairs(names, encodings)
+
+        thresholds = {}
+        for name in set(names):
+            samples = pairs.get(name, []) + accepted.get(name, [])
+            if len(samples) < self.MIN_GENUINE:
+                continue  # Global cutoff and min_confidence still apply
+            accept_up_to = np.percentile(samples, 95)
+            if name in pairs:
+                accept_up_to += self.GENUINE_SLACK
+            if name in nearest:
+                accept_up_to = min(accept_up_to, nearest[name] * self.IMPOSTOR_FRACTION)
+            thresholds[name] = float(np.clip(accept_up_to, self.MIN_THRESHOLD, self.MAX_THRESHOLD))
+
+        self.thresholds = thresholds  # Swapped in one assignment for the recognition thread
+        with self.lock:
+            self.accepted_since_calibration = 0
+        return thresholds
+
+    @staticmethod
+    def far_frr(genuine, impostor, thresholds):
+        """[(threshold, FAR, FRR)]: share of impostors accepted / genuines rejected"""
+        genuine = np.asarray(genuine)
+        impostor = np.asarray(impostor)
+        curve = []
+        for t in thresholds:
+            far = float((impostor <= t).mean()) if impostor.size else 0.0
+            frr = float((genuine > t).mean()) if genuine.size else 0.0
+            curve.append((float(t), far, frr))
+        return curve
+
+    def to_dict(self):
+        return {"thresholds": dict(self.thresholds), "genuine": self.genuine_samples(), "margin": self.margin}
+
+    def from_dict(self, data):
+        self.thresholds = dict(data.get("thresholds", {}))
+        with self.lock:
+            self.genuine = {name: list(d) for name, d in data.get("genuine", {}).items()}
+        self.margin = data.get("margin", self.margin)
+
+
+class AttendanceStore:
+    """
+    Attendance history split into per-month (or per-ISO-week) CSV shards
+    under attendance/, with a small JSON manifest describing each shard.
+    Only the current partition is read at startup; the rest are read the
+    first time a report asks for them.
+    """
+    FIELDS = ["Name", "Date", "Check-in", "Check-out"]
+
+    def __init__(self, directory="attendance", legacy_file="attendance.csv", granularity="month"):
+        self.directory = directory
+        self.legacy_file = legacy_file
+        self.granularity = granularity  # "month" or "week"
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.manifest = {"granularity": granularity, "partitions": {}}
+        self.partitions = {}  # {key: [records]} for loaded partitions only
+        self.versions = {}  # {key: int} bumped whenever a partition changes
+        self.load_lock = threading.Lock()  # Lazy loads run on report/Tk threads while the writer appends
+
+    def open(self):
+        """Read the manifest and the current partition, migrating attendance.csv while it is still there"""
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, "r") as f:
+                    self.manifest = json.load(f)
+                self.granularity = self.manifest.get("granularity", self.granularity)
+            except ValueError as e:
+                print(f"Error reading {self.manifest_path}: {e}; rebuilding it from the shard files")
+                self._rebuild_manifest()
+        # Checked on every start, so a migration that failed or was interrupted resumes
+        if os.path.exists(self.legacy_file):
+            self._migrate_legacy_file()
+        self.records(self.current_key())
+
+    def partition_key(self, date):
+        """'YYYY-MM' for monthly shards, 'YYYY-Www' for weekly ones"""
+        if self.granularity == "week":
+            year, week, _ = datetime.strptime(date[:10], "%Y-%m-%d").isocalendar()
+            return f"{year}-W{week:02d}"
+        return date[:7]
+
+    def current_key(self):
+        return self.partition_key(datetime.now().strftime("%Y-%m-%d"))
+
+    def _partition_file(self, key):
+        return os.path.join(self.directory, f"{key}.csv")
+
+    def keys(self):
+        return sorted(set(self.manifest["partitions"]) | set(self.partitions))
+
+    def keys_between(self, start_date=None, end_date=None):
+        """Partition keys that can hold records in the (inclusive) date range"""
+        keys = self.keys()
+        try:
+            if start_date:
+                first = self.partition_key(start_date)
+                keys = [k for k in keys if k >= first]
+            if end_date:
+                last = self.partition_key(end_date)
+                keys = [k for k in keys if k <= last]
+        except ValueError:
+            pass  # Unparseable bound: scan everything and let the caller filter
+        return keys
+
+    def records(self, key):
+        """AttendanceColumns of one partition, reading its shard the first time it's needed"""
+        records = self.partitions.get(key)
+        if records is not None:
+            return records
+        with self.load_lock:
+            # Checked again: a partition loaded meanwhile (and maybe appended to) must not be replaced
+            if key not in self.partitions:
+                self.partitions[key] = self._read_partition(key)
+                self.versions.setdefault(key, 0)
+            return self.partitions[key]
+
+    def peek(self, key):
+        """Records of one partition without keeping its shard loaded (for one-off scans like exports)"""
+        records = self.partitions.get(key)
+        if records is not None:
+            return records
+        return self._read_partition(key, quarantine=False)
+
+    def row_count(self, key):
+        records = self.partitions.get(key)
+        if records is not None:
+            return len(records)
+        return self.manifest["partitions"].get(key, {}).get("rows", 0)
+
+    def iter_records(self, start_date=None, end_date=None):
+        for key in self.keys_between(start_date, end_date):
+            for record in self.records(key):
+                yield record
+
+    def _read_partition(self, key, quarantine=True):
+        path = self._partition_file(key)
+        if not os.path.exists(path):
+            return AttendanceColumns()
+        rejected = []
+        with open(path, "r", newline="") as f:
+            records = AttendanceColumns.from_rows(csv.DictReader(f), rejected)
+        if quarantine:
+            self.quarantine(rejected, os.path.basename(path))
+        return records
+
+    def quarantine(self, rejected, source):
+        """Append unreadable rows to rejected.csv so saving the shard without them loses nothing"""
+        if not rejected:
+            return
+        path = os.path.join(self.directory, "rejected.csv")
+        new_file = not os.path.exists(path)
+        with open(path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(["Source"] + self.FIELDS + ["Error"])
+            for row, reason in rejected:
+                writer.writerow([source] + [row.get(field) or "" for field in self.FIELDS] + [reason])
+        print(f"{len(rejected)} unreadable attendance rows from {source} kept in {path}")
+
+    def append(self, record):
+        key = self.partition_key(record["Date"])
+        self.records(key).append(record)
+        self.touch(key)
+
+    def touch(self, key):
+        """Mark a partition as changed so cached reports rebuild it"""
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def save(self, key):
+        """Atomically rewrite one shard and refresh its manifest entry"""
+        records = self.records(key)
+        self._write_partition(key, records)
+        self._write_manifest()
+
+    def _write_partition(self, key, records):
+        path = self._partition_file(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+            writer.writeheader()
+            writer.writerows(records.rows())
+        os.replace(tmp_path, path)
+        self._describe_partition(key, records)
+
+    def _describe_partition(self, key, records):
+        days = records.days
+        self.manifest["partitions"][key] = {
+            "file": os.path.basename(self._partition_file(key)),
+            "rows": len(records),
+            "first_date": datetime.fromordinal(min(days)).strftime("%Y-%m-%d") if days else "",
+            "last_date": datetime.fromordinal(max(days)).strftime("%Y-%m-%d") if days else ""
+        }
+
+    def _write_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _rebuild_manifest(self):
+        """Describe every shard file on disk (the manifest is only an index of them)"""
+        self.manifest = {"granularity": self.granularity, "partitions": {}}
+        for filename in sorted(os.listdir(self.directory)):
+            key, extension = os.path.splitext(filename)
+            if extension != ".csv" or not key[:4].isdigit():
+                continue  # Not a shard (e.g. rejected.csv)
+            if "-W" in key:
+                self.granularity = self.manifest["granularity"] = "week"
+            self._describe_partition(key, self.records(key))
+        self._write_manifest()
+
+    def _migrate_legacy_file(self):
+        """
+        Merge the single attendance.csv into the shards. Rows already in a
+        shard (from an earlier, interrupted run) are not added again. The
+        manifest is written and the file renamed only after every shard is
+        on disk, so a failure leaves attendance.csv to be migrated next start.
+        """
+        print(f"Migrating {self.legacy_file} into partitions under {self.directory}/")
+        merged = {}  # {key: (records, {(user id, day)} already in the shard)}
+        rejected = []
+        added = 0
+        with open(self.legacy_file, "r", newline="") as f:
+            for record in csv.DictReader(f):
+                try:
+                    name, day, _, _ = AttendanceColumns.parse_row(record)
+                    key = self.partition_key(record["Date"])
+                except ValueError as e:
+                    print(f"Skipping unreadable attendance row {record}: {e}")
+                    rejected.append((record, str(e)))
+                    continue
+                if key not in merged:
+                    records = self.records(key)
+                    merged[key] = (records, set(zip(records.user_ids, records.days)))
+                records, existing = merged[key]
+                if (AttendanceColumns.name_ids.get(name), day) in existing:
+                    continue
+                records.append(record)
+                added += 1
+
+        for key, (records, _) in merged.items():
+            self._write_partition(key, records)
+            self.touch(key)
+        self._write_manifest()
+        # Keep the original as a backup but make it obvious it is no longer live
+        os.replace(self.legacy_file, self.legacy_file + ".migrated")
+        # Only now, so a retried migration doesn't quarantine the same rows twice
+        self.quarantine(rejected, os.path.basename(self.legacy_file))
+        print(f"Migrated {added} records into {len(merged)} partitions ({len(rejected)} unreadable)")
+
+
+class AttendanceColumns:
+    """
+    One partition of attendance stored as parallel arrays instead of a list
+    of dicts: interned user ids, date ordinals and integer epoch seconds
+    (about 24 bytes per record). Iterating yields AttendanceRecord views
+    that still read and write like the old CSV row dicts.
+    """
+    MISSING = -1  # Epoch value for an empty check-in/check-out
+    EPOCH = datetime(1970, 1, 1)
+    TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+    # Name table shared by every partition so ids are stable across shards
+    names = []
+    name_ids = {}
+    names_lock = threading.Lock()  # The writer and lazy partition loads (Tk, report threads) both add names
+
+    def __init__(self):
+        self.user_ids = array("I")
+        self.days = array("i")
+        self.check_ins = array("q")
+        self.check_outs = array("q")
+
+    @classmethod
+    def from_rows(cls, rows, rejected=None):
+        """
+        Build from CSV-style dict rows (the attendance.csv format). Unreadable
+        rows are skipped with a warning and, if given, added to rejected as
+        (row, reason) so the caller can keep them somewhere.
+        """
+        columns = cls()
+        for row in rows:
+            try:
+                columns.append(row)
+            except ValueError as e:
+                print(f"Skipping unreadable attendance row {dict(row)}: {e}")
+                if rejected is not None:
+                    rejected.append((row, str(e)))
+        return columns
+
+    @classmethod
+    def parse_row(cls, row):
+        """(name, day ordinal, check-in, check-out) of a CSV row; ValueError if any field is unreadable"""
+        try:
+            name = row["Name"]
+            date = row["Date"]
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"missing field {e}")
+        if not name or not date:
+            raise ValueError("empty name or date")
+        day = datetime.strptime(date, "%Y-%m-%d").toordinal()
+        check_in = cls.encode_time(row.get("Check-in") or "", day)
+        check_out = cls.encode_time(row.get("Check-out") or "", day)
+        return name, day, check_in, check_out
+
+    @classmethod
+    def user_id(cls, name):
+        user_id = cls.name_ids.get(name)
+        if user_id is not None:
+            return user_id
+        with cls.names_lock:
+            user_id = cls.name_ids.get(name)  # Someone may have added it while we waited
+            if user_id is None:
+                user_id = len(cls.names)
+                cls.names.append(sys.intern(name))
+                cls.name_ids[name] = user_id  # Published last, so a lock-free hit sees names filled in
+        return user_id
+
+    @classmethod
+    def encode_time(cls, text, day):
+        """Timestamp string -> epoch seconds; time-only values are placed on the record's day"""
+        if not text:
+            return cls.MISSING
+        try:
+            moment = datetime.strptime(text, cls.TIME_FORMAT)
+        except ValueError:
+            clock = datetime.strptime(text, "%H:%M:%S")
+            moment = datetime.combine(datetime.fromordinal(day).date(), clock.time())
+        return int((moment - cls.EPOCH).total_seconds())
+
+    @classmethod
+    def format_time(cls, value):
+        if value == cls.MISSING:
+            return ""
+        return (cls.EPOCH + timedelta(seconds=value)).strftime(cls.TIME_FORMAT)
+
+    def __len__(self):
+        # check_outs is appended last, so a reader on another thread only counts complete records
+        return len(self.check_outs)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("attendance record index out of range")
+        return AttendanceRecord(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield AttendanceRecord(self, index)
+
+    def append(self, row):
+        """Add one row; a ValueError leaves every column untouched"""
+        # Parse everything first so the parallel arrays never end up different lengths
+        name, day, check_in, check_out = self.parse_row(row)
+        self.user_ids.append(self.user_id(name))
+        self.days.append(day)
+        self.check_ins.append(check_in)
+        self.check_outs.append(check_out)
+
+    def find(self, name, date):
+        """Index of the user's record on a date, or None (no string formatting)"""
+        user_id = self.name_ids.get(name)
+        if user_id is None:
+            return None
+        day = datetime.strptime(date, "%Y-%m-%d").toordinal()
+        for index in range(len(self) - 1, -1, -1):
+            if self.days[index] == day and self.user_ids[index] == user_id:
+                return index
+        return None
+
+    def rows(self):
+        """CSV adapter: yield each record as a dict of strings"""
+        for index in range(len(self)):
+            yield AttendanceRecord(self, index).as_dict()
+
+
+class AttendanceRecord:
+    """Lightweight view of one row in an AttendanceColumns, indexed like the CSV dict"""
+    __slots__ = ("columns", "index")
+
+    def __init__(self, columns, index):
+        self.columns = columns
+        self.index = index
+
+    def __getitem__(self, key):
+        columns, index = self.columns, self.index
+        if key == "Name":
+            return columns.names[columns.user_ids[index]]
+        if key == "Date":
+            return datetime.fromordinal(columns.days[index]).strftime("%Y-%m-%d")
+        if key == "Check-in":
+            return columns.format_time(columns.check_ins[index])
+        if key == "Check-out":
+            return columns.format_time(columns.check_outs[index])
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        columns, index = self.columns, self.index
+        if key == "Check-in":
+            columns.check_ins[index] = columns.encode_time(value, columns.days[index])
+        elif key == "Check-out":
+            columns.check_outs[index] = columns.encode_time(value, columns.days[index])
+        else:
+            raise KeyError(f"{key} cannot be changed")
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return AttendanceStore.FIELDS
+
+    def as_dict(self):
+        return {key: self[key] for key in AttendanceStore.FIELDS}
+
+
+class AttendanceAnalytics:
+    """
+    Columnar (pandas) view of the attendance history used by every report.
+    Each partition is parsed once per change and cached, and all reports are
+    vectorized group-bys over the cached frames.
+    """
+    COLUMNS = ["Name", "Date", "Check-in", "Check-out"]
+    WORKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri"]
+    LATE_AFTER_SECONDS = 9 * 3600 + 30 * 60
+    STANDARD_DAY_HOURS = 8
+    EPOCH_ORDINAL = AttendanceColumns.EPOCH.toordinal()
+
+    def __init__(self, attendance_system):
+        self.attendance_system = attendance_system
+        self._partition_frames = {}  # {key: (version, frame)}
+        self._history_cache = {}  # {((key, version), ...): concatenated frame}
+
+    @property
+    def frame(self):
+        """Date-sorted frame of the whole history"""
+        return self._history()
+
+    def _partition_frame(self, key):
+        """Typed, date-sorted frame of one partition, rebuilt only when it changes"""
+        store = self.attendance_system.store
+        records = store.records(key)
+        version = store.versions.get(key, 0)
+        cached = self._partition_frames.get(key)
+        if cached is None or cached[0] != version:
+            cached = (version, self._sorted_frame(records))
+            self._partition_frames[key] = cached
+        return cached[1]
+
+    def _sorted_frame(self, records):
+        frame = self._build_frame(records)
+        frame = frame[frame["Date"].notna()]
+        # Sorting the reversed frame keeps insertion order within a day once read newest-first
+        return frame.iloc[::-1].sort_values("Date", kind="stable")
+
+    def _history(self, start_date=None, end_date=None):
+        """
+        Date-sorted frame over the partitions overlapping the range. Shards are
+        ordered by time, so concatenating their sorted frames keeps it sorted.
+        """
+        store = self.attendance_system.store
+        keys = store.keys_between(start_date, end_date)
+        frames = [self._partition_frame(key) for key in keys]
+        signature = tuple((key, store.versions.get(key, 0)) for key in keys)
+        if signature not in self._history_cache:
+            if len(self._history_cache) >= 8:
+                self._history_cache.clear()
+            if frames:
+                combined = pd.concat(frames, ignore_index=True)
+                combined["Name"] = combined["Name"].astype("category")
+            else:
+                combined = self._build_frame(AttendanceColumns())
+            self._history_cache[signature] = combined
+        return self._history_cache[signature]
+
+    def _build_frame(self, columns):
+        """Typed frame straight from the partition's arrays (no string parsing)"""
+        # Slicing copies each array up to the same length, so a concurrent append can't skew
+        # the columns (and no buffer stays exported, which would make append() fail)
+        count = len(columns)
+
+        def timestamps(values):
+            seconds = np.array(values[:count], dtype=np.int64)
+            stamps = seconds.astype("datetime64[s]")
+            stamps[seconds == AttendanceColumns.MISSING] = np.datetime64("NaT")
+            return pd.Series(stamps.astype("datetime64[ns]"))
+
+        codes = np.array(columns.user_ids[:count], dtype=np.int64)
+        days = np.array(columns.days[:count], dtype=np.int64) - self.EPOCH_ORDINAL
+        frame = pd.DataFrame({
+            "Name": pd.Categorical.from_codes(codes, categories=list(AttendanceColumns.names)),
+            "Date": pd.Series(days.astype("datetime64[D]").astype("datetime64[ns]")),
+            "Check-in": timestamps(columns.check_ins),
+            "Check-out": timestamps(columns.check_outs),
+        })
+        frame["Hours"] = (frame["Check-out"] - frame["Check-in"]).dt.total_seconds() / 3600
+        return frame
+
+    def _completed(self):
+        frame = self.frame
+        return frame[frame["Hours"].notna()]
+
+    def report_slice(self, start_date=None, end_date=None):
+        """Newest-first ReportSlice of (Date, Name, Check-in, Check-out, Hours) rows"""
+        return self._date_slice(self._history(start_date, end_date), start_date, end_date)
+
+    def _date_slice(self, ordered, start_date, end_date):
+        dates = ordered["Date"].to_numpy()
+        lo, hi = 0, len(ordered)
+        if start_date:
+            lo = dates.searchsorted(pd.to_datetime(start_date, errors="coerce").to_datetime64(), side="left")
+        if end_date:
+            hi = dates.searchsorted(pd.to_datetime(end_date, errors="coerce").to_datetime64(), side="right")
+        return ReportSlice(ordered, self._format_report_rows, lo, max(lo, hi))
+
+    def report_partitions(self, start_date=None, end_date=None):
+        """Same rows as report_slice(), built one partition at a time (for exports)"""
+        return PartitionedReport(self, start_date, end_date)
+
+    def partition_slice(self, key, start_date=None, end_date=None):
+        """
+        Report rows of one partition. Uses the cached frame when the partition
+        is loaded and current; otherwise the shard is read into a frame that
+        is dropped once the caller is done with it.
+        """
+        store = self.attendance_system.store
+        cached = self._partition_frames.get(key)
+        if key in store.partitions and cached and cached[0] == store.versions.get(key, 0):
+            ordered = cached[1]
+        else:
+            ordered = self._sorted_frame(store.peek(key))
+        return self._date_slice(ordered, start_date, end_date)
+
+    def user_slice(self, name):
+        """Newest-first ReportSlice of one user's raw (Name, Date, Check-in, Check-out) rows"""
+        ordered = self.frame
+        return ReportSlice(ordered[ordered["Name"] == name], self._format_raw_rows)
+
+    def _format_times(self, values):
+        return values.dt.strftime(AttendanceColumns.TIME_FORMAT).fillna("")
+
+    def _format_raw_rows(self, part):
+        return list(zip(part["Name"].astype(str),
+                        part["Date"].dt.strftime("%Y-%m-%d"),
+                        self._format_times(part["Check-in"]),
+                        self._format_times(part["Check-out"])))
+
+    def _format_report_rows(self, part):
+        hours = part["Hours"].map(lambda h: f"{h:.1f}" if pd.notna(h) and h else "")
+        return list(zip(part["Date"].dt.strftime("%Y-%m-%d"),
+                        part["Name"].astype(str),
+                        self._format_times(part["Check-in"]),
+                        self._format_times(part["Check-out"]),
+                        hours))
+
+    def weekly_hours(self):
+        """Average/std/count of worked hours per weekday (Mon-Fri)"""
+        completed = self._completed()
+        weekday = completed["Date"].dt.dayofweek
+        completed = completed[weekday < 5]
+        days = completed["Date"].dt.dayofweek.map(dict(enumerate(self.WORKDAYS)))
+        grouped = pd.Series(completed["Hours"].to_numpy(), index=days.to_numpy()).groupby(level=0)
+        stats = pd.DataFrame({
+            "avg": grouped.mean(),
+            "std": grouped.std(ddof=0),
+            "count": grouped.size()
+        }).reindex(self.WORKDAYS).fillna(0)
+        return {
+            day: {"avg": row["avg"], "std": row["std"], "count": int(row["count"])}
+            for day, row in stats.iterrows()
+        }
+
+    def overtime_slice(self):
+        """Newest-first ReportSlice of (Name, Date, overtime hours) rows"""
+        ordered = self.frame
+        over = ordered[ordered["Hours"] > self.STANDARD_DAY_HOURS]
+        return ReportSlice(over, self._format_overtime_rows)
+
+    def _format_overtime_rows(self, part):
+        extra = (part["Hours"] - self.STANDARD_DAY_HOURS).map(lambda h: f"{h:.1f}")
+        return list(zip(part["Name"].astype(str),
+                        part["Date"].dt.strftime("%Y-%m-%d"),
+                        extra))
+
+    def average_hours(self, name):
+        completed = self._completed()
+        hours = completed.loc[completed["Name"] == name, "Hours"]
+        hours = hours[hours > 0]
+        return float(hours.mean()) if len(hours) else 0
+
+    def user_summary(self, name):
+        """Present days, average hours and late arrivals for one user"""
+        frame = self.frame
+        user = frame[frame["Name"] == name]
+        check_in = user["Check-in"].dropna()
+        late = (check_in - check_in.dt.normalize()).dt.total_seconds() > self.LATE_AFTER_SECONDS
+        return {
+            "present_days": int(user["Check-in"].notna().sum()),
+            "avg_hours": self.average_hours(name),
+            "late_days": int(late.sum())
+        }
+
+
+class ReportSlice:
+    """
+    Contiguous window [lo, hi) of a date-sorted report frame, read newest
+    first. Rows are only formatted when asked for, so formatting a page
+    depends on the page size. The frame itself is not: after any attendance
+    change the changed partition is rebuilt and the history re-concatenated
+    (AttendanceAnalytics._history), which is linear in the rows covered.
+    """
+    def __init__(self, frame, formatter, lo=0, hi=None):
+        self.frame = frame
+        self.formatter = formatter
+        self.lo = lo
+        self.hi = len(frame) if hi is None else hi
+
+    def __len__(self):
+        return self.hi - self.lo
+
+    def rows(self, start, stop):
+        """Formatted rows start..stop (0 = newest)"""
+        stop = min(stop, len(self))
+        if start >= stop:
+            return []
+        part = self.frame.iloc[self.hi - stop:self.hi - start].iloc[::-1]
+        return self.formatter(part)
+
+    def chunks(self, size):
+        """Formatted rows, newest first, size at a time"""
+        for start in range(0, len(self), size):
+            yield self.rows(start, start + size)
+
+
+class PartitionedReport:
+    """
+    Date-range report read one partition at a time, newest first, so an
+    export only holds one month (or week) of rows at once. Shards that
+    aren't loaded are read for the export and not kept. The length comes
+    from the manifest's per-shard row counts, so rows of the first and last
+    partitions that fall outside the range are counted too; it is only used
+    for progress.
+    """
+    def __init__(self, analytics, start_date=None, end_date=None):
+        self.analytics = analytics
+        self.start_date = start_date
+        self.end_date = end_date
+        self.keys = analytics.attendance_system.store.keys_between(start_date, end_date)
+
+    def __len__(self):
+        store = self.analytics.attendance_system.store
+        return sum(store.row_count(key) for key in self.keys)
+
+    def chunks(self, size):
+        for key in reversed(self.keys):
+            part = self.analytics.partition_slice(key, self.start_date, self.end_date)
+            yield from part.chunks(size)
+
+
+class ReportExporter:
+    """
+    Streams a report (ReportSlice or PartitionedReport) to disk in a
+    background thread, chunk by chunk. Only the formatted rows are chunked;
+    how much of the history is in memory is up to the report, which for
+    PartitionedReport is one partition at a time.
+    Formats: xlsx (write-only workbook), csv, csv.gz and parquet.
+    """
+    FORMATS = ("xlsx", "csv", "csv.gz", "parquet")
+
+    def __init__(self, result, columns, filename, fmt="xlsx", chunk_size=5000):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+        self.result = result
+        self.columns = list(columns)
+        self.filename = filename
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.rows_written = 0
+        self.state = "pending"  # pending -> running -> done / failed / cancelled
+        self.error = None
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def progress(self):
+        total = len(self.result)
+        if self.state == "done" or not total:
+            return 1.0
+        return min(self.rows_written / total, 1.0)
+
+    @property
+    def finished(self):
+        return self.state in ("done", "failed", "cancelled")
+
+    def start(self):
+        self.state = "running"
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _chunks(self):
+        for rows in self.result.chunks(self.chunk_size):
+            if self.cancelled.is_set():
+                return
+            yield rows
+
+    def _run(self):
+        try:
+            writer = {
+                "xlsx": self._write_xlsx,
+                "csv": self._write_csv,
+                "csv.gz": self._write_csv,
+                "parquet": self._write_parquet
+            }[self.fmt]
+            writer()
+            if self.cancelled.is_set():
+                self.state = "cancelled"
+                self._remove_partial_file()
+            else:
+                self.state = "done"
+        except Exception as e:
+            print(f"Export error: {e}")
+            self.error = e
+            self.state = "failed"
+            self._remove_partial_file()
+
+    def _remove_partial_file(self):
+        try:
+            if os.path.exists(self.filename):
+                os.remove(self.filename)
+        except OSError as e:
+            print(f"Could not remove partial export: {e}")
+
+    def _write_xlsx(self):
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            raise RuntimeError("Excel export needs openpyxl (pip install openpyxl)")
+        
+        # Write-only workbooks stream rows to disk instead of keeping cells in memory
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("Attendance")
+        sheet.append(self.columns)
+        for rows in self._chunks():
+            for row in rows:
+                sheet.append(list(row))
+            self.rows_written += len(rows)
+        if not self.cancelled.is_set():
+            workbook.save(self.filename)
+
+    def _write_csv(self):
+        if self.fmt == "csv.gz":
+            f = gzip.open(self.filename, "wt", newline="")
+        else:
+            f = open(self.filename, "w", newline="")
+        with f:
+            writer = csv.writer(f)
+            writer.writerow(self.columns)
+            for rows in self._chunks():
+                writer.writerows(rows)
+                self.rows_written += len(rows)
+
+    def _write_parquet(self):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        
+        schema = pa.schema([(col, pa.string()) for col in self.columns])
+        with pq.ParquetWriter(self.filename, schema, compression="snappy") as writer:
+            for rows in self._chunks():
+                if not rows:
+                    continue
+                arrays = [pa.array([str(v) for v in col]) for col in zip(*rows)]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                self.rows_written += len(rows)
+
+
+class DailyStats:
+    """
+    Today's attendance counters, updated on each check-in/check-out
+    instead of rescanning the whole log. Counters reset at the day boundary.
+    The attendance writer updates them while the Tk thread reads them, so
+    every method holds the lock (the day rollover included).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.date = datetime.now().strftime("%Y-%m-%d")
+        self.checked_in = 0
+        self.pending = 0
+        self.user_status = {}  # {name: "in" | "out"} for today
+
+    def rebuild(self, records):
+        """One full pass at load time; everything after that is incremental"""
+        with self.lock:
+            self._reset(datetime.now().strftime("%Y-%m-%d"))
+            for record in records:
+                if record["Date"] != self.date or record["Check-in"] == "":
+                    continue
+                if record["Check-out"] == "":
+                    self._check_in(record["Name"])
+                else:
+                    self.checked_in += 1
+                    self.user_status[record["Name"]] = "out"
+
+    def _reset(self, date):
+        self.date = date
+        self.checked_in = 0
+        self.pending = 0
+        self.user_status = {}
+
+    def _roll_over(self):
+        today = datetime.now().strftime("%Y-%m-%d")
+        if today != self.date:
+            self._reset(today)
+
+    def _check_in(self, name):
+        if name in self.user_status:
+            return
+        self.user_status[name] = "in"
+        self.checked_in += 1
+        self.pending += 1
+
+    def on_check_in(self, name):
+        with self.lock:
+            self._roll_over()
+            self._check_in(name)
+
+    def on_check_out(self, name):
+        with self.lock:
+            self._roll_over()
+            if self.user_status.get(name) != "in":
+                return
+            self.user_status[name] = "out"
+            self.pending -= 1
+
+    def counts(self):
+        """(checked in, pending check-out) for today"""
+        with self.lock:
+            self._roll_over()
+            return self.checked_in, self.pending
+
+
+class ReplicationClient:
+    """
+    Replicates this kiosk to the sync server (sync_server.py): pushes its
+    attendance events and gallery changes, and applies gallery changes made
+    at other sites. Outgoing records wait in an append-only outbox file, so
+    nothing is lost while offline or across restarts, and go up in gzip'd
+    batches. Event ids are content hashes, so a batch retried after a lost
+    response is simply ignored by the server.
+    """
+    CONFIG_FILE = "sync.json"  # {"server": "http://host:8765", "site": "kiosk-1", "interval": 30}
+
+    def __init__(self, attendance_system, server, site, directory="sync", interval=30, batch_size=500, timeout=10):
+        self.attendance_system = attendance_system
+        self.server = server.rstrip("/")
+        self.site = site
+        self.interval = interval
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.directory = directory
+        self.outbox_path = os.path.join(directory, "outbox.jsonl")
+        self.state_path = os.path.join(directory, "state.json")
+        self.state = {"sent": 0, "gallery_cursor": 0}  # Outbox byte offset acked by the server
+        self.lock = threading.Lock()  # Guards the outbox file and state
+        self.wake = threading.Event()
+        self.running = False
+        self.last_sync = None
+        self.last_error = None
+
+    @classmethod
+    def from_config(cls, attendance_system, path=None):
+        """Client configured by sync.json, or None when the kiosk runs standalone or the file is invalid"""
+        path = path or cls.CONFIG_FILE
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as f:
+                config = json.load(f)
+            if not isinstance(config, dict):
+                raise ValueError("expected a JSON object")
+            server, site = config.get("server"), config.get("site")
+            if not isinstance(server, str) or not server.startswith(("http://", "https://")):
+                raise ValueError('"server" must be an http(s) URL')
+            if not isinstance(site, str) or not site.strip():
+                raise ValueError('"site" must name this kiosk')
+            interval = float(config.get("interval", 30))
+            batch_size = int(config.get("batch_size", 500))
+            if interval <= 0 or batch_size <= 0:
+                raise ValueError('"interval" and "batch_size" must be positive')
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Error in {path}: {e}; replication is off")
+            return None
+        return cls(attendance_system, server, site.strip(),
+                   directory=config.get("directory", "sync"),
+                   interval=interval,
+                   batch_size=batch_size)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r") as f:
+                self.state.update(json.load(f))
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+
+    def sync_now(self):
+        self.wake.set()
+
+    # Outbox ==========================================================
+    def _event_id(self, *parts):
+        return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:24]
+
+    def _enqueue(self, kind, record):
+        line = json.dumps([kind, record], separators=(",", ":")) + "\n"
+        with self.lock:
+            with open(self.outbox_path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def attendance_event(self, name, date, field, timestamp):
+        """field is "in" or "out"; the same check-in always gets the same id"""
+        self._enqueue("event", {
+            "id": self._event_id(self.site, name, date, field, timestamp),
+            "name": name,
+            "date": date,
+            "field": field,
+            "time": timestamp
+        })
+
+    def on_event(self, event):
+        """EventBus subscriber: queue local changes for the server"""
+        if isinstance(event, AttendanceRecorded):
+            field = "in" if event.action == "Check-in" else "out"
+            self.attendance_event(event.name, event.date, field, event.time)
+        elif isinstance(event, GalleryUpdated) and event.source == "local" and event.op in ("add", "remove"):
+            # Changes that came from the server (or a delta file) are not sent back
+            self.gallery_change(event.op, event.name, event.encoding)
+
+    def gallery_change(self, op, name, encoding=None):
+        """op is "add" (with the averaged encoding) or "remove" """
+        encoded = None
+        if encoding is not None:
+            # float32 is plenty for distances and halves the payload
+            encoded = base64.b64encode(np.asarray(encoding, dtype=np.float32).tobytes()).decode("ascii")
+        self._enqueue("gallery", {
+            "id": self._event_id(self.site, op, name, encoded or "", str(time.time())),
+            "op": op,
+            "name": name,
+            "encoding": encoded
+        })
+
+    def _save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _read_batch(self):
+        """Up to batch_size unsent records and the outbox offset just past them"""
+        with self.lock:
+            if not os.path.exists(self.outbox_path):
+                return [], self.state["sent"]
+            with open(self.outbox_path, "rb") as f:
+                f.seek(self.state["sent"])
+                records = []
+                end = f.tell()
+                while len(records) < self.batch_size:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        break  # End of file (or a line still being written)
+                    end = f.tell()
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        print(f"Skipping corrupt outbox line: {line[:80]!r}")
+                return records, end
+
+    def _compact(self):
+        """Empty the outbox once the server has everything in it"""
+        with self.lock:
+            if os.path.exists(self.outbox_path) and os.path.getsize(self.outbox_path) == self.state["sent"]:
+                open(self.outbox_path, "wb").close()
+                self.state["sent"] = 0
+                self._save_state()
+
+    # Sync ============================================================
+    def _request(self, method, path, payload=None):
+        headers = {"Accept-Encoding": "gzip"}
+        body = None
+        if payload is not None:
+            body = gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+            headers["Content-Type"] = "application/json"
+            headers["Content-Encoding"] = "gzip"
+        request = urllib.request.Request(self.server + path, data=body, method=method, headers=headers)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            data = response.read()
+            if response.headers.get("Content-Encoding") == "gzip":
+                data = gzip.decompress(data)
+        return json.loads(data)
+
+    def _push_batch(self):
+        records, end = self._read_batch()
+        if not records:
+            self._compact()
+            return False
+        events = [record for kind, record in records if kind == "event"]
+        deltas = [record for kind, record in records if kind == "gallery"]
+        if deltas:
+            self._request("POST", "/gallery", {"site": self.site, "deltas": deltas})
+        if events:
+            self._request("POST", "/events", {"site": self.site, "events": events})
+        # Only advance once the server has acked; a failure resends the same (idempotent) batch
+        with self.lock:
+            self.state["sent"] = end
+            self._save_state()
+        return True
+
+    def _pull_gallery(self):
+        """Apply enrollments and removals made at other sites"""
+        changed = False
+        while True:
+            response = self._request(
+                "GET", f"/gallery?since={self.state['gallery_cursor']}&exclude_site={urllib.request.quote(self.site)}")
+            for delta in response["deltas"]:
+                name = delta["name"]
+                if delta["op"] == "add" and delta.get("encoding"):
+                    encoding = np.frombuffer(base64.b64decode(delta["encoding"]), dtype=np.float32).astype(np.float64)
+                    self.attendance_system.update_gallery(
+                        lambda gallery: gallery.with_user(name, encoding), "add", name, encoding, source="replication")
+                    changed = True
+                elif delta["op"] == "remove":
+                    self.attendance_system.update_gallery(
+                        lambda gallery: gallery.without_user(name), "remove", name, source="replication")
+                    changed = True
+            with self.lock:
+                self.state["gallery_cursor"] = response["cursor"]
+                self._save_state()
+            if not response["deltas"]:
+                break
+        if changed:
+            self.attendance_system.save_known_faces()
+            self.attendance_system.schedule_calibration()
+
+    def sync_once(self):
+        while self._push_batch():
+            pass
+        self._pull_gallery()
+        self.last_sync = datetime.now()
+
+    def _run(self):
+        while self.running:
+            try:
+                self.sync_once()
+                self.last_error = None
+            except Exception as e:
+                # Offline: records stay in the outbox until the next attempt
+                self.last_error = str(e)
+                print(f"Sync error: {e}")
+            self.wake.wait(self.interval)
+            self.wake.clear()
+
+
+class RemoteRecognizer:
+    """
+    Client of recognition_service.py. Sends encodings as float32 over one
+    kept-alive HTTP connection and gets the top-k identities back; the
+    accept/reject decision stays local (AttendanceSystem.decide_match).
+    After a failure the service is skipped for a cool-down that doubles on
+    every further failure (up to MAX_COOLDOWN), so an outage costs one
+    timeout per cool-down instead of one per face.
+    Every local gallery change is pushed to the service as a GalleryDelta,
+    in order, on its own thread. The service is only used while it serves
+    the same gallery version as the local snapshot (in_sync); otherwise,
+    e.g. right after an enrollment or when the service was started from an
+    older file, matching stays local.
+    """
+    CONFIG_FILE = "recognition.json"  # {"url": "http://host:8770", "k": 2, "timeout": 2}
+    MIN_COOLDOWN = 5.0  # Seconds
+    MAX_COOLDOWN = 120.0
+    RECHECK_INTERVAL = 60.0  # Seconds between /health checks while the versions differ
+
+    def __init__(self, url, k=2, timeout=2):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.k = k
+        self.timeout = timeout
+        self.connection = None
+        self.lock = threading.Lock()
+        self.failures = 0  # Consecutive failed requests
+        self.retry_at = 0.0  # time.monotonic() before which the service is not tried
+        self.version = None  # Gallery version the service serves, None until asked
+        self.check_at = 0.0  # time.monotonic() of the next /health check while out of sync
+        self.updates = concurrent.futures.ThreadPoolExecutor(max_workers=1)  # Pushes, in gallery order
+
+    @classmethod
+    def from_config(cls, path=None):
+        """Client configured by recognition.json, or None when matching is local or the file is invalid"""
+        path = path or cls.CONFIG_FILE
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as f:
+                config = json.load(f)
+            if not isinstance(config, dict):
+                raise ValueError("expected a JSON object")
+            url = config.get("url")
+            if not isinstance(url, str) or not url.startswith("http://") or not urlparse(url).hostname:
+                raise ValueError('"url" must be an http:// URL')
+            k = int(config.get("k", 2))
+            timeout = float(config.get("timeout", 2))
+            if k < 2 or timeout <= 0:
+                raise ValueError('"k" must be at least 2 and "timeout" positive')
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Error in {path}: {e}; matching against the local gallery")
+            return None
+        return cls(url, k=k, timeout=timeout)
+
+    def available(self):
+        """False while cooling down after a failure"""
+        return time.monotonic() >= self.retry_at
+
+    def _failed(self):
+        self.failures += 1
+        cooldown = min(self.MIN_COOLDOWN * 2 ** (self.failures - 1), self.MAX_COOLDOWN)
+        self.retry_at = time.monotonic() + cooldown
+
+    def _request(self, method, path, payload=None, expected=(200,)):
+        """(status, JSON reply) over the kept-alive connection; other statuses raise"""
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        with self.lock:
+            try:
+                for attempt in range(2):
+                    reused = self.connection is not None
+                    if not reused:
+                        self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                    try:
+                        self.connection.request(method, path, body, headers)
+                        response = self.connection.getresponse()
+                        data = json.loads(response.read())
+                        break
+                    except (http.client.HTTPException, OSError):
+                        self.connection.close()
+                        self.connection = None
+                        # Only a kept-alive connection the server closed is worth one reconnect
+                        if attempt or not reused:
+                            raise
+                if response.status not in expected:
+                    raise RuntimeError(data.get("error", f"HTTP {response.status}"))
+            except Exception:
+                self._failed()
+                raise
+            self.failures = 0
+        return response.status, data
+
+    def match(self, encodings):
+        """[[(name, distance), ...] per encoding], closest first"""
+        _, data = self._request("POST", "/match", {
+            "encodings": [base64.b64encode(np.asarray(e, dtype=np.float32).tobytes()).decode("ascii")
+                          for e in encodings],
+            "k": self.k
+        })
+        return [[(name, distance) for name, distance in matches] for matches in data["matches"]]
+
+    def in_sync(self, gallery):
+        """True when the service serves this gallery's version; asks it again now and then while not"""
+        now = time.monotonic()
+        if self.version != gallery.version and self.available() and now >= self.check_at:
+            self.check_at = now + self.RECHECK_INTERVAL
+            try:
+                _, health = self._request("GET", "/health")
+                self.version = health.get("version")
+                if self.version != gallery.version:
+                    print(f"Recognition service serves gallery v{self.version}, this kiosk has "
+                          f"v{gallery.version}: matching locally")
+            except Exception as e:
+                print(f"Recognition service error: {e}")
+        return self.version == gallery.version
+
+    def push(self, previous, gallery):
+        """Send the change between two snapshots to the service (queued, one at a time)"""
+        self.check_at = time.monotonic() + self.RECHECK_INTERVAL  # The push will tell us the version
+        return self.updates.submit(self._push, previous, gallery)
+
+    def _push(self, previous, gallery):
+        try:
+            status, data = self._request("POST", "/update", GalleryDelta.between(previous, gallery),
+                                         expected=(200, 409))
+            self.version = data.get("version")
+            if status == 409:
+                print(f"Recognition service rejected gallery v{gallery.version}: {data.get('error')}; "
+                      f"matching locally until it serves the same gallery")
+        except Exception as e:
+            self.version = None  # in_sync asks /health again later
+            print(f"Error updating the recognition service: {e}")
+
+    def close(self):
+        self.updates.shutdown(wait=True)
+
+
+class Event:
+    """Base of the typed events published on the EventBus"""
+    __slots__ = ("timestamp",)
+
+    def __init__(self):
+        self.timestamp = time.time()
+
+
+class FrameCaptured(Event):
+    __slots__ = ("frame_id", "frame")
+
+    def __init__(self, frame_id, frame):
+        super().__init__()
+        self.frame_id = frame_id
+        self.frame = frame  # Shared, not copied: subscribers must not modify it
+
+
+class FacesDetected(Event):
+    __slots__ = ("frame_id", "locations")
+
+    def __init__(self, frame_id, locations):
+        super().__init__()
+        self.frame_id = frame_id
+        self.locations = locations  # Full-frame (top, right, bottom, left) boxes
+
+
+class IdentityResolved(Event):
+    """A face track's stable identity changed (name is None when it was lost)"""
+    __slots__ = ("track_id", "name", "confidence")
+
+    def __init__(self, track_id, name, confidence):
+        super().__init__()
+        self.track_id = track_id
+        self.name = name
+        self.confidence = confidence
+
+
+class AttendanceRecorded(Event):
+    __slots__ = ("name", "action", "date", "time")
+
+    def __init__(self, name, action, date, time):
+        super().__init__()
+        self.name = name
+        self.action = action  # "Check-in" or "Check-out"
+        self.date = date
+        self.time = time
+
+
+class GalleryUpdated(Event):
+    """
+    The live gallery was swapped. op is "add", "remove" or "delta"; source
+    tells local changes from ones that arrived by replication or delta file.
+    """
+    __slots__ = ("version", "users", "op", "name", "encoding", "source")
+
+    def __init__(self, version, users, op, name=None, encoding=None, source="local"):
+        super().__init__()
+        self.version = version
+        self.users = users
+        self.op = op
+        self.name = name
+        self.encoding = encoding
+        self.source = source
+
+
+class Subscription:
+    __slots__ = ("name", "event_types", "handler", "policy", "maxsize", "queue", "task", "delivered", "dropped")
+
+    def __init__(self, name, event_types, handler, policy, maxsize):
+        self.name = name
+        self.event_types = tuple(event_types)
+        self.handler = handler
+        self.policy = policy
+        self.maxsize = maxsize
+        self.queue = None  # asyncio.Queue, created on the bus loop
+        self.task = None
+        self.delivered = 0
+        self.dropped = 0
+
+
+class EventBus:
+    """
+    In-process publish/subscribe on an asyncio loop running in its own thread.
+    Every subscriber gets a bounded queue and its own consumer task, so a slow
+    consumer only backs up its own queue. What happens when that queue is full
+    is the subscriber's backpressure policy:
+      BLOCK        the publisher waits for room (nothing may be lost)
+      DROP_OLDEST  the oldest queued event is discarded (latest state wins)
+      DROP_NEWEST  the incoming event is discarded
+    Handlers may be coroutines (run on the loop) or plain functions (run in
+    the loop's thread pool, one at a time per subscriber, in order).
+    publish() is thread-safe and returns at once unless a BLOCK queue is full.
+    close() delivers whatever is still queued before stopping the loop.
+    """
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.lock = threading.Lock()  # Serializes subscribe/unsubscribe only
+        self.subscriptions = []
+        self.routes = {}  # {event class: (subscriptions,)}, replaced wholesale so publish needs no lock
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        self.loop.close()
+
+    def subscribe(self, name, event_types, handler, maxsize=100, policy=DROP_OLDEST):
+        subscription = Subscription(name, event_types, handler, policy, maxsize)
+        asyncio.run_coroutine_threadsafe(self._start(subscription), self.loop).result()
+        with self.lock:
+            self.subscriptions.append(subscription)
+            self._rebuild_routes()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+                self._rebuild_routes()
+        self.loop.call_soon_threadsafe(subscription.task.cancel)
+
+    def _rebuild_routes(self):
+        routes = {}
+        for subscription in self.subscriptions:
+            for event_type in subscription.event_types:
+                routes.setdefault(event_type, []).append(subscription)
+        self.routes = {event_type: tuple(subs) for event_type, subs in routes.items()}
+
+    def has_subscribers(self, event_type):
+        return event_type in self.routes
+
+    def publish(self, event):
+        subscriptions = self.routes.get(type(event))
+        if not subscriptions or self.loop.is_closed():
+            return
+        future = asyncio.run_coroutine_threadsafe(self._dispatch(event, subscriptions), self.loop)
+        # Backpressure: wait until every BLOCK subscriber has room (never from the loop itself)
+        if threading.current_thread() is not self.thread and any(
+                subscription.policy == self.BLOCK for subscription in subscriptions):
+            future.result()
+
+    async def _start(self, subscription):
+        subscription.queue = asyncio.Queue(subscription.maxsize)
+        subscription.task = self.loop.create_task(self._consume(subscription))
+
+    async def _dispatch(self, event, subscriptions):
+        for subscription in subscriptions:
+            queue_ = subscription.queue
+            if subscription.policy == self.BLOCK:
+                await queue_.put(event)
+                continue
+            if queue_.full():
+                subscription.dropped += 1
+                if subscription.policy == self.DROP_NEWEST:
+                    continue
+                queue_.get_nowait()
+                queue_.task_done()  # The dropped event counts as handled for drain()
+            queue_.put_nowait(event)
+
+    async def _consume(self, subscription):
+        while True:
+            event = await subscription.queue.get()
+            try:
+                if asyncio.iscoroutinefunction(subscription.handler):
+                    await subscription.handler(event)
+                else:
+                    await self.loop.run_in_executor(None, subscription.handler, event)
+                subscription.delivered += 1
+            except Exception as e:
+                print(f"Event handler error ({subscription.name}): {e}")
+            finally:
+                subscription.queue.task_done()
+
+    def stats(self):
+        """{subscriber: {"queued", "delivered", "dropped"}}"""
+        return {subscription.name: {
+            "queued": subscription.queue.qsize(),
+            "delivered": subscription.delivered,
+            "dropped": subscription.dropped
+        } for subscription in self.subscriptions}
+
+    def drain(self, subscriptions=None, timeout=5.0):
+        """
+        Wait until the given subscriptions (default: all) have handled every
+        queued event. Returns False on timeout. Never call it from a handler.
+        """
+        if subscriptions is None:
+            subscriptions = list(self.subscriptions)
+        if not subscriptions:
+            return True
+
+        async def joined():
+            await asyncio.gather(*(subscription.queue.join() for subscription in subscriptions))
+
+        try:
+            asyncio.run_coroutine_threadsafe(asyncio.wait_for(joined(), timeout), self.loop).result()
+            return True
+        except (asyncio.TimeoutError, concurrent.futures.TimeoutError):
+            return False
+
+    async def _cancel_consumers(self):
+        tasks = [subscription.task for subscription in self.subscriptions]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self, timeout=5.0):
+        """Deliver what subscribers still have queued (e.g. replication's outbox writes), then stop"""
+        if not self.thread.is_alive():
+            return
+        if not self.drain(timeout=timeout):
+            print(f"Warning: event bus closed with undelivered events: {self.stats()}")
+        asyncio.run_coroutine_threadsafe(self._cancel_consumers(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+class Metrics:
+    """Thread-safe gauges and rolling timings for the recognition pipeline"""
+    def __init__(self, window=100):
+        self.window = window
+        self.lock = threading.Lock()
+        self.gauges = {}  # {name: value}
+        self.timings = {}  # {name: deque of recent values}
+        self.counters = {}  # {name: int}
+
+    def set(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        with self.lock:
+            if name not in self.timings:
+                self.timings[name] = deque(maxlen=self.window)
+            self.timings[name].append(value)
+
+    def snapshot(self):
+        """Plain dict of every metric; timings are summarised as avg/p95/last"""
+        with self.lock:
+            data = dict(self.gauges)
+            data.update(self.counters)
+            for name, values in self.timings.items():
+                if values:
+                    ordered = sorted(values)
+                    data[name] = {
+                        "avg": sum(ordered) / len(ordered),
+                        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                        "last": values[-1],
+                        "count": len(values)
+                    }
+        return data
+
+    def format(self):
+        lines = []
+        for name, value in sorted(self.snapshot().items()):
+            if isinstance(value, dict):
+                lines.append(f"{name}: avg {value['avg']:.1f} | p95 {value['p95']:.1f} | last {value['last']:.1f}")
+            elif isinstance(value, float):
+                lines.append(f"{name}: {value:.2f}")
+            else:
+                lines.append(f"{name}: {value}")
+        return "\n".join(lines)
+
+
+class DetectionCascade:
+    """
+    Tiered face detection, cheapest first:
+      1. OpenCV Haar cascade over the whole (downscaled) frame
+      2. dlib HOG only on padded regions around Haar candidates, to confirm them
+      3. dlib CNN only on small regions HOG could not confirm ("accurate" mode)
+    "hog" mode keeps the original full-frame HOG detection.
+    """
+    MODES = ("hog", "fast", "balanced", "accurate")
+    ROI_PADDING = 0.3  # Fraction of the candidate size added on each side
+    CNN_ROI_SIZE = 150  # CNN regions are resized so their longest side is at most this
+
+    def __init__(self, metrics, mode="balanced", upsample=1):
+        self.metrics = metrics
+        self.mode = mode
+        self.upsample = upsample
+        self._haar = None
+
+    @property
+    def haar(self):
+        if self._haar is None:
+            path = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+            classifier = cv2.CascadeClassifier(path)
+            if classifier.empty():
+                raise RuntimeError(f"Could not load Haar cascade from {path}")
+            self._haar = classifier
+        return self._haar
+
+    def detect(self, rgb):
+        """Face locations as (top, right, bottom, left) in rgb's coordinates"""
+        mode = self.mode
+        if mode != "hog":
+            try:
+                self.haar
+            except Exception as e:
+                print(f"Haar cascade unavailable, using HOG: {e}")
+                self.mode = mode = "hog"
+
+        if mode == "hog":
+            started = time.perf_counter()
+            locations = face_recognition.face_locations(
+                rgb, number_of_times_to_upsample=self.upsample, model="hog")
+            self.metrics.observe("tier_hog_ms", (time.perf_counter() - started) * 1000)
+            return locations
+
+        # Tier 1: Haar on every frame
+        started = time.perf_counter()
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        candidates = self.haar.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=4, minSize=(20, 20))
+        self.metrics.observe("tier1_haar_ms", (time.perf_counter() - started) * 1000)
+        self.metrics.incr("haar_candidates", len(candidates))
+        if len(candidates) == 0:
+            return []
+
+        if mode == "fast":
+            return [(int(y), int(x + w), int(y + h), int(x)) for (x, y, w, h) in candidates]
+
+        locations = []
+        for (x, y, w, h) in candidates:
+            confirmed = self._confirm(rgb, x, y, w, h, use_cnn=(mode == "accurate"))
+            for location in confirmed:
+                if not any(self._overlaps(location, other) for other in locations):
+                    locations.append(location)
+        return locations
+
+    def _confirm(self, rgb, x, y, w, h, use_cnn):
+        """Tier 2 (HOG) on the candidate region, tier 3 (CNN) if HOG finds nothing"""
+        height, width = rgb.shape[:2]
+        pad_x, pad_y = int(w * self.ROI_PADDING), int(h * self.ROI_PADDING)
+        x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+        x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+        roi = np.ascontiguousarray(rgb[y0:y1, x0:x1])
+
+        started = time.perf_counter()
+        found = face_recognition.face_locations(roi, number_of_times_to_upsample=self.upsample, model="hog")
+        self.metrics.observe("tier2_hog_ms", (time.perf_counter() - started) * 1000)
+
+        if not found and use_cnn:
+            started = time.perf_counter()
+            scale = min(1.0, self.CNN_ROI_SIZE / float(max(roi.shape[:2])))
+            small_roi = cv2.resize(roi, (0, 0), fx=scale, fy=scale) if scale < 1.0 else roi
+            found = [tuple(int(v / scale) for v in loc)
+                     for loc in face_recognition.face_locations(small_roi, number_of_times_to_upsample=1, model="cnn")]
+            self.metrics.observe("tier3_cnn_ms", (time.perf_counter() - started) * 1000)
+
+        if not found:
+            self.metrics.incr("haar_rejected")
+        return [(top + y0, right + x0, bottom + y0, left + x0) for (top, right, bottom, left) in found]
+
+    @staticmethod
+    def _overlaps(a, b, threshold=0.5):
+        """IoU test between two (top, right, bottom, left) boxes"""
+        top, bottom = max(a[0], b[0]), min(a[2], b[2])
+        left, right = max(a[3], b[3]), min(a[1], b[1])
+        if bottom <= top or right <= left:
+            return False
+        inter = (bottom - top) * (right - left)
+        area_a = (a[2] - a[0]) * (a[1] - a[3])
+        area_b = (b[2] - b[0]) * (b[1] - b[3])
+        return inter / float(area_a + area_b - inter) > threshold
+
+
+class FrameGeometry:
+    """
+    Maps face boxes between a downscaled detection image and the full frame
+    using exact float scale factors taken from the real image sizes.
+    """
+    RESOLUTIONS = ("small", "full")  # Where landmarks and encodings are computed
+
+    def __init__(self, full_shape, small_shape):
+        self.full_shape = full_shape
+        self.scale_y = full_shape[0] / float(small_shape[0])
+        self.scale_x = full_shape[1] / float(small_shape[1])
+
+    def to_full(self, location):
+        top, right, bottom, left = location
+        return self.clip((int(round(top * self.scale_y)), int(round(right * self.scale_x)),
+                          int(round(bottom * self.scale_y)), int(round(left * self.scale_x))),
+                         self.full_shape)
+
+    def to_small(self, location):
+        top, right, bottom, left = location
+        return (int(round(top / self.scale_y)), int(round(right / self.scale_x)),
+                int(round(bottom / self.scale_y)), int(round(left / self.scale_x)))
+
+    def encoding_view(self, frame, rgb_small, small_locations, resolution="small"):
+        """
+        (RGB image, face boxes in it, box -> full-frame mapping) to run landmarks
+        and encodings on: the downscaled image (fast) or the full frame (more detail)
+        """
+        if resolution == "full":
+            return (cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), [self.to_full(loc) for loc in small_locations],
+                    lambda box: self.clip(box, self.full_shape))
+        return rgb_small, list(small_locations), self.to_full
+
+    @staticmethod
+    def clip(location, shape):
+        """Keep a (top, right, bottom, left) box inside an image of the given shape"""
+        top, right, bottom, left = location
+        height, width = shape[:2]
+        return (min(max(top, 0), height), min(max(right, 0), width),
+                min(max(bottom, 0), height), min(max(left, 0), width))
+
+
+class FaceLandmarks:
+    """
+    dlib 5-point landmarks for one face. Computed once per face and shared by
+    the quality gate (pose), the encoder (alignment) and liveness (face region).
+    The 5-point model is the one face_encodings uses by default, so encodings
+    stay comparable with the gallery.
+    """
+    __slots__ = ("shape", "points")
+    WARMUP_BOX = (60, 200, 180, 80)  # (top, right, bottom, left) inside the synthetic warm-up frame
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.points = [(p.x, p.y) for p in shape.parts()]
+
+    @classmethod
+    def warm_up(cls):
+        """
+        Load the HOG detector, 5-point shape predictor and ResNet encoder and run one
+        inference through each, so the first real face doesn't pay for it
+        """
+        with STARTUP_TIMER.phase("load dlib models"):
+            api = face_recognition.api  # Models are created when the module is imported
+            api.face_detector, api.pose_predictor_5_point, api.face_encoder
+        
+        # Textured synthetic frame: blank images can short-circuit parts of dlib
+        rng = np.random.default_rng(0)
+        synthetic = rng.integers(0, 255, size=(240, 320, 3), dtype=np.uint8)
+        with STARTUP_TIMER.phase("warm-up inference"):
+            face_recognition.face_locations(synthetic, number_of_times_to_upsample=1, model="hog")
+            cls.detect(synthetic, cls.WARMUP_BOX).encode(synthetic)
+
+    @classmethod
+    def detect(cls, rgb, location):
+        api = face_recognition.api
+        return cls(api.pose_predictor_5_point(rgb, api._css_to_rect(location)))
+
+    def encode(self, rgb, num_jitters=1):
+        """128-d encoding reusing these landmarks instead of re-running the predictor"""
+        return np.array(face_recognition.api.face_encoder.compute_face_descriptor(rgb, self.shape, num_jitters))
+
+    def as_dict(self):
+        # Same layout face_recognition.face_landmarks(model="small") returns
+        return {
+            "nose_tip": [self.points[4]],
+            "left_eye": self.points[2:4],
+            "right_eye": self.points[0:2]
+        }
+
+    def bounding_box(self):
+        """(top, right, bottom, left) box around the landmarks, padded to cover the inner face"""
+        xs = [x for x, _ in self.points]
+        ys = [y for _, y in self.points]
+        pad = (max(xs) - min(xs)) // 4
+        return (min(ys) - pad, max(xs) + pad, max(ys) + pad, min(xs) - pad)
+
+
+class LatestSlot:
+    """
+    Thread-safe single-slot hand-off that always holds the newest item.
+    put() overwrites (counting items nobody took), take() blocks until an
+    item newer than the last one taken arrives, latest() reads without
+    consuming. No empty()/get()/put() race, and nothing is paired with
+    the wrong sequence number.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.item = None
+        self.seq = 0  # Sequence number of the item in the slot
+        self.taken_seq = 0
+        self.overwritten = 0
+
+    def put(self, seq, item):
+        with self.condition:
+            if self.seq > self.taken_seq:
+                self.overwritten += 1
+            self.item = item
+            self.seq = seq
+            self.condition.notify_all()
+
+    def take(self, timeout=None):
+        """Newest untaken item, or None on timeout"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.seq > self.taken_seq, timeout):
+                return None
+            self.taken_seq = self.seq
+            return self.item
+
+    def latest(self):
+        with self.condition:
+            return self.item
+
+
+class CapturedFrame:
+    __slots__ = ("seq", "captured_at", "frame")
+
+    def __init__(self, seq, captured_at, frame):
+        self.seq = seq
+        self.captured_at = captured_at  # time.perf_counter() when the camera returned it
+        self.frame = frame  # Read-only and shared by every consumer (see CameraReader)
+
+
+class FrameResult:
+    """Faces found for one captured frame, tagged with that frame's sequence number and capture time"""
+    __slots__ = ("seq", "captured_at", "processed_at", "faces")
+
+    def __init__(self, seq, captured_at, processed_at, faces):
+        self.seq = seq
+        self.captured_at = captured_at
+        self.processed_at = processed_at
+        self.faces = faces  # Result dicts; "detected_seq" is the frame their boxes come from
+
+
+class BoxExtrapolator:
+    """
+    Moves boxes from the frame they were detected on to the frame being
+    shown, using each track's velocity between its last two detections.
+    """
+    def __init__(self, max_frames=10):
+        self.max_frames = max_frames  # Never extrapolate further than this
+        self.tracks = {}  # {track_id: (detected_seq, location, velocity per frame)}
+
+    def update(self, track_id, detected_seq, location):
+        previous = self.tracks.get(track_id)
+        velocity = (0.0, 0.0, 0.0, 0.0)
+        if previous:
+            if detected_seq <= previous[0]:
+                return
+            steps = detected_seq - previous[0]
+            velocity = tuple((now - before) / steps for now, before in zip(location, previous[1]))
+        self.tracks[track_id] = (detected_seq, location, velocity)
+
+    def predict(self, track_id, target_seq):
+        detected_seq, location, velocity = self.tracks[track_id]
+        steps = min(max(target_seq - detected_seq, 0), self.max_frames)
+        return tuple(int(round(v + d * steps)) for v, d in zip(location, velocity))
+
+    def prune(self, live_track_ids):
+        for track_id in list(self.tracks):
+            if track_id not in live_track_ids:
+                del self.tracks[track_id]
+
+
+class CameraReader:
+    """
+    Reads the camera on its own thread so cap.read() never blocks Tk. Each
+    frame gets a sequence number and capture time, goes to the recognition
+    pipeline and any listeners (enrollment, event bus, recorder), and is kept
+    as the newest frame for the display.
+    Frames are shared, not copied per consumer, and marked read-only: anyone
+    who draws on a frame or changes it must work on a copy (the display
+    does, via fit_to_label). The thread owns the capture and releases it
+    when it exits, so release() never races a blocked read().
+    """
+    def __init__(self, cap):
+        self.cap = cap
+        self.frames = LatestSlot()  # Newest CapturedFrame for the display loop
+        self.listeners = []  # Callables taking a CapturedFrame, called on the camera thread
+        self.running = False
+        self.thread = None
+        self.seq = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=2.0):
+        """
+        Ask the thread to finish; it releases the capture after its last read.
+        Returns False if a read is still blocked after timeout (the release
+        then happens when it returns, on the camera thread).
+        """
+        self.running = False
+        if not self.thread:
+            self.cap.release()
+            return True
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            print("Warning: camera read still blocked, it will be released when it returns")
+            return False
+        return True
+
+    def _run(self):
+        try:
+            while self.running:
+                ret, frame = self.cap.read()
+                if not ret:
+                    time.sleep(0.04)
+                    continue
+                frame.setflags(write=False)  # One array for every consumer, see the class docstring
+                self.seq += 1
+                captured = CapturedFrame(self.seq, time.perf_counter(), frame)
+                self.frames.put(self.seq, captured)
+                for listener in self.listeners:
+                    try:
+                        listener(captured)
+                    except Exception as e:
+                        print(f"Camera listener error: {e}")
+        finally:
+            self.cap.release()
+
+
+class DisplayScheduler:
+    """
+    Calls render() on the Tk loop at a target FPS. The next tick is aimed at
+    a fixed deadline, so the callback's own duration is absorbed instead of
+    added on top; if a tick runs late the schedule restarts from now rather
+    than bursting to catch up. While the widget isn't viewable (window
+    minimised or hidden) rendering is skipped and it only checks back slowly.
+    """
+    def __init__(self, widget, render, target_fps=25, hidden_interval_ms=250):
+        self.widget = widget
+        self.render = render
+        self.target_fps = target_fps
+        self.hidden_interval_ms = hidden_interval_ms
+        self.after_id = None
+        self.deadline = None
+        self.late_ticks = 0
+        self.hidden_ticks = 0
+
+    def start(self):
+        self.deadline = time.perf_counter()
+        self._tick()
+
+    def stop(self):
+        if self.after_id:
+            self.widget.after_cancel(self.after_id)
+            self.after_id = None
+
+    def _tick(self):
+        visible = self.widget.winfo_viewable()
+        if visible:
+            try:
+                self.render()
+            except Exception as e:
+                print(f"Display error: {e}")
+        else:
+            self.hidden_ticks += 1
+
+        now = time.perf_counter()
+        if not visible:
+            self.deadline = now
+            delay_ms = self.hidden_interval_ms
+        else:
+            self.deadline += 1.0 / self.target_fps
+            if self.deadline < now:
+                self.late_ticks += 1
+                self.deadline = now
+            delay_ms = (self.deadline - now) * 1000
+        self.after_id = self.widget.after(max(1, int(delay_ms)), self._tick)
+
+
+class LabelSpriteCache:
+    """
+    LRU cache of pre-rendered label text (white text on the bar colour),
+    keyed by (text, colour, font scale). cv2.putText with the Hershey
+    fonts is the expensive part of the overlay, so it only runs on a miss.
+    """
+    FONT = cv2.FONT_HERSHEY_DUPLEX
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.sprites = OrderedDict()  # {key: (BGR image, baseline offset)}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text, color, font_scale):
+        key = (text, color, round(font_scale, 2))
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.sprites.move_to_end(key)
+            self.hits += 1
+            return sprite
+
+        self.misses += 1
+        (width, height), baseline = cv2.getTextSize(text, self.FONT, key[2], 1)
+        image = np.empty((height + baseline + 2, width + 2, 3), dtype=np.uint8)
+        image[:] = color
+        cv2.putText(image, text, (1, height + 1), self.FONT, key[2], (255, 255, 255), 1, cv2.LINE_AA)
+        sprite = (image, height + 1)
+        self.sprites[key] = sprite
+        if len(self.sprites) > self.max_entries:
+            self.sprites.popitem(last=False)
+        return sprite
+
+
+class OverlayRenderer:
+    """
+    Draws face boxes and name bars onto a preview frame. Boxes and bars
+    are plain rectangle fills; the text comes from LabelSpriteCache and is
+    copied into place, so the cost per face is a few small array writes.
+    """
+    BAR_HEIGHT = 35  # At preview scale 1.0
+    TEXT_INSET = 6
+
+    def __init__(self, cache_size=64):
+        self.sprites = LabelSpriteCache(cache_size)
+
+    def draw(self, frame, overlays, scale=1.0):
+        """overlays: [((top, right, bottom, left), label, BGR colour)] in frame coordinates"""
+        for (top, right, bottom, left), label, color in overlays:
+            cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
+            cv2.rectangle(frame, (left, bottom - int(self.BAR_HEIGHT * scale)), (right, bottom), color, cv2.FILLED)
+            image, baseline = self.sprites.get(label, color, 0.8 * scale)
+            # Same text origin as cv2.putText(frame, label, (left + 6, bottom - 6), ...)
+            self._paste(frame, image, left + self.TEXT_INSET - 1, bottom - self.TEXT_INSET - baseline)
+
+    @staticmethod
+    def _paste(frame, image, x, y):
+        """Copy image into frame with its top-left at (x, y), clipped to the frame"""
+        frame_height, frame_width = frame.shape[:2]
+        height, width = image.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, frame_width), min(y + height, frame_height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        frame[y0:y1, x0:x1] = image[y0 - y:y1 - y, x0 - x:x1 - x]
+
+
+class SessionRecorder:
+    """
+    Optional audit recording, enabled by recording.json. Keeps a ring buffer
+    of short video segments under recordings/, each with a JSONL index
+    beside it: a header line, one line per recorded frame with the boxes,
+    names and confidences the pipeline showed for it, and the attendance,
+    identity and gallery events in between. The camera thread only thins
+    and downscales frames; encoding runs on the recorder's own thread, and
+    when it falls behind frames are dropped rather than queued. Closed
+    segments past the age or disk limit are deleted oldest first.
+    replay_session.py lists, extracts and re-runs recordings.
+    """
+    CONFIG_FILE = "recording.json"  # {"fps": 5, "scale": 0.5, "segment_seconds": 300, "max_gb": 5, "retention_days": 14}
+    CODECS = (("mp4v", ".mp4"), ("MJPG", ".avi"))  # First one this OpenCV build can write wins
+    RESULT_MAX_AGE = 1.0  # Seconds; faces from an older result are not attached to a frame
+
+    def __init__(self, events, results=None, directory="recordings", fps=5, scale=0.5,
+                 segment_seconds=300, max_bytes=5 * 1024 ** 3, retention_days=14, codec=None):
+        self.events = events
+        self.results = results  # FaceProcessor.results, sampled for each recorded frame
+        self.directory = directory
+        self.fps = fps
+        self.scale = scale
+        self.segment_seconds = segment_seconds
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self.codecs = [c for c in self.CODECS if c[0] == codec] or list(self.CODECS)
+        self.frames = queue.Queue(maxsize=max(2, int(fps * 2)))  # About two seconds of slack
+        self.pending_events = deque()  # Appended by the bus, drained by the writer thread
+        self.subscription = None
+        self.next_frame_at = 0.0
+        self.dropped = 0
+        self.running = False
+        self.thread = None
+        # Open segment
+        self.writer = None
+        self.index = None
+        self.segment_name = None
+        self.segment_started = 0.0
+        self.segment_frames = 0
+
+    @classmethod
+    def from_config(cls, events, results=None, path=None):
+        """Recorder configured by recording.json, or None when recording is off or the file is invalid"""
+        path = path or cls.CONFIG_FILE
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as f:
+                config = json.load(f)
+            if not isinstance(config, dict):
+                raise ValueError("expected a JSON object")
+            if not config.get("enabled", True):
+                return None
+            settings = {}
+            for key, default in (("fps", 5), ("scale", 0.5), ("segment_seconds", 300),
+                                 ("max_gb", 5), ("retention_days", 14)):
+                value = config.get(key, default)
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or not value > 0:
+                    raise ValueError(f'"{key}" must be a positive number')
+                settings[key] = value
+            if settings["scale"] > 1:
+                raise ValueError('"scale" must be at most 1')
+            directory = config.get("directory", "recordings")
+            codec = config.get("codec")
+            if not isinstance(directory, str) or not directory:
+                raise ValueError('"directory" must be a path')
+            if codec is not None and codec not in [c for c, _ in cls.CODECS]:
+                raise ValueError(f'"codec" must be one of {[c for c, _ in cls.CODECS]}')
+        except (OSError, ValueError) as e:
+            print(f"Error in {path}: {e}; recording is off")
+            return None
+        return cls(events, results,
+                   directory=directory,
+                   fps=settings["fps"],
+                   scale=settings["scale"],
+                   segment_seconds=settings["segment_seconds"],
+                   max_bytes=int(settings["max_gb"] * 1024 ** 3),
+                   retention_days=settings["retention_days"],
+                   codec=codec)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.enforce_retention()
+        # The handler only appends, so BLOCK never holds a publisher up and no attendance event is lost
+        self.subscription = self.events.subscribe(
+            "recorder", (AttendanceRecorded, IdentityResolved, GalleryUpdated), self.pending_events.append,
+            maxsize=256, policy=EventBus.BLOCK)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.subscription:
+            # Events already published (e.g. the last check-out) still belong in this segment
+            if not self.events.drain([self.subscription]):
+                print("Warning: recorder stopped with events still queued on the bus")
+            self.events.unsubscribe(self.subscription)
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=5.0)
+
+    def offer(self, captured):
+        """Camera listener: keep fps frames a second, downscaled, with the faces shown for them"""
+        now = time.time()
+        if now < self.next_frame_at:
+            return
+        self.next_frame_at = max(self.next_frame_at + 1.0 / self.fps, now)
+        if self.scale != 1.0:
+            frame = cv2.resize(captured.frame, (0, 0), fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        else:
+            frame = captured.frame.copy()
+        result = self.results.latest() if self.results else None
+        if result and captured.captured_at - result.captured_at > self.RESULT_MAX_AGE:
+            result = None
+        try:
+            self.frames.put_nowait((captured.seq, now, frame, result))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while self.running or not self.frames.empty():
+            try:
+                item = self.frames.get(timeout=0.5)
+            except queue.Empty:
+                item = None
+            try:
+                if item:
+                    self._write_frame(*item)
+                self._write_events()
+                if self.writer and time.time() - self.segment_started >= self.segment_seconds:
+                    self._close_segment()
+                    self.enforce_retention()
+            except Exception as e:
+                print(f"Recording error: {e}")
+        try:
+            self._write_events()
+            self._close_segment()
+        except Exception as e:
+            print(f"Recording error: {e}")
+
+    def _open_segment(self, frame):
+        height, width = frame.shape[:2]
+        name = datetime.now().strftime("session-%Y%m%d-%H%M%S")
+        for fourcc, extension in self.codecs:
+            video = name + extension
+            writer = cv2.VideoWriter(os.path.join(self.directory, video),
+                                     cv2.VideoWriter_fourcc(*fourcc), self.fps, (width, height))
+            if writer.isOpened():
+                break
+            writer.release()
+        else:
+            raise RuntimeError("no video codec available for recording")
+        self.writer = writer
+        self.index = open(os.path.join(self.directory, name + ".jsonl"), "w", encoding="utf-8", buffering=1)
+        self.segment_name = name
+        self.segment_started = time.time()
+        self.segment_frames = 0
+        self._write_line({"type": "segment", "video": video, "codec": fourcc, "started": self.segment_started,
+                          "fps": self.fps, "scale": self.scale, "width": width, "height": height})
+
+    def _close_segment(self):
+        if not self.writer:
+            return
+        self.writer.release()
+        self.index.close()
+        self.writer = None
+        self.index = None
+        self.segment_name = None
+
+    def _write_line(self, record):
+        # Line-buffered: the index survives a crash up to the last frame written
+        self.index.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def _write_frame(self, seq, wall_time, frame, result):
+        if not self.writer:
+            self._open_segment(frame)
+        self.writer.write(frame)
+        faces = []
+        if result:
+            faces = [{
+                "box": [int(v) for v in face["location"]],  # Full-frame coordinates
+                "name": face["name"],
+                "confidence": round(float(face["confidence"]), 4),
+                "stable": face["stable"],
+                "track": face["track_id"]
+            } for face in result.faces]
+        self._write_line({"type": "frame", "i": self.segment_frames, "seq": seq, "wall": wall_time,
+                          "result_seq": result.seq if result else None, "faces": faces})
+        self.segment_frames += 1
+
+    def _write_events(self):
+        # Events wait for the first frame's segment, so they sit next to the video they explain
+        while self.writer and self.pending_events:
+            event = self.pending_events.popleft()
+            record = {"type": "event", "event": type(event).__name__, "wall": event.timestamp}
+            if isinstance(event, AttendanceRecorded):
+                record.update(name=event.name, action=event.action, date=event.date, time=event.time)
+            elif isinstance(event, IdentityResolved):
+                record.update(track=event.track_id, name=event.name,
+                              confidence=None if event.confidence is None else round(float(event.confidence), 4))
+            else:
+                record.update(version=event.version, users=event.users, op=event.op, name=event.name,
+                              source=event.source)
+            self._write_line(record)
+
+    def segments(self):
+        """Closed segments, oldest first: [(name, [paths], modified, bytes)]"""
+        groups = {}
+        for entry in os.scandir(self.directory):
+            name, extension = os.path.splitext(entry.name)
+            if not name.startswith("session-") or name == self.segment_name:
+                continue
+            if extension not in (".jsonl",) + tuple(e for _, e in self.CODECS):
+                continue
+            stat = entry.stat()
+            paths, modified, size = groups.get(name, ([], 0.0, 0))
+            groups[name] = (paths + [entry.path], max(modified, stat.st_mtime), size + stat.st_size)
+        return sorted(((name,) + group for name, group in groups.items()), key=lambda s: s[0])
+
+    def enforce_retention(self):
+        """Delete segments older than retention_days, then the oldest until under max_bytes"""
+        segments = self.segments()
+        cutoff = time.time() - self.retention_days * 86400
+        total = sum(size for _, _, _, size in segments)
+        for name, paths, modified, size in segments:
+            if modified >= cutoff and total <= self.max_bytes:
                 break
-        
-        if action == "Check-in":
-            if existing_entry and existing_entry["Check-in"] != "":
-                return False, "Already checked in today"
-            
-            if not existing_entry:
-                new_record = {
-                    "Name": name,
-                    "Date": date,
-                    "Check-in": timestamp,
-                    "Check-out": ""
-                }
-                self.attendance_log.append(new_record)
-            else:
-                existing_entry["Check-in"] = timestamp
-                
-            self.save_attendance_data()
-            return True, "Checked in successfully"
-            
-        elif action == "Check-out":
-            if not existing_entry or existing_entry["Check-in"] == "":
-                return False, "Not checked in yet"
-            if existing_entry["Check-out"] != "":
-                return False, "Already checked out today"
-            
-            existing_entry["Check-out"] = timestamp
-            self.save_attendance_data()
-            return True, "Checked out successfully"
-        
-        return False, "Invalid action"
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    print(f"Error removing recording {path}: {e}")
+            total -= size
 
 
 class FaceProcessor:
     """Optimized but reliable face processing"""
+
     def __init__(self, attendance_system):
         self.attendance_system = attendance_system
-        self.frame_queue = queue.Queue(maxsize=1)
-        self.result_queue = queue.Queue(maxsize=1)
+        self.frames = LatestSlot()  # CapturedFrame from the UI loop
+        self.results = LatestSlot()  # FrameResult for the UI loop
         self.running = False
         self.process_thread = None
-        self.last_locations = []
-        self.last_encodings = []
+        self.ready = threading.Event()  # Set after models are loaded and warmed up
+        self.metrics = Metrics()
+        self.detector = DetectionCascade(self.metrics)
+        self.quality_gate = QualityGate(self.metrics)
+        self.last_faces = []  # [(location, liveness region, quality, track)] from the last detection round
+        self.last_detection_seq = 0  # Frame the last_faces boxes were detected on
+        self.tracker = IdentityTracker()
+        self.events = attendance_system.events
+        # Event counts show up with the other pipeline metrics
+        self.events.subscribe("metrics", (FacesDetected, IdentityResolved, AttendanceRecorded, GalleryUpdated),
+                              self._count_event, maxsize=256, policy=EventBus.DROP_OLDEST)
         
         # Tune these for your hardware
         self.downscale_factor = 0.3  # 30% of original size
-        self.detection_every_n_frames = 20  # Process every other frame
+        self.encoding_resolution = "small"  # One of FrameGeometry.RESOLUTIONS, set from the admin settings
+        self.detection_every_n_frames = 5  # Cheap cascade + vote fusion make frequent rounds affordable
         self.frame_counter = 0
 
+    def _count_event(self, event):
+        self.metrics.incr(f"events_{type(event).__name__}")
+        for name, stats in self.events.stats().items():
+            self.metrics.set(f"bus_{name}_dropped", stats["dropped"])
+
     def start(self):
         self.running = True
         self.process_thread = threading.Thread(target=self._process_frames, daemon=True)
@@ -241,11 +2973,31 @@ class FaceProcessor:
         if self.process_thread:
             self.process_thread.join()
 
+    def warm_up(self):
+        """Warm the dlib models (FaceLandmarks.warm_up) and record how long it took"""
+        started = time.perf_counter()
+        FaceLandmarks.warm_up()
+        warmup_ms = (time.perf_counter() - started) * 1000
+        self.metrics.set("warmup_ms", warmup_ms)
+        print(f"Recognition warm-up took {warmup_ms:.0f} ms")
+
     def _process_frames(self):
+        try:
+            self.warm_up()
+        except Exception as e:
+            # Still usable, the first frames will just be slower
+            print(f"Warm-up failed: {e}")
+        finally:
+            self.ready.set()
+        
         while self.running:
             try:
-                frame = self.frame_queue.get(timeout=0.1)
+                captured = self.frames.take(timeout=0.1)
+                if captured is None:
+                    continue
+                frame = captured.frame
                 self.frame_counter += 1
+                self.metrics.set("frames_skipped", self.frames.overwritten)
                 
                 # Process frame
                 small_frame = cv2.resize(frame, (0, 0), 
@@ -255,57 +3007,503 @@ class FaceProcessor:
                 
                 # Only do heavy processing every N frames
                 if self.frame_counter % self.detection_every_n_frames == 0:
-                    face_locations = face_recognition.face_locations(
-                        rgb_small,
-                        number_of_times_to_upsample=1,  # Balanced accuracy/speed
-                        model="hog"
-                    )
+                    detect_started = time.perf_counter()
+                    small_locations = self.detector.detect(rgb_small)
                     
-                    # Scale locations back up
-                    scale = int(1/self.downscale_factor)
-                    self.last_locations = [(top*scale, right*scale, bottom*scale, left*scale) 
-                                         for (top, right, bottom, left) in face_locations]
+                    # Exact float scale factors from the real image sizes
+                    geometry = FrameGeometry(frame.shape, rgb_small.shape)
+                    full_locations = [geometry.to_full(loc) for loc in small_locations]
+                    self.metrics.observe("detect_ms", (time.perf_counter() - detect_started) * 1000)
+                    self.events.publish(FacesDetected(self.frame_counter, full_locations))
                     
-                    # Get encodings for all faces
-                    self.last_encodings = face_recognition.face_encodings(
-                        rgb_small, 
-                        face_locations,
-                        num_jitters=1
-                    )
+                    # Encode on the downscaled image (fast) or the full frame (more detail)
+                    encode_image, encode_locations, to_full = geometry.encoding_view(
+                        frame, rgb_small, small_locations, self.encoding_resolution)
+                    
+                    # One landmark pass per face, shared by the gate, the encoder and liveness
+                    landmarks = [FaceLandmarks.detect(encode_image, loc) for loc in encode_locations]
+                    
+                    # Quality gate: only sharp, big enough, roughly frontal faces get encoded now
+                    decisions = self.quality_gate.evaluate(
+                        frame, full_locations, [l.as_dict() for l in landmarks])
+                    
+                    # Match faces to tracks; only encode faces whose track still needs evidence
+                    tracks = self.tracker.assign(full_locations, decisions)
+                    faces = []
+                    encode_time = 0.0
+                    for i, (decision, quality) in enumerate(decisions):
+                        if decision == QualityGate.DROP:
+                            continue
+                        track = tracks[i]
+                        if decision == QualityGate.ENCODE and self.tracker.should_encode(track):
+                            encode_started = time.perf_counter()
+                            encoding = landmarks[i].encode(encode_image)
+                            encode_time += time.perf_counter() - encode_started
+                            name, confidence = self.attendance_system.recognize_face(encoding)
+                            stable_before = track.stable_name
+                            self.tracker.observe(track, name, confidence)
+                            if track.stable_name != stable_before:
+                                self.events.publish(IdentityResolved(
+                                    track.track_id, track.stable_name, track.stable_confidence))
+                        elif decision == QualityGate.ENCODE:
+                            self.metrics.incr("encode_skipped_stable")
+                        faces.append((full_locations[i], to_full(landmarks[i].bounding_box()), quality, track))
+                    if encode_time:
+                        self.metrics.observe("encode_ms", encode_time * 1000)
+                    self.last_faces = faces
+                    self.last_detection_seq = captured.seq
                 
-                # Prepare results using cached data
+                # Prepare results from the latest detection round and the tracks' fused identities
                 results = []
-                for (loc, encoding) in zip(self.last_locations, self.last_encodings):
-                    name, confidence = self.attendance_system.recognize_face(encoding)
-                    
+                for (loc, region, quality, track) in self.last_faces:
                     # Only do liveness check on primary face
                     is_live = None
-                    if loc == self.last_locations[0]:  # First face only
-                        is_live = self.attendance_system.detect_liveness(frame, loc)
+                    if loc == self.last_faces[0][0]:  # First face only
+                        is_live = self.attendance_system.detect_liveness(frame, loc, region)
                     
                     results.append({
                         "location": loc,
-                        "name": name,
-                        "confidence": confidence,
-                        "is_live": is_live
+                        "name": track.display_name,
+                        "confidence": track.stable_confidence if track.stable_name else track.last_confidence,
+                        "is_live": is_live,
+                        "quality": quality["score"],
+                        "pending": not track.votes,
+                        "stable": track.stable_name is not None,
+                        "track_id": track.track_id,
+                        "detected_seq": self.last_detection_seq
                     })
                 
-                # Update results
-                if not self.result_queue.empty():
-                    try:
-                        self.result_queue.get_nowait()
-                    except queue.Empty:
-                        pass
-                self.result_queue.put(results)
+                self.results.put(captured.seq, FrameResult(
+                    captured.seq, captured.captured_at, time.perf_counter(), results))
                 
-            except queue.Empty:
-                continue
             except Exception as e:
                 print(f"Processing error: {e}")
                 continue
 
 
+class FaceTrack:
+    """One face followed across detection rounds, with its recent identity votes"""
+    __slots__ = ("track_id", "location", "votes", "stable_name", "stable_confidence",
+                 "last_name", "last_confidence", "missed", "rounds_since_encode")
+
+    def __init__(self, track_id, location, window):
+        self.track_id = track_id
+        self.location = location
+        self.votes = deque(maxlen=window)  # [(name, confidence)]
+        self.stable_name = None
+        self.stable_confidence = 0
+        self.last_name = "Unknown"
+        self.last_confidence = 0
+        self.missed = 0
+        self.rounds_since_encode = 0
+
+    @property
+    def display_name(self):
+        return self.stable_name or self.last_name
+
+
+class IdentityTracker:
+    """
+    Temporal fusion of per-frame recognition results. Each track keeps a
+    sliding window of (name, confidence) votes and only emits an identity
+    once the evidence is strong enough; replacing an established identity
+    needs stronger evidence still (hysteresis), so one noisy frame can't
+    flip it. Stable tracks are re-verified only every few rounds, which
+    saves encodings.
+    """
+    UNKNOWN_WEIGHT = 0.5  # Vote weight of an "Unknown" result (its confidence is 0)
+
+    def __init__(self, window=5, acquire_score=1.2, switch_score=2.0, switch_margin=0.5,
+                 reverify_every=4, max_missed=2):
+        self.window = window
+        self.acquire_score = acquire_score  # e.g. two ~0.6 confidence frames
+        self.switch_score = switch_score
+        self.switch_margin = switch_margin
+        self.reverify_every = reverify_every
+        self.max_missed = max_missed  # Detection rounds a track survives without its face
+        self.tracks = []
+        self._next_id = 1
+
+    def assign(self, locations, decisions=None):
+        """Track for each location (None for dropped faces); unmatched tracks age out"""
+        assigned = [None] * len(locations)
+        free = list(self.tracks)
+        for i, location in enumerate(locations):
+            if decisions is not None and decisions[i][0] == QualityGate.DROP:
+                continue
+            best = None
+            for track in free:
+                if DetectionCascade._overlaps(location, track.location, threshold=0.3):
+                    best = track
+                    break
+            if best is None:
+                best = FaceTrack(self._next_id, location, self.window)
+                self._next_id += 1
+                self.tracks.append(best)
+            else:
+                free.remove(best)
+            best.location = location
+            best.missed = 0
+            assigned[i] = best
+
+        for track in free:
+            track.missed += 1
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+        return assigned
+
+    def should_encode(self, track):
+        """Stable tracks skip encoding except for periodic re-verification"""
+        if track.stable_name and len(track.votes) >= 3 and track.rounds_since_encode < self.reverify_every:
+            track.rounds_since_encode += 1
+            return False
+        track.rounds_since_encode = 0
+        return True
+
+    def observe(self, track, name, confidence):
+        track.votes.append((name, confidence))
+        track.last_name = name
+        track.last_confidence = confidence
+
+        scores = {}
+        for voted, conf in track.votes:
+            weight = self.UNKNOWN_WEIGHT if voted == "Unknown" else conf
+            scores[voted] = scores.get(voted, 0) + weight
+        best = max(scores, key=scores.get)
+
+        if track.stable_name is None:
+            majority = sum(1 for voted, _ in track.votes if voted == best) * 2 > len(track.votes)
+            if best != "Unknown" and majority and scores[best] >= self.acquire_score:
+                track.stable_name = best
+        elif best != track.stable_name:
+            current = scores.get(track.stable_name, 0)
+            if scores[best] >= self.switch_score and scores[best] >= current + self.switch_margin:
+                track.stable_name = None if best == "Unknown" else best
+
+        if track.stable_name:
+            confs = [conf for voted, conf in track.votes if voted == track.stable_name]
+            track.stable_confidence = sum(confs) / len(confs)
+
+
+class QualityGate:
+    """
+    Sits between detection and encoding and decides, per face, whether to
+    encode it now, defer it to a better frame, or drop it altogether.
+    Uses box size, Laplacian sharpness of the crop and landmark pose.
+    """
+    ENCODE, DEFER, DROP = "encode", "defer", "drop"
+
+    def __init__(self, metrics, min_face_px=40, min_sharpness=40.0, min_pose=0.5,
+                 drop_pose=0.15, max_defers=3):
+        self.metrics = metrics
+        self.scorer = FaceQualityScorer(min_sharpness=min_sharpness)
+        self.min_face_px = min_face_px  # Full-resolution face height below which we don't bother
+        self.min_pose = min_pose
+        self.drop_pose = drop_pose  # Profile views this far off never encode well
+        self.max_defers = max_defers  # After this many rounds a deferred face is encoded anyway
+        self.deferred = []  # [(full location, rounds deferred)] from the last round
+
+    def evaluate(self, frame, full_locations, landmarks):
+        """
+        [(decision, quality dict)] aligned with the given full-resolution
+        locations; landmarks are the per-face dicts computed by the caller
+        """
+        if not full_locations:
+            self.deferred = []
+            return []
+
+        started = time.perf_counter()
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        decisions = []
+        still_deferred = []
+        for location, face_landmarks in zip(full_locations, landmarks):
+            quality = self.scorer.score(gray, location, face_landmarks)
+            decision = self.classify(location, quality)
+
+            if decision == self.DEFER:
+                rounds = self._rounds_deferred(location) + 1
+                if rounds > self.max_defers:
+                    decision = self.ENCODE
+                else:
+                    still_deferred.append((location, rounds))
+
+            decisions.append((decision, quality))
+            self.metrics.incr(f"gate_{decision}")
+            self.metrics.observe("quality_score", quality["score"])
+            self.metrics.observe("quality_sharpness", quality["sharpness"])
+
+        self.deferred = still_deferred
+        self.metrics.observe("gate_ms", (time.perf_counter() - started) * 1000)
+        return decisions
+
+    def classify(self, location, quality):
+        """ENCODE, DEFER or DROP from one frame alone (evaluate() adds the deferral rounds)"""
+        height = location[2] - location[0]
+        if height < self.min_face_px or quality["pose"] < self.drop_pose:
+            return self.DROP
+        if quality["sharpness"] < self.scorer.min_sharpness or quality["pose"] < self.min_pose:
+            return self.DEFER
+        return self.ENCODE
+
+    def _rounds_deferred(self, location):
+        for previous, rounds in self.deferred:
+            if DetectionCascade._overlaps(location, previous, threshold=0.3):
+                return rounds
+        return 0
+
+
+class FaceQualityScorer:
+    """Cheap quality metrics for a detected face (sharpness, size, pose)"""
+    def __init__(self, min_sharpness=60.0, min_face_fraction=0.15):
+        self.min_sharpness = min_sharpness  # Laplacian variance of a 100x100 crop
+        self.min_face_fraction = min_face_fraction  # face height / frame height
+
+    def score(self, gray, face_location, landmarks=None):
+        """
+        Score a face crop
+        Args:
+            gray: Grayscale frame the location refers to
+            face_location: (top, right, bottom, left) box
+            landmarks: Optional face_recognition landmark dict for pose
+        Returns:
+            dict with sharpness, size, pose and combined score (0-1)
+        """
+        top, right, bottom, left = face_location
+        top, left = max(0, top), max(0, left)
+        crop = gray[top:bottom, left:right]
+        if crop.size == 0:
+            return {"sharpness": 0.0, "size": 0.0, "pose": 0.0, "score": 0.0}
+
+        small_crop = cv2.resize(crop, (100, 100))
+        sharpness = cv2.Laplacian(small_crop, cv2.CV_64F).var()
+        size = (bottom - top) / float(gray.shape[0])
+        pose = self.pose_score(landmarks) if landmarks else 0.5
+
+        # Each term saturates at 1 so one very good metric can't hide a bad one
+        sharp_term = min(sharpness / (self.min_sharpness * 2), 1.0)
+        size_term = min(size / (self.min_face_fraction * 2), 1.0)
+        return {
+            "sharpness": sharpness,
+            "size": size,
+            "pose": pose,
+            "score": sharp_term * size_term * pose
+        }
+
+    def pose_score(self, landmarks):
+        """Frontal-ness from how centred the nose sits between the eyes (1 = frontal)"""
+        try:
+            left_eye = np.mean(landmarks["left_eye"], axis=0)
+            right_eye = np.mean(landmarks["right_eye"], axis=0)
+            nose = np.mean(landmarks["nose_tip"], axis=0)
+        except (KeyError, TypeError, ValueError):
+            return 0.5
+
+        eye_distance = np.linalg.norm(right_eye - left_eye)
+        if eye_distance == 0:
+            return 0.0
+        eye_mid = (left_eye + right_eye) / 2
+        yaw = abs(nose[0] - eye_mid[0]) / eye_distance
+        return float(max(0.0, 1.0 - 2.0 * yaw))
+
+    def is_acceptable(self, quality):
+        return (quality["sharpness"] >= self.min_sharpness and
+                quality["size"] >= self.min_face_fraction)
+
+
+class EnrollmentSession:
+    """
+    Background registration of one user from the live camera stream.
+    Frames are offered by the UI loop, the best K are encoded in the
+    attendance system's worker pool and progress is exposed for polling.
+    """
+    def __init__(self, attendance_system, name, samples_needed=5,
+                 candidate_pool=15, timeout=20.0, encoding_resolution="full"):
+        self.attendance_system = attendance_system
+        self.name = name
+        self.samples_needed = samples_needed
+        self.candidate_pool = candidate_pool  # How many good frames to collect before picking
+        self.timeout = timeout
+        self.frames = LatestSlot()
+        self.scorer = FaceQualityScorer()
+        self.downscale_factor = 0.25
+        self.encoding_resolution = encoding_resolution  # Templates default to every pixel of the frame
+        self.candidates = []  # [(score, counter, RGB image to encode, location in it)]
+        self.state = "collecting"  # collecting -> encoding -> done / failed
+        self.message = "Look at the camera"
+        self.progress = 0.0
+        self.cancelled = threading.Event()
+        self._counter = 0
+        self._offered = 0  # Sequence number of offered frames
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancelled.set()
+
+    @property
+    def finished(self):
+        return self.state in ("done", "failed")
+
+    def offer_frame(self, frame):
+        """Hand over a camera frame without ever blocking the caller"""
+        if self.state != "collecting":
+            return
+        self._offered += 1
+        self.frames.put(self._offered, frame)
+
+    def _run(self):
+        try:
+            self._collect()
+            if self.cancelled.is_set():
+                self._finish("failed", "Registration cancelled")
+                return
+            if len(self.candidates) < self.samples_needed:
+                self._finish("failed", "Could not get enough clear face samples")
+                return
+            self._encode_best()
+        except Exception as e:
+            print(f"Enrollment error: {e}")
+            self._finish("failed", f"Registration failed: {e}")
+
+    def _collect(self):
+        """Score incoming frames until the candidate pool is full or we time out"""
+        deadline = time.time() + self.timeout
+        while (len(self.candidates) < self.candidate_pool and
+               time.time() < deadline and not self.cancelled.is_set()):
+            frame = self.frames.take(timeout=0.1)
+            if frame is None:
+                continue
+
+            small = cv2.resize(frame, (0, 0), fx=self.downscale_factor, fy=self.downscale_factor)
+            rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+            locations = face_recognition.face_locations(rgb_small, model="hog")
+            if len(locations) != 1:
+                self.message = "Exactly one face must be visible"
+                continue
+
+            # Same landmark model and box mapping as live recognition
+            landmarks = FaceLandmarks.detect(rgb_small, locations[0])
+            gray_small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+            quality = self.scorer.score(gray_small, locations[0], landmarks.as_dict())
+            if not self.scorer.is_acceptable(quality):
+                self.message = "Move closer and hold still"
+                continue
+
+            geometry = FrameGeometry(frame.shape, small.shape)
+            image, encode_locations, _ = geometry.encoding_view(frame, rgb_small, locations, self.encoding_resolution)
+            self._counter += 1
+            self.candidates.append((quality["score"], self._counter, image, encode_locations[0]))
+            self.progress = 0.7 * len(self.candidates) / self.candidate_pool
+            self.message = f"Collecting samples ({len(self.candidates)}/{self.candidate_pool})"
+
+    def _encode_best(self):
+        """Encode the K highest scoring candidates in the worker pool"""
+        self.state = "encoding"
+        self.message = "Encoding best samples"
+        best = sorted(self.candidates, key=lambda c: c[0], reverse=True)[:self.samples_needed]
+        self.candidates = []  # Release the frames we won't use
+
+        encode = lambda rgb, location: FaceLandmarks.detect(rgb, location).encode(rgb)
+        futures = [self.attendance_system.executor.submit(encode, rgb, location) for _, _, rgb, location in best]
+        encodings = []
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            try:
+                encodings.append(future.result())
+            except Exception as e:
+                print(f"Could not encode an enrollment sample: {e}")
+            self.progress = 0.7 + 0.3 * done / len(futures)
+
+        if len(encodings) < self.samples_needed:
+            self._finish("failed", "Could not encode enough face samples")
+        elif self.attendance_system.register_new_user(self.name, encodings):
+            self._finish("done", f"User {self.name} registered successfully!")
+        else:
+            self._finish("failed", f"Could not register {self.name}")
+
+    def _finish(self, state, message):
+        self.message = message
+        self.progress = 1.0
+        self.state = state
+
+
+class PagedTreeview:
+    """
+    Treeview over a ReportSlice that only materializes the current page, so
+    Tk only ever holds page_size rows. Building the slice behind it is
+    linear in the history it covers (see ReportSlice).
+    """
+    def __init__(self, parent, columns, page_size=100, anchor='w', height=None):
+        self.columns = columns
+        self.page_size = page_size
+        self.result = None
+        self.offset = 0
+        
+        self.frame = ttk.Frame(parent)
+        
+        nav = ttk.Frame(self.frame)
+        nav.pack(side='bottom', fill='x', pady=5)
+        ttk.Button(nav, text="<< First", command=lambda: self.go_to(0)).pack(side='left', padx=2)
+        ttk.Button(nav, text="< Prev", command=lambda: self.go_to(self.offset - self.page_size)).pack(side='left', padx=2)
+        ttk.Button(nav, text="Next >", command=lambda: self.go_to(self.offset + self.page_size)).pack(side='left', padx=2)
+        ttk.Button(nav, text="Last >>", command=self.go_to_last).pack(side='left', padx=2)
+        self.page_label = ttk.Label(nav, text="")
+        self.page_label.pack(side='left', padx=10)
+        
+        options = {"columns": columns, "show": "headings"}
+        if height:
+            options["height"] = height
+        self.tree = ttk.Treeview(self.frame, **options)
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=120, anchor=anchor)
+        
+        vsb = ttk.Scrollbar(self.frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vsb.set)
+        self.tree.pack(side='left', fill='both', expand=True)
+        vsb.pack(side='right', fill='y')
+    
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+    
+    def set_result(self, result):
+        self.result = result
+        self.offset = 0
+        self.render()
+    
+    def go_to(self, offset):
+        if self.result is None:
+            return
+        last_page = max(0, (len(self.result) - 1) // self.page_size * self.page_size)
+        self.offset = min(max(0, offset), last_page)
+        self.render()
+    
+    def go_to_last(self):
+        if self.result is not None:
+            self.go_to(len(self.result))
+    
+    def render(self):
+        """Replace the tree contents with the current page"""
+        self.tree.delete(*self.tree.get_children())
+        total = len(self.result) if self.result is not None else 0
+        rows = self.result.rows(self.offset, self.offset + self.page_size) if total else []
+        for values in rows:
+            self.tree.insert("", "end", values=values)
+        
+        if total:
+            self.page_label.config(
+                text=f"Rows {self.offset + 1}-{self.offset + len(rows)} of {total:,}")
+        else:
+            self.page_label.config(text="No records")
+
+
 class AttendanceUI:
+    RESULT_MAX_AGE = 1.0  # Seconds; older results (e.g. processing stalled) are not drawn
+    DISPLAY_FPS = 25  # Preview target, changeable in the admin settings
+    SETTINGS_FILE = "settings.json"  # Admin settings that survive a restart
+
     def __init__(self):
         self.root = tk.Tk()
         self.root.geometry("1280x720+100+50")
@@ -314,14 +3512,28 @@ class AttendanceUI:
         self.root.tk.call('wm', 'iconphoto', self.root._w, tk.PhotoImage(width=1, height=1))
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
-        # Initialize systems
-        self.attendance_system = AttendanceSystem()
+        # Initialize systems (data and models load in the background, see start_background_load)
+        self.attendance_system = AttendanceSystem(load=False)
         self.face_processor = FaceProcessor(self.attendance_system)
-        self.face_processor.start()
+        self.preview_fps = self.DISPLAY_FPS
+        self.load_settings()
+        self.ready = False
+        self.frame_id = 0  # Camera sequence number of the frame on screen
+        self.box_extrapolator = BoxExtrapolator()
+        self.overlay = OverlayRenderer()
+        self.recorder = None  # SessionRecorder when recording.json turns audit recording on
+        
+        # Attendance and gallery changes from any thread (or another site), drained by the render loop
+        self.ui_events = deque(maxlen=64)
+        self.attendance_system.events.subscribe("ui", (AttendanceRecorded, GalleryUpdated), self.ui_events.append,
+                                                maxsize=64, policy=EventBus.DROP_OLDEST)
+        self.first_frame_shown = False
+        
+        # Background registration currently in progress (if any)
+        self.enrollment = None
         
         # Performance tracking
-        self.frame_times = deque(maxlen=10)
-        self.last_frame_time = datetime.now()
+        self.frame_times = deque(maxlen=25)  # perf_counter() of recent paints
         
         # Custom fonts
         self.title_font = tkFont.Font(family="Segoe UI", size=24, weight="bold")
@@ -337,18 +3549,109 @@ class AttendanceUI:
         self.create_admin_button()
         self.create_user_button()
         self.create_logo()
+        STARTUP_TIMER.mark("window built")
         
-        # Webcam init
-        self.cap = cv2.VideoCapture(0)
+        # Let the window paint first, then open the camera and load everything else
+        self.root.after(0, self.start_camera)
+        self.start_background_load()
+        
+        self.root.mainloop()
+    
+    def start_camera(self):
+        """Open the webcam and start the preview (runs once the window is up)"""
+        with STARTUP_TIMER.phase("open camera"):
+            self.cap = cv2.VideoCapture(0)
         if not self.cap.isOpened():
             messagebox.showerror("Error", "Could not open webcam!")
-            self.root.destroy()
+            self.on_close()
+            return
+        
+        # Camera on its own thread; recognition, enrollment and the bus get every frame from it
+        self.camera = CameraReader(self.cap)
+        self.camera.listeners.append(lambda captured: self.face_processor.frames.put(captured.seq, captured))
+        self.camera.listeners.append(self.offer_enrollment_frame)
+        self.camera.listeners.append(
+            lambda captured: self.attendance_system.events.publish(FrameCaptured(captured.seq, captured.frame)))
+        try:
+            self.recorder = SessionRecorder.from_config(self.attendance_system.events, self.face_processor.results)
+            if self.recorder:
+                self.recorder.start()
+                self.camera.listeners.append(self.recorder.offer)
+        except Exception as e:
+            print(f"Error starting session recording: {e}")
+            self.recorder = None
+        self.camera.start()
+        
+        # Paint at the target FPS, independent of camera and recognition cadence
+        self.display = DisplayScheduler(self.webcam_label, self.process_webcam, target_fps=self.preview_fps)
+        self.display.start()
+    
+    def offer_enrollment_frame(self, captured):
+        """Camera thread: feed an active registration from the same stream"""
+        enrollment = self.enrollment
+        if enrollment:
+            enrollment.offer_frame(captured.frame)
+    
+    def fit_to_label(self, frame):
+        """Downscale a frame to the preview label (never upscale); returns (image, scale)"""
+        width = self.webcam_label.winfo_width()
+        height = self.webcam_label.winfo_height()
+        frame_height, frame_width = frame.shape[:2]
+        if width <= 1 or height <= 1:
+            return frame.copy(), 1.0  # Not laid out yet
+        scale = min(width / frame_width, height / frame_height)
+        if scale >= 1.0:
+            return frame.copy(), 1.0
+        size = (max(1, int(frame_width * scale)), max(1, int(frame_height * scale)))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA), scale
+    
+    def start_background_load(self):
+        """Load data files and recognition models off the Tk thread"""
+        def load():
+            with STARTUP_TIMER.phase("load gallery + attendance"):
+                self.attendance_system.load_data()
+            # Touching the module pulls in dlib and its models
+            face_recognition.face_locations
+        
+        self.startup_future = self.attendance_system.executor.submit(load)
+        self.status.config(text="Starting up | Loading users and recognition models...")
+        self.root.after(100, self.check_startup)
+    
+    def check_startup(self):
+        """Poll the background load and switch the UI to ready when it's done"""
+        if not self.startup_future.done():
+            self.root.after(100, self.check_startup)
             return
         
-        # Start webcam processing
-        self.process_webcam()
+        error = self.startup_future.exception()
+        if error:
+            print(f"Startup error: {error}")
+            self.status.config(text=f"Startup failed: {error}")
+            return
         
-        self.root.mainloop()
+        self.update_stats()
+        self.status.config(text="Starting up | Warming up recognition models...")
+        self.face_processor.start()
+        self.root.after(100, self.check_recognition_ready)
+    
+    def check_recognition_ready(self):
+        """Recognition only counts as ready once the worker has warmed up its models"""
+        if not self.face_processor.ready.is_set():
+            self.root.after(100, self.check_recognition_ready)
+            return
+        
+        self.ready = True
+        warmup_ms = self.face_processor.metrics.snapshot().get("warmup_ms", 0)
+        self.status.config(text=f"System Ready | {len(self.attendance_system.known_face_names)} users registered | Warm-up {warmup_ms:.0f} ms | Last sync: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        STARTUP_TIMER.mark("ready")
+        print(STARTUP_TIMER.report())
+    
+    def require_ready(self):
+        """Guard for actions that need the gallery and models"""
+        if not self.ready:
+            messagebox.showwarning("Please wait", "The system is still starting up.")
+            return False
+        return True
     
     def kill_feather_icon(self):
         try:
@@ -360,9 +3663,27 @@ class AttendanceUI:
     
     def on_close(self):
         """Cleanup on window close"""
+        if hasattr(self, 'startup_future'):
+            self.startup_future.cancel()
+        if self.enrollment:
+            self.enrollment.cancel()
+        if hasattr(self, 'display'):
+            self.display.stop()
+        if hasattr(self, 'camera'):
+            self.camera.stop()  # Releases the capture from the camera thread
         self.face_processor.stop()
-        if hasattr(self, 'cap') and self.cap.isOpened():
-            self.cap.release()
+        self.attendance_system.attendance_writer.shutdown(wait=True)  # Let a pending save finish
+        if self.recorder:
+            self.recorder.stop()  # After the last attendance event; closes the segment so it stays playable
+        if self.attendance_system.replication:
+            self.attendance_system.replication.stop()
+        if self.attendance_system.gallery_updates:
+            self.attendance_system.gallery_updates.stop()
+        if self.attendance_system.remote_recognizer:
+            self.attendance_system.remote_recognizer.close()  # Finish pushing gallery changes
+        self.attendance_system.events.close()  # Drains queued AttendanceRecorded into the replication outbox
+        if not hasattr(self, 'camera') and hasattr(self, 'cap') and self.cap.isOpened():
+            self.cap.release()  # Opened but the reader never took it over
         self.root.destroy()
     
     def create_main_container(self):
@@ -397,58 +3718,68 @@ class AttendanceUI:
                                  bg='#333', fg='white',
                                  font=self.small_font)
         self.fps_label.place(x=10, y=450)
+        
+        # Enrollment progress (replaces the modal per-sample dialogs)
+        self.enrollment_label = tk.Label(self.webcam_container,
+                                        bg='#333', fg='#2196F3',
+                                        font=self.small_font)
+        self.enrollment_label.place(x=10, y=40)
     
     def process_webcam(self):
-        """Process webcam frames with performance optimizations"""
-        start_time = datetime.now()
+        """Render the newest camera frame with the newest results (called by the DisplayScheduler)"""
+        self.handle_ui_events()
+        if self.enrollment:
+            self.update_enrollment_progress()
         
-        # Capture frame
-        ret, frame = self.cap.read()
-        if not ret:
-            self.webcam_label.after(40, self.process_webcam)
+        # Nothing new from the camera: the label already shows this frame
+        captured = self.camera.frames.latest()
+        if captured is None or captured.seq == self.frame_id:
             return
+        render_started = time.perf_counter()
+        self.frame_id = captured.seq
+        captured_at = captured.captured_at
         
-        # Put frame in processing queue (replace if not empty)
-        if not self.face_processor.frame_queue.empty():
-            try:
-                self.face_processor.frame_queue.get_nowait()
-            except queue.Empty:
-                pass
-        self.face_processor.frame_queue.put(frame.copy())
+        # Draw on a preview-sized copy: every later step scales with its pixel count
+        frame, scale = self.fit_to_label(captured.frame)
         
-        # Get processing results if available
+        # Newest result; its boxes are moved from their source frame to this one
+        frame_result = self.face_processor.results.latest()
         face_results = []
-        try:
-            face_results = self.face_processor.result_queue.get_nowait()
-        except queue.Empty:
-            pass
+        if frame_result and captured_at - frame_result.captured_at < self.RESULT_MAX_AGE:
+            face_results = frame_result.faces
+        for result in face_results:
+            self.box_extrapolator.update(result["track_id"], result["detected_seq"], result["location"])
+        self.box_extrapolator.prune({result["track_id"] for result in face_results})
         
-        # Draw face boxes and labels
+        # Collect face boxes and labels, then draw them in one overlay pass
         current_user = None
         highest_confidence = 0
+        overlays = []
         
         for result in face_results:
-            top, right, bottom, left = result["location"]
+            top, right, bottom, left = (int(v * scale) for v in
+                                        self.box_extrapolator.predict(result["track_id"], self.frame_id))
             name = result["name"]
             confidence = result["confidence"]
             is_live = result["is_live"]
             
-            # Track user with highest confidence
-            if name != "Unknown" and confidence > highest_confidence:
+            # Only a stable (multi-frame) identity can be checked in
+            if result.get("stable") and confidence > highest_confidence:
                 current_user = name
                 highest_confidence = confidence
             
-            # Draw face rectangle
             color = (0, 255, 0) if is_live else (0, 0, 255)
-            cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
-            
-            # Draw label background
-            cv2.rectangle(frame, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
-            
-            # Draw name and confidence
-            label = f"{name}"
-            cv2.putText(frame, label, (left + 6, bottom - 6), 
-                       cv2.FONT_HERSHEY_DUPLEX, 0.8, (255, 255, 255), 1)
+            if result.get("pending"):
+                label = "Checking..."
+            elif result.get("stable") or name == "Unknown":
+                label = f"{name}"
+            else:
+                label = f"{name}?"
+            overlays.append(((top, right, bottom, left), label, color))
+        
+        overlay_started = time.perf_counter()
+        self.overlay.draw(frame, overlays, scale)
+        self.face_processor.metrics.observe("overlay_ms", (time.perf_counter() - overlay_started) * 1000)
         
         # Update current user display
         if current_user:
@@ -466,15 +3797,24 @@ class AttendanceUI:
         # Update label
         self.webcam_label.imgtk = imgtk
         self.webcam_label.configure(image=imgtk)
+        if not self.first_frame_shown:
+            self.first_frame_shown = True
+            STARTUP_TIMER.mark("first camera frame shown")
         
-        # Calculate and display FPS
-        frame_time = (datetime.now() - start_time).total_seconds()
-        self.frame_times.append(frame_time)
-        avg_fps = 1 / (sum(self.frame_times) / len(self.frame_times)) if self.frame_times else 0
-        self.fps_label.config(text=f"FPS: {avg_fps:.1f}")
+        # End-to-end latency, measured per frame
+        metrics = self.face_processor.metrics
+        shown_at = time.perf_counter()
+        metrics.observe("capture_to_display_ms", (shown_at - captured_at) * 1000)
+        if face_results:
+            metrics.observe("result_capture_to_display_ms", (shown_at - frame_result.captured_at) * 1000)
+            metrics.observe("result_lag_frames", self.frame_id - frame_result.seq)
         
-        # Repeat every 40ms (25 FPS target)
-        self.webcam_label.after(100, self.process_webcam)
+        # Displayed FPS from the actual paint times, plus the cost of one paint
+        self.frame_times.append(shown_at)
+        if len(self.frame_times) > 1:
+            avg_fps = (len(self.frame_times) - 1) / max(self.frame_times[-1] - self.frame_times[0], 1e-6)
+            self.fps_label.config(text=f"FPS: {avg_fps:.1f}")
+        metrics.observe("render_ms", (shown_at - render_started) * 1000)
     
     def create_control_panel(self):
         """Create the right-side control panel"""
@@ -518,25 +3858,40 @@ class AttendanceUI:
         
         # Update stats
         self.update_stats()
+        self.schedule_stats_rollover()
+    
+    def handle_ui_events(self):
+        """Apply bus events on the Tk thread (Tk widgets must not be touched from other threads)"""
+        stats_changed = False
+        gallery_event = None
+        while self.ui_events:
+            event = self.ui_events.popleft()
+            if isinstance(event, AttendanceRecorded):
+                stats_changed = True
+            elif isinstance(event, GalleryUpdated):
+                gallery_event = event
+        if stats_changed:
+            self.update_stats()
+        if gallery_event and self.ready:
+            self.status.config(text=f"System Ready | {gallery_event.users} users registered | Gallery v{gallery_event.version} | Last sync: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
     def update_stats(self):
         """Update the statistics display"""
-        today = datetime.now().strftime("%Y-%m-%d")
-        checked_in = 0
-        pending = 0
-        
-        for record in self.attendance_system.attendance_log:
-            if record["Date"] == today:
-                if record["Check-in"] != "":
-                    checked_in += 1
-                if record["Check-out"] == "" and record["Check-in"] != "":
-                    pending += 1
+        checked_in, pending = self.attendance_system.daily_stats.counts()
         
         self.checked_in_label.config(text=str(checked_in))
         self.pending_label.config(text=str(pending))
+    
+    def schedule_stats_rollover(self):
+        """Refresh the stats just after midnight so the counters reset on screen"""
+        now = datetime.now()
+        next_midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        delay_ms = int((next_midnight - now).total_seconds() * 1000) + 1000
         
-        # Update every minute
-        self.root.after(60000, self.update_stats)
+        def rollover():
+            self.update_stats()
+            self.schedule_stats_rollover()
+        self.root.after(delay_ms, rollover)
     
     def create_status_bar(self):
         """Create the status bar at bottom"""
@@ -622,37 +3977,38 @@ class AttendanceUI:
             messagebox.showwarning("Warning", message)
     
     def register_user(self):
-        """Register a new user with face capture"""
+        """Start a background registration that samples the live feed"""
+        if not self.require_ready():
+            return
+        if self.enrollment and not self.enrollment.finished:
+            messagebox.showwarning("Warning", f"Still registering {self.enrollment.name}")
+            return
+        
         name = simpledialog.askstring("Register New User", "Enter user's full name:", parent=self.root)
         if not name:
             return
         
-        # Capture face samples
-        samples = []
-        messagebox.showinfo("Instructions", "Please look directly at the camera. We'll capture 5 samples.")
+        self.enrollment = EnrollmentSession(self.attendance_system, name).start()
+        self.enrollment_label.config(text=f"Registering {name}: look at the camera")
+    
+    def update_enrollment_progress(self):
+        """Reflect the registration state in the UI without blocking the feed"""
+        session = self.enrollment
+        if not session.finished:
+            self.enrollment_label.config(
+                text=f"Registering {session.name}: {session.message} ({session.progress:.0%})")
+            return
         
-        for i in range(5):
-            ret, frame = self.cap.read()
-            if ret:
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                face_locations = face_recognition.face_locations(rgb_frame)
-                
-                if len(face_locations) == 1:
-                    face_encoding = face_recognition.face_encodings(rgb_frame, face_locations)[0]
-                    samples.append(face_encoding)
-                    messagebox.showinfo("Sample Captured", f"Sample {i+1}/5 captured")
-                else:
-                    messagebox.showerror("Error", "Could not detect face. Please try again.")
-                    return
-        
-        if len(samples) == 5:
-            success = self.attendance_system.register_new_user(name, samples)
-            if success:
-                messagebox.showinfo("Success", f"User {name} registered successfully!")
-                self.status.config(text=f"System Ready | {len(self.attendance_system.known_face_names)} users registered | Last sync: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        self.enrollment = None
+        self.enrollment_label.config(text=session.message)
+        self.root.after(4000, lambda: self.enrollment_label.config(text=""))
+        if session.state == "done":
+            self.status.config(text=f"System Ready | {len(self.attendance_system.known_face_names)} users registered | Last sync: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
                 
     def request_password(self):
         """Request admin password and verify"""
+        if not self.require_ready():
+            return
         password = simpledialog.askstring("Admin Authentication", 
                                         "Enter Admin Password:", 
                                         show='*',
@@ -721,34 +4077,17 @@ class AttendanceUI:
         ttk.Button(date_frame, text="Filter", 
                   command=lambda: self.filter_attendance(tree)).pack(side='left', padx=10)
         
-        # Treeview for data display
+        # Paged view: only the visible page of the report is ever inserted
         columns = ("Date", "Name", "Check-in", "Check-out", "Hours")
-        tree = ttk.Treeview(reports_frame, columns=columns, show="headings")
-        
-        for col in columns:
-            tree.heading(col, text=col)
-            tree.column(col, width=120)
-        
-        vsb = ttk.Scrollbar(reports_frame, orient="vertical", command=tree.yview)
-        tree.configure(yscrollcommand=vsb.set)
-        tree.pack(side='left', fill='both', expand=True)
-        vsb.pack(side='right', fill='y')
-        
-        # Insert data
-        for record in sorted(self.attendance_system.attendance_log, 
-                           key=lambda x: x["Date"], reverse=True):
-            hours = self.calculate_hours(record["Check-in"], record["Check-out"])
-            tree.insert("", "end", values=(
-                record["Date"],
-                record["Name"],
-                record["Check-in"],
-                record["Check-out"],
-                f"{hours:.1f}" if hours else ""
-            ))
+        tree = PagedTreeview(reports_frame, columns)
+        tree.pack(fill='both', expand=True)
+        tree.set_result(self.attendance_system.analytics.report_slice())
         
-        # Export button
-        ttk.Button(reports_frame, text="Export to Excel", 
-                  command=lambda: self.export_to_excel(tree)).pack(pady=10)
+        # Export controls
+        self.report_range = (None, None)  # Dates of the last filter, for exports
+        self.create_export_bar(reports_frame,
+                               lambda: self.attendance_system.analytics.report_partitions(*self.report_range),
+                               columns, "attendance_report").pack(pady=10)
         
         # --- Tab 2: User Management ---
         user_frame = ttk.Frame(notebook)
@@ -779,53 +4118,56 @@ class AttendanceUI:
         self.confidence_slider = ttk.Scale(settings_frame, from_=0.5, to=1.0, 
                                          value=self.attendance_system.min_confidence)
         self.confidence_slider.pack(pady=5)
+        # Calibrated users are matched against their own threshold, not this slider
+        names = self.attendance_system.known_face_names
+        calibrated = self.attendance_system.calibration.calibrated_count(names)
+        if calibrated:
+            ttk.Label(settings_frame,
+                     text=f"Applies to {len(set(names)) - calibrated} of {len(set(names))} users; "
+                          f"{calibrated} calibrated users use their own thresholds (see calibrate.py)",
+                     foreground='#666').pack()
+        
+        # Face detector cascade
+        ttk.Label(settings_frame, text="Face Detector:").pack(pady=5)
+        self.detector_mode = tk.StringVar(value=self.face_processor.detector.mode)
+        ttk.Combobox(settings_frame, textvariable=self.detector_mode, 
+                    values=DetectionCascade.MODES, state="readonly").pack(pady=5)
+        ttk.Label(settings_frame, 
+                 text="hog: full-frame HOG | fast: Haar only | balanced: Haar + HOG | accurate: + CNN on small regions",
+                 foreground='#666').pack()
+        
+        ttk.Label(settings_frame, text="Encoding Resolution:").pack(pady=5)
+        self.encoding_resolution = tk.StringVar(value=self.face_processor.encoding_resolution)
+        ttk.Combobox(settings_frame, textvariable=self.encoding_resolution,
+                    values=FrameGeometry.RESOLUTIONS, state="readonly").pack(pady=5)
+        ttk.Label(settings_frame,
+                 text="small: encode the downscaled frame (fast) | full: encode the full frame (more detail, slower)",
+                 foreground='#666').pack()
+        
+        ttk.Label(settings_frame, text="Preview FPS:").pack(pady=(10, 5))
+        self.display_fps = tk.IntVar(value=self.display.target_fps if hasattr(self, 'display') else self.preview_fps)
+        ttk.Spinbox(settings_frame, from_=5, to=60, increment=5, textvariable=self.display_fps,
+                   width=5, state="readonly").pack(pady=5)
         
         ttk.Button(settings_frame, text="Save Settings", 
                   command=self.save_settings).pack(pady=10)
+        
+        # Live recognition metrics (warm-up time, per-stage latency)
+        ttk.Label(settings_frame, text="Recognition Metrics:").pack(pady=(15, 5))
+        metrics_label = ttk.Label(settings_frame, text="", justify='left', font=("Consolas", 9))
+        metrics_label.pack(pady=5)
+        
+        def refresh_metrics():
+            try:
+                metrics_label.config(text=self.face_processor.metrics.format() or "No data yet")
+                metrics_label.after(1000, refresh_metrics)
+            except tk.TclError:
+                pass  # Admin window closed
+        refresh_metrics()
         #tab 4
         hours_frame = ttk.Frame(notebook)
         notebook.add(hours_frame, text="Working Hours")
 
-        # Calculate weekly averages with Friday "laziness"
-        def get_weekly_hours():
-            weekly_hours = {"Mon": [], "Tue": [], "Wed": [], "Thu": [], "Fri": []}  # Store all hours per day
-            
-            for record in self.attendance_system.attendance_log:
-                if record["Check-in"] and record["Check-out"]:
-                    try:
-                        day = datetime.strptime(record["Date"], "%Y-%m-%d").strftime("%a")
-                        if day in weekly_hours:
-                            # Parse times (now handles both date+time and time-only formats)
-                            try:
-                                check_in = datetime.strptime(record["Check-in"], "%Y-%m-%d %H:%M:%S").time()
-                                check_out = datetime.strptime(record["Check-out"], "%Y-%m-%d %H:%M:%S").time()
-                            except:
-                                check_in = datetime.strptime(record["Check-in"], "%H:%M:%S").time()
-                                check_out = datetime.strptime(record["Check-out"], "%H:%M:%S").time()
-                            
-                            # Calculate hours worked
-                            hours = (datetime.combine(datetime.min, check_out) - 
-                                    datetime.combine(datetime.min, check_in)).seconds / 3600
-                            
-                            # Apply "Friday effect" (reduce hours by 10-30% randomly)
-                            if day == "Fri":
-                                hours *= random.uniform(0.7, 0.9)
-                            
-                            weekly_hours[day].append(hours)
-                    except Exception as e:
-                        print(f"Error processing record: {e}")
-                        continue
-            
-            # Calculate averages and standard deviations
-            return {
-                day: {
-                    "avg": np.mean(hours) if hours else 0,
-                    "std": np.std(hours) if hours else 0,
-                    "count": len(hours)
-                }
-                for day, hours in weekly_hours.items()
-            }
-
         # Draw enhanced chart
         chart_placeholder = tk.Canvas(hours_frame, bg='white', height=350)
         chart_placeholder.pack(fill='both', expand=True, padx=20, pady=20)
@@ -835,7 +4177,8 @@ class AttendanceUI:
                                     text="Weekly Average", 
                                     font=('Helvetica', 12, 'bold'))
 
-        weekly_stats = get_weekly_hours()
+        # Weekly averages from the recorded hours
+        weekly_stats = self.attendance_system.analytics.weekly_hours()
         days_order = ["Mon", "Tue", "Wed", "Thu", "Fri"]
         colors = ['#4CAF50', '#4CAF50', '#4CAF50', '#4CAF50', '#FF9800']  # Friday gets orange
 
@@ -886,58 +4229,33 @@ class AttendanceUI:
             else:
                 messagebox.showerror("Access Denied", "Incorrect password!") 
 
-        def get_overtime_data():
-            overtime = []
-            for record in self.attendance_system.attendance_log:
-                if record["Check-in"] and record["Check-out"]:
-                    try:
-                        check_in = datetime.strptime(record["Check-in"], "%H:%M:%S")
-                        check_out = datetime.strptime(record["Check-out"], "%H:%M:%S")
-                        total_hours = (check_out - check_in).seconds / 3600
-                        if total_hours > 8:
-                            overtime.append((
-                                record["Name"],
-                                record["Date"],
-                                f"{total_hours - 8:.1f}"
-                            ))
-                    except:
-                        continue
-            return overtime
-
         # Populate table with REAL overtime data
         columns = ("Name", "Date", "Overtime Hours")
-        tree = ttk.Treeview(overtime_frame, columns=columns, show="headings", height=15)
-
-        for col in columns:
-            tree.heading(col, text=col)
-            tree.column(col, width=120, anchor='center')
-
-        for record in get_overtime_data():
-            tree.insert("", "end", values=record)
-
-        tree.pack(fill='both', expand=True, padx=10, pady=10)
+        overtime_view = PagedTreeview(overtime_frame, columns, anchor='center', height=15)
+        overtime_view.pack(fill='both', expand=True, padx=10, pady=10)
+        overtime_view.set_result(self.attendance_system.analytics.overtime_slice())
     
-    def filter_attendance(self, tree):
+    def filter_attendance(self, view):
         """Filter attendance records by date range"""
-        start_date = self.start_date.get()
-        end_date = self.end_date.get()
-        
-        # Clear existing items
-        for item in tree.get_children():
-            tree.delete(item)
-        
-        # Filter and insert records
-        for record in self.attendance_system.attendance_log:
-            if (not start_date or record["Date"] >= start_date) and \
-               (not end_date or record["Date"] <= end_date):
-                hours = self.calculate_hours(record["Check-in"], record["Check-out"])
-                tree.insert("", "end", values=(
-                    record["Date"],
-                    record["Name"],
-                    record["Check-in"],
-                    record["Check-out"],
-                    f"{hours:.1f}" if hours else ""
-                ))
+        dates = []
+        for entry in (self.start_date, self.end_date):
+            value = entry.get().strip()
+            if not value:
+                dates.append(None)  # Open-ended range
+                continue
+            try:
+                dates.append(datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d"))
+            except ValueError:
+                messagebox.showerror("Error", f"Invalid date '{value}', use YYYY-MM-DD")
+                return
+        start_date, end_date = dates
+        if start_date and end_date and start_date > end_date:
+            messagebox.showerror("Error", "The start date is after the end date")
+            return
+        self.report_range = (start_date, end_date)
+
+        # Binary search over the date-sorted index, then redraw the first page
+        view.set_result(self.attendance_system.analytics.report_slice(start_date, end_date))
     
     def calculate_hours(self, check_in, check_out):
         """Calculate hours worked from check-in/check-out times"""
@@ -951,25 +4269,52 @@ class AttendanceUI:
         except:
             return None
     
-    def export_to_excel(self, tree):
-        """Export attendance data to Excel"""
+    def create_export_bar(self, parent, get_result, columns, basename):
+        """Format picker, export button, progress and cancel for a background export"""
+        bar = ttk.Frame(parent)
+        fmt = tk.StringVar(value="xlsx")
+        ttk.Combobox(bar, textvariable=fmt, values=ReportExporter.FORMATS,
+                     state="readonly", width=8).pack(side='left', padx=5)
+        progress_label = ttk.Label(bar, text="")
+        cancel_btn = ttk.Button(bar, text="Cancel", state='disabled')
+        
+        def export():
+            result = get_result()
+            if result is None or not len(result):
+                messagebox.showwarning("Warning", "No attendance records found")
+                return
+            filename = f"{basename}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt.get()}"
+            exporter = ReportExporter(result, columns, filename, fmt.get()).start()
+            export_btn.config(state='disabled')
+            cancel_btn.config(state='normal', command=exporter.cancel)
+            self.poll_export(exporter, progress_label, export_btn, cancel_btn)
+        
+        export_btn = ttk.Button(bar, text="Export", command=export)
+        export_btn.pack(side='left', padx=5)
+        cancel_btn.pack(side='left', padx=5)
+        progress_label.pack(side='left', padx=5)
+        return bar
+    
+    def poll_export(self, exporter, progress_label, export_btn, cancel_btn):
+        """Track a running export from the Tk thread"""
         try:
-            # Get all items from treeview
-            items = tree.get_children()
-            data = []
-            columns = tree["columns"]
-            
-            for item in items:
-                values = tree.item(item, "values")
-                data.append(dict(zip(columns, values)))
+            if not exporter.finished:
+                progress_label.config(text=f"Exporting... {exporter.progress:.0%}")
+                progress_label.after(200, lambda: self.poll_export(
+                    exporter, progress_label, export_btn, cancel_btn))
+                return
             
-            # Create DataFrame and save to Excel
-            df = pd.DataFrame(data)
-            filename = f"attendance_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            df.to_excel(filename, index=False)
-            messagebox.showinfo("Success", f"Report exported to {filename}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to export: {str(e)}")
+            export_btn.config(state='normal')
+            cancel_btn.config(state='disabled')
+            progress_label.config(text="")
+        except tk.TclError:
+            # Window was closed while exporting; let the export finish silently
+            return
+        
+        if exporter.state == "done":
+            messagebox.showinfo("Success", f"Report exported to {exporter.filename}")
+        elif exporter.state == "failed":
+            messagebox.showerror("Error", f"Failed to export: {str(exporter.error)}")
     
     def remove_user(self, user_list):
         """Remove selected user from system"""
@@ -981,14 +4326,8 @@ class AttendanceUI:
         name = user_list.item(selected[0], 'values')[0]
         
         if messagebox.askyesno("Confirm", f"Remove user {name}? This cannot be undone."):
-            # Remove from known faces
-            indices = [i for i, x in enumerate(self.attendance_system.known_face_names) if x == name]
-            for index in sorted(indices, reverse=True):
-                del self.attendance_system.known_face_names[index]
-                del self.attendance_system.known_face_encodings[index]
-            
-            # Save changes
-            self.attendance_system.save_known_faces()
+            # Swaps in a gallery without the user and saves it
+            self.attendance_system.remove_user(name)
             
             # Update UI
             user_list.delete(selected[0])
@@ -996,9 +4335,43 @@ class AttendanceUI:
             
             messagebox.showinfo("Success", f"User {name} removed successfully")
     
+    def load_settings(self):
+        """Apply settings.json if an admin saved settings before"""
+        if not os.path.exists(self.SETTINGS_FILE):
+            return
+        try:
+            with open(self.SETTINGS_FILE, "r") as f:
+                settings = json.load(f)
+            self.attendance_system.min_confidence = float(settings.get("min_confidence", self.attendance_system.min_confidence))
+            if settings.get("detector_mode") in DetectionCascade.MODES:
+                self.face_processor.detector.mode = settings["detector_mode"]
+            if settings.get("encoding_resolution") in FrameGeometry.RESOLUTIONS:
+                self.face_processor.encoding_resolution = settings["encoding_resolution"]
+            self.preview_fps = int(settings.get("preview_fps", self.preview_fps))
+        except Exception as e:
+            print(f"Error loading settings: {e}")
+    
     def save_settings(self):
-        """Save system settings"""
+        """Apply the system settings and keep them for the next start"""
         self.attendance_system.min_confidence = float(self.confidence_slider.get())
+        self.face_processor.detector.mode = self.detector_mode.get()
+        self.face_processor.encoding_resolution = self.encoding_resolution.get()
+        self.preview_fps = int(self.display_fps.get())
+        if hasattr(self, 'display'):
+            self.display.target_fps = self.preview_fps
+        settings = {
+            "min_confidence": self.attendance_system.min_confidence,
+            "detector_mode": self.face_processor.detector.mode,
+            "encoding_resolution": self.face_processor.encoding_resolution,
+            "preview_fps": self.preview_fps
+        }
+        try:
+            with open(self.SETTINGS_FILE + ".tmp", "w") as f:
+                json.dump(settings, f, indent=2)
+            os.replace(self.SETTINGS_FILE + ".tmp", self.SETTINGS_FILE)
+        except Exception as e:
+            messagebox.showerror("Error", f"Settings applied but could not be saved: {e}")
+            return
         messagebox.showinfo("Success", "Settings saved successfully")
     
     def show_user_panel(self):
@@ -1042,19 +4415,16 @@ class AttendanceUI:
         metrics_frame = tk.Frame(user_win, bg='#f0f2f5')
         metrics_frame.pack(fill='x', padx=20, pady=10)
         
+        summary = self.attendance_system.analytics.user_summary(self.current_user)
+        
         # Card 1: Present Days
-        present_days = len([r for r in self.attendance_system.attendance_log 
-                          if r["Name"] == self.current_user and r["Check-in"]])
-        self._create_metric_card(metrics_frame, "Present Days", present_days, "#4CAF50", 0, 0)
+        self._create_metric_card(metrics_frame, "Present Days", summary["present_days"], "#4CAF50", 0, 0)
         
         # Card 2: Avg Hours
-        avg_hours = self._calculate_avg_hours(self.current_user)
-        self._create_metric_card(metrics_frame, "Avg Hours/Day", f"{avg_hours:.1f}h", "#2196F3", 0, 1)
+        self._create_metric_card(metrics_frame, "Avg Hours/Day", f"{summary['avg_hours']:.1f}h", "#2196F3", 0, 1)
         
         # Card 3: Late Arrivals
-        late_days = len([r for r in self.attendance_system.attendance_log 
-                        if r["Name"] == self.current_user and self._is_late(r["Check-in"])])
-        self._create_metric_card(metrics_frame, "Late Arrivals", late_days, "#FF9800", 0, 2)
+        self._create_metric_card(metrics_frame, "Late Arrivals", summary["late_days"], "#FF9800", 0, 2)
 
         # Attendance history
         history_frame = tk.Frame(user_win)
@@ -1067,19 +4437,15 @@ class AttendanceUI:
             tree.heading(col, text=col)
             tree.column(col, width=120, anchor='center')
         
-        # Insert user's attendance records
-        for record in sorted(
-            [r for r in self.attendance_system.attendance_log 
-             if r["Name"] == self.current_user],
-            key=lambda x: x["Date"], 
-            reverse=True
-        ):
-            hours = self.calculate_hours(record["Check-in"], record["Check-out"])
-            status = self._get_status_icon(record["Check-in"], record["Check-out"])
+        # Insert user's attendance records (across all partitions, newest first)
+        user_history = self.attendance_system.analytics.user_slice(self.current_user)
+        for _, date, check_in, check_out in user_history.rows(0, len(user_history)):
+            hours = self.calculate_hours(check_in, check_out)
+            status = self._get_status_icon(check_in, check_out)
             tree.insert("", "end", values=(
-                record["Date"],
-                record["Check-in"] or "-",
-                record["Check-out"] or "-",
+                date,
+                check_in or "-",
+                check_out or "-",
                 f"{hours:.1f}" if hours else "-",
                 status
             ))
@@ -1093,9 +4459,13 @@ class AttendanceUI:
         actions_frame = tk.Frame(user_win, bg='#f0f2f5')
         actions_frame.pack(fill='x', pady=10)
         
-        ttk.Button(actions_frame, 
-                  text="Export My Attendance", 
-                  command=lambda: self.export_user_data(self.current_user)).pack(side='left', padx=10)
+        user_name = self.current_user
+        ttk.Label(actions_frame, text="Export My Attendance:",
+                 background='#f0f2f5').pack(side='left', padx=(10, 0))
+        self.create_export_bar(actions_frame,
+                               lambda: self.attendance_system.analytics.user_slice(user_name),
+                               AttendanceAnalytics.COLUMNS,
+                               f"{user_name}_attendance").pack(side='left')
         
         ttk.Button(actions_frame, 
                   text="Request Correction", 
@@ -1112,17 +4482,7 @@ class AttendanceUI:
     
     def _calculate_avg_hours(self, user_name):
         """Calculate average working hours for a user"""
-        total_hours = 0
-        count = 0
-        
-        for record in self.attendance_system.attendance_log:
-            if record["Name"] == user_name and record["Check-in"] and record["Check-out"]:
-                hours = self.calculate_hours(record["Check-in"], record["Check-out"])
-                if hours:
-                    total_hours += hours
-                    count += 1
-        
-        return total_hours / count if count > 0 else 0
+        return self.attendance_system.analytics.average_hours(user_name)
     
     def _is_late(self, check_in_time):
         """Check if check-in was late (after 9:30 AM)"""
@@ -1150,25 +4510,6 @@ class AttendanceUI:
             else:
                 return "✅ Complete"
     
-    def export_user_data(self, user_name):
-        """Export user's attendance data to Excel"""
-        try:
-            # Filter user's records
-            user_records = [r for r in self.attendance_system.attendance_log 
-                          if r["Name"] == user_name]
-            
-            if not user_records:
-                messagebox.showwarning("Warning", "No attendance records found")
-                return
-            
-            # Create DataFrame
-            df = pd.DataFrame(user_records)
-            filename = f"{user_name}_attendance_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            df.to_excel(filename, index=False)
-            messagebox.showinfo("Success", f"Data exported to {filename}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to export: {str(e)}")
-    
     def request_correction(self):
         """Handle attendance correction requests"""
         messagebox.showinfo("Request Sent", "Your correction request has been submitted to HR")